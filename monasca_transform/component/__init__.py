@@ -12,8 +12,6 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
-from collections import namedtuple
-
 
 class Component(object):
 
@@ -23,20 +21,3 @@ class Component(object):
     INSERT_COMPONENT_TYPE = "insert"
 
     DEFAULT_UNAVAILABLE_VALUE = "NA"
-
-
-InstanceUsageDataAggParamsBase = namedtuple('InstanceUsageDataAggParams',
-                                            ['instance_usage_data',
-                                             'agg_params'])
-
-
-class InstanceUsageDataAggParams(InstanceUsageDataAggParamsBase):
-    """A tuple which is a wrapper containing the instance usage data
-    and aggregation params
-
-    namdetuple contains:
-
-    instance_usage_data - instance usage
-    agg_params - aggregation params dict
-
-    """
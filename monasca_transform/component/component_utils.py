@@ -12,28 +12,63 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import datetime
 import logging
 
+from monasca_transform.component import Component
+
 LOG = logging.getLogger(__name__)
 
 
 class ComponentUtils(object):
 
+    # record store column with the start of the aggregation period in
+    # epoch seconds, and the usage period fields it is formatted into
+    _PERIOD_BUCKETS = [
+        ("daily", "event_day_bucket",
+         [("usage_date", "%Y-%m-%d")]),
+        ("hourly", "event_hour_bucket",
+         [("usage_date", "%Y-%m-%d"), ("usage_hour", "%H")]),
+        ("minutely", "event_minute_bucket",
+         [("usage_date", "%Y-%m-%d"), ("usage_hour", "%H"),
+          ("usage_minute", "%M")]),
+        ("secondly", "event_second_bucket",
+         [("usage_date", "%Y-%m-%d"), ("usage_hour", "%H"),
+          ("usage_minute", "%M")])]
+
     @staticmethod
     def _get_group_by_period_list(aggregation_period):
         """get a list of columns for an aggregation period."""
         group_by_period_list = []
-        if (aggregation_period == "daily"):
-            group_by_period_list = ["event_date"]
-        elif (aggregation_period == "hourly"):
-            group_by_period_list = ["event_date", "event_hour"]
-        elif (aggregation_period == "minutely"):
-            group_by_period_list = ["event_date", "event_hour", "event_minute"]
-        elif (aggregation_period == "secondly"):
-            group_by_period_list = ["event_date", "event_hour",
-                                    "event_minute", "event_second"]
+        for (period, bucket_column, usage_period_formats) in \
+                ComponentUtils._PERIOD_BUCKETS:
+            if aggregation_period == period:
+                group_by_period_list = [bucket_column]
         return group_by_period_list
 
+    @staticmethod
+    def _get_usage_period_dict(group_by_dict):
+        """get usage_date, usage_hour and usage_minute for the period
+        bucket in a group by dict. Period strings are only formatted here,
+        for the instance usage, fields finer than the aggregation period
+        are unavailable.
+        """
+        usage_period_dict = {
+            "usage_date": Component.DEFAULT_UNAVAILABLE_VALUE,
+            "usage_hour": Component.DEFAULT_UNAVAILABLE_VALUE,
+            "usage_minute": Component.DEFAULT_UNAVAILABLE_VALUE}
+        for (period, bucket_column, usage_period_formats) in \
+                ComponentUtils._PERIOD_BUCKETS:
+            bucket = group_by_dict.get(bucket_column)
+            if bucket is None:
+                continue
+            # buckets are the start of their period in local time
+            bucket_datetime = datetime.datetime.fromtimestamp(int(bucket))
+            for (usage_period_field, period_format) in usage_period_formats:
+                usage_period_dict[usage_period_field] = \
+                    bucket_datetime.strftime(period_format)
+        return usage_period_dict
+
     @staticmethod
     def _get_instance_group_by_period_list(aggregation_period):
         """get a list of columns for an aggregation period."""
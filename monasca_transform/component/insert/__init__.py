@@ -16,12 +16,16 @@ import abc
 import time
 
 from monasca_transform.component import Component
+from monasca_transform.config.config_initializer import ConfigInitializer
+from monasca_transform.transform.transform_utils import InstanceUsageUtils
 
 from oslo_config import cfg
 
 
 class InsertComponent(Component):
 
+    _executor_messaging_options = None
+
     @abc.abstractmethod
     def insert(transform_context, instance_usage_df):
         raise NotImplementedError(
@@ -142,6 +146,16 @@ class InsertComponent(Component):
         # add transform spec metric id to processing meta
         processing_meta = {"metric_id": metric_id}
 
+        # add the partial state of quantity, from state columns of a
+        # partial rollup or from the processing meta of usage data
+        row_processing_meta = getattr(row, "processing_meta", None) or {}
+        for field in InstanceUsageUtils.PARTIAL_STATE_FIELDS:
+            state_value = getattr(row, field,
+                                  row_processing_meta.get(field))
+            if state_value is not None:
+                processing_meta[field] = InstanceUsageUtils._to_string(
+                    state_value)
+
         instance_usage_dict = {"tenant_id": row.tenant_id,
                                "user_id": row.user_id,
                                "resource_uuid": row.resource_uuid,
@@ -173,11 +187,63 @@ class InsertComponent(Component):
         return instance_usage_dict
 
     @staticmethod
-    def _write_metrics_from_partition(partlistiter):
-        """iterate through all rdd elements in partition
-           and write metrics to kafka
-           """
-        for part in partlistiter:
-            agg_params = part.agg_params
-            row = part.instance_usage_data
-            InsertComponent._write_metric(row, agg_params)
+    def _get_executor_messaging_options():
+        """get the values of the messaging options, which are shipped to
+        the executors with the insert closure
+        """
+        return dict(cfg.CONF.messaging.items())
+
+    @staticmethod
+    def _load_executor_config(messaging_options):
+        """set the messaging options of an executor to the values of the
+        driver. Configuration files are not read on executors, the files
+        of the driver may not exist on executor hosts. Options are set
+        once for each python worker and reused by later partitions.
+        """
+        if InsertComponent._executor_messaging_options != messaging_options:
+            ConfigInitializer.load_messaging_options()
+            for name, value in messaging_options.items():
+                cfg.CONF.set_override(name, value, group='messaging')
+            InsertComponent._executor_messaging_options = messaging_options
+
+    @staticmethod
+    def _write_metrics_from_partition(partlistiter, messaging_options,
+                                      message_adapter, prepare_message,
+                                      batch_size):
+        """iterate through all rows in partition, convert them to
+        messages and send them in batches with the message adapter of
+        the executor. The adapter creates its producer once per python
+        worker and keeps it for later partitions.
+        """
+        InsertComponent._load_executor_config(messaging_options)
+
+        messages = []
+        for row in partlistiter:
+            messages.append(prepare_message(row))
+            if len(messages) >= batch_size:
+                message_adapter.send_metrics(messages)
+                messages = []
+
+        if messages:
+            message_adapter.send_metrics(messages)
+
+        # send anything still buffered by the adapter
+        message_adapter.flush()
+
+    @staticmethod
+    def _write_metrics_from_partitions(instance_usage_df, message_adapter,
+                                       prepare_message):
+        """send instance usage data from the executors with
+        foreachPartition. prepare_message converts an instance usage row
+        into the message to send and must only refer to plain python
+        values, so that it can be pickled.
+        """
+        # executors use the messaging options of the driver
+        messaging_options = \
+            InsertComponent._get_executor_messaging_options()
+        batch_size = cfg.CONF.messaging.insert_batch_size
+
+        instance_usage_df.rdd.foreachPartition(
+            lambda x: InsertComponent._write_metrics_from_partition(
+                x, messaging_options, message_adapter, prepare_message,
+                batch_size))
@@ -13,6 +13,8 @@
 # under the License.
 
 from monasca_transform.component.insert import InsertComponent
+from monasca_transform.data_driven_specs.transform_spec \
+    import TransformSpecCompiler
 from oslo_config import cfg
 from tests.unit.messaging.adapter import DummyAdapter
 
@@ -26,11 +28,10 @@ class DummyInsert(InsertComponent):
     def insert(transform_context, instance_usage_df):
         """write instance usage data to kafka"""
 
-        transform_spec_df = transform_context.transform_spec_df_info
+        transform_spec = TransformSpecCompiler.get_transform_spec(
+            transform_context)
 
-        agg_params = transform_spec_df.select("aggregation_params_map"
-                                              ".dimension_list"
-                                              ).collect()[0].asDict()
+        agg_params = {"dimension_list": transform_spec.dimension_list}
 
         cfg.CONF.set_override('adapter',
                               'tests.unit.messaging.adapter:DummyAdapter',
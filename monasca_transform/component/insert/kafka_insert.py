@@ -14,8 +14,12 @@
 
 from monasca_transform.component.insert import InsertComponent
 from monasca_transform.config.config_initializer import ConfigInitializer
+from monasca_transform.data_driven_specs.transform_spec \
+    import TransformSpecCompiler
 from monasca_transform.messaging.adapter import KafkaMessageAdapter
 
+from oslo_config import cfg
+
 
 class KafkaInsert(InsertComponent):
     """Insert component that writes instance usage data
@@ -29,38 +33,25 @@ class KafkaInsert(InsertComponent):
         # object to init config
         ConfigInitializer.basic_config()
 
-        transform_spec_df = transform_context.transform_spec_df_info
-
-        agg_params = transform_spec_df.select(
-            "aggregation_params_map.dimension_list").collect()[0].asDict()
-
-        # Approach # 1
-        # using foreachPartition to iterate through elements in an
-        # RDD is the recommended approach so as to not overwhelm kafka with the
-        # zillion connections (but in our case the MessageAdapter does
-        # store the adapter_impl so we should not create many producers)
-
-        # using foreachpartitions was causing some serialization/cpickle
-        # problems where few libs like kafka.SimpleProducer and oslo_config.cfg
-        # were not available in foreachPartition method
-        #
-        # removing _write_metrics_from_partition for now in favor of
-        # Approach # 2
-        #
-
-        # instance_usage_df_agg_params = instance_usage_df.rdd.map(
-        #    lambda x: InstanceUsageDataAggParams(x,
-        #                                        agg_params))
-        # instance_usage_df_agg_params.foreachPartition(
-        #     DummyInsert._write_metrics_from_partition)
-
-        # Approach # 2
-        # using collect() to fetch all elements of an RDD and write to
-        # kafka
-        #
-
-        for instance_usage_row in instance_usage_df.collect():
-            metric = InsertComponent._get_metric(
-                instance_usage_row, agg_params)
-            KafkaMessageAdapter.send_metric(metric)
+        transform_spec = TransformSpecCompiler.get_transform_spec(
+            transform_context)
+
+        agg_params = {"dimension_list": transform_spec.dimension_list}
+
+        if cfg.CONF.messaging.insert_from_executors:
+            # send metrics from the executors, one partition at a time,
+            # using a producer pooled in each executor
+            InsertComponent._write_metrics_from_partitions(
+                instance_usage_df,
+                KafkaMessageAdapter,
+                lambda row: InsertComponent._get_metric(row, agg_params))
+        else:
+            # using collect() to fetch all elements of an RDD and write to
+            # kafka
+            for instance_usage_row in instance_usage_df.collect():
+                metric = InsertComponent._get_metric(
+                    instance_usage_row, agg_params)
+                KafkaMessageAdapter.send_metric(metric)
+            # send anything still buffered by the adapter
+            KafkaMessageAdapter.flush()
         return instance_usage_df
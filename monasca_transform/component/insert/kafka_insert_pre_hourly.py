@@ -14,14 +14,22 @@
 
 from monasca_transform.component.insert import InsertComponent
 from monasca_transform.config.config_initializer import ConfigInitializer
+from monasca_transform.data_driven_specs.transform_spec \
+    import TransformSpecCompiler
 from monasca_transform.messaging.adapter import KafkaMessageAdapterPreHourly
 
+from oslo_config import cfg
+
 
 class KafkaInsertPreHourly(InsertComponent):
     """Insert component that writes instance usage data
     to kafka queue
     """
 
+    # (metric_id, instance_usage_df) of the batch, which are kept for the
+    # hourly state processor instead of being written, when it is enabled
+    batch_instance_usage = []
+
     @staticmethod
     def insert(transform_context, instance_usage_df):
         """write instance usage data to kafka"""
@@ -29,18 +37,33 @@ class KafkaInsertPreHourly(InsertComponent):
         # object to init config
         ConfigInitializer.basic_config()
 
-        transform_spec_df = transform_context.transform_spec_df_info
+        transform_spec = TransformSpecCompiler.get_transform_spec(
+            transform_context)
+
+        metric_id = transform_spec.metric_id
 
-        agg_params = transform_spec_df.select(
-            "metric_id").\
-            collect()[0].asDict()
-        metric_id = agg_params["metric_id"]
+        if cfg.CONF.stage_processors.hourly_state_processor_enabled:
+            # merged into the hourly state by the driver after the batch
+            KafkaInsertPreHourly.batch_instance_usage.append(
+                (metric_id, instance_usage_df))
+            return instance_usage_df
 
-        for instance_usage_row in instance_usage_df.collect():
-            instance_usage_dict = \
-                InsertComponent._get_instance_usage_pre_hourly(
-                    instance_usage_row,
-                    metric_id)
-            KafkaMessageAdapterPreHourly.send_metric(instance_usage_dict)
+        if cfg.CONF.messaging.insert_from_executors:
+            # send instance usage from the executors, one partition at a
+            # time, using a producer pooled in each executor
+            InsertComponent._write_metrics_from_partitions(
+                instance_usage_df,
+                KafkaMessageAdapterPreHourly,
+                lambda row: InsertComponent._get_instance_usage_pre_hourly(
+                    row, metric_id))
+        else:
+            for instance_usage_row in instance_usage_df.collect():
+                instance_usage_dict = \
+                    InsertComponent._get_instance_usage_pre_hourly(
+                        instance_usage_row,
+                        metric_id)
+                KafkaMessageAdapterPreHourly.send_metric(instance_usage_dict)
+            # send anything still buffered by the adapter
+            KafkaMessageAdapterPreHourly.flush()
 
         return instance_usage_df
@@ -12,17 +12,19 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
-from pyspark.sql import SQLContext
+from pyspark.sql import functions
+from pyspark.sql.functions import coalesce
+from pyspark.sql.functions import from_unixtime
+from pyspark.sql.functions import lit
+from pyspark.sql.functions import when
+from pyspark.sql.types import DoubleType
 
-import datetime
-
-from monasca_transform.component import Component
 from monasca_transform.component.component_utils import ComponentUtils
 from monasca_transform.component.setter import SetterComponent
+from monasca_transform.data_driven_specs.transform_spec \
+    import TransformSpecCompiler
 from monasca_transform.transform.transform_utils import InstanceUsageUtils
 
-import json
-
 
 class RollupQuantityException(Exception):
     """Exception thrown when doing quantity rollup
@@ -50,12 +52,49 @@ class RollupQuantity(SetterComponent):
         else:
             return False
 
+    @staticmethod
+    def _get_partial_state_columns(instance_usage_df, merge_partial_state):
+        """get a dict of partial state field to the column with its value
+        for each row. With merge_partial_state the state which rows carry
+        in state columns or in processing_meta is used, rows without it and
+        all rows otherwise are a single quantity.
+        """
+        quantity = instance_usage_df.quantity
+        state_columns = {"quantity_sum": quantity,
+                         "quantity_count": when(quantity.isNotNull(),
+                                                lit(1.0)),
+                         "quantity_min": quantity,
+                         "quantity_max": quantity}
+        if not merge_partial_state:
+            return state_columns
+
+        for field in InstanceUsageUtils.PARTIAL_STATE_FIELDS:
+            if field in instance_usage_df.columns:
+                state_columns[field] = instance_usage_df[field]
+            elif "processing_meta" in instance_usage_df.columns:
+                state_columns[field] = coalesce(
+                    instance_usage_df.processing_meta.getItem(field).cast(
+                        DoubleType()),
+                    state_columns[field])
+        return state_columns
+
     @staticmethod
     def _rollup_quantity(instance_usage_df,
                          setter_rollup_group_by_list,
-                         setter_rollup_operation):
-
-        instance_usage_data_json_list = []
+                         setter_rollup_operation,
+                         merge_partial_state=False,
+                         with_partial_state=False):
+        """roll up instance usage data, the rollup and formatting of the
+        results are done with dataframe operations so that rolled up data
+        is never collected on the driver.
+
+        Quantity is computed from the sum, count, min and max of the rows.
+        With merge_partial_state rows are partial aggregates of the same
+        groups, and their partial state is combined exactly, e.g. an avg
+        is the sum of all sums divided by the sum of all counts instead
+        of an average of averages. With with_partial_state the combined
+        state is kept in the result, in PARTIAL_STATE_FIELDS columns.
+        """
 
         # check if operation is valid
         if not RollupQuantity.\
@@ -63,110 +102,88 @@ class RollupQuantity(SetterComponent):
             raise RollupQuantityException(
                 "Operation %s is not supported" % setter_rollup_operation)
 
-        # call required operation on grouped data
-        # e.g. sum, max, min, avg etc
-        agg_operations_map = {
-            "quantity": str(setter_rollup_operation),
-            "firstrecord_timestamp_unix": "min",
-            "lastrecord_timestamp_unix": "max",
-            "record_count": "sum"}
+        state_columns = RollupQuantity._get_partial_state_columns(
+            instance_usage_df, merge_partial_state)
+
+        # combine timestamps, record count and partial state of grouped
+        # data
+        agg_columns = [
+            functions.min(instance_usage_df.firstrecord_timestamp_unix).alias(
+                "firstrecord_timestamp_unix"),
+            functions.max(instance_usage_df.lastrecord_timestamp_unix).alias(
+                "lastrecord_timestamp_unix"),
+            functions.sum(instance_usage_df.record_count).alias(
+                "record_count"),
+            functions.sum(state_columns["quantity_sum"]).alias(
+                "quantity_sum"),
+            functions.sum(state_columns["quantity_count"]).alias(
+                "quantity_count"),
+            functions.min(state_columns["quantity_min"]).alias(
+                "quantity_min"),
+            functions.max(state_columns["quantity_max"]).alias(
+                "quantity_max")]
 
         # do a group by
         grouped_data = instance_usage_df.groupBy(
             *setter_rollup_group_by_list)
-        rollup_df = grouped_data.agg(agg_operations_map)
-
-        for row in rollup_df.collect():
-
-            # first record timestamp
-            earliest_record_timestamp_unix = getattr(
-                row, "min(firstrecord_timestamp_unix)",
-                Component.DEFAULT_UNAVAILABLE_VALUE)
-            earliest_record_timestamp_string = \
-                datetime.datetime.fromtimestamp(
-                    earliest_record_timestamp_unix).strftime(
-                    '%Y-%m-%d %H:%M:%S')
-
-            # last record_timestamp
-            latest_record_timestamp_unix = getattr(
-                row, "max(lastrecord_timestamp_unix)",
-                Component.DEFAULT_UNAVAILABLE_VALUE)
-            latest_record_timestamp_string = \
-                datetime.datetime.fromtimestamp(
-                    latest_record_timestamp_unix).strftime('%Y-%m-%d %H:%M:%S')
-
-            # record count
-            record_count = getattr(row, "sum(record_count)", 0.0)
-
-            # quantity
-            # get expression that will be used to select quantity
-            # from rolled up data
-            select_quant_str = "".join((setter_rollup_operation, "(quantity)"))
-            quantity = getattr(row, select_quant_str, 0.0)
-
-            # create a new instance usage dict
-            instance_usage_dict = {"tenant_id": getattr(row, "tenant_id",
-                                                        "all"),
-                                   "user_id":
-                                       getattr(row, "user_id", "all"),
-                                   "resource_uuid":
-                                       getattr(row, "resource_uuid", "all"),
-                                   "geolocation":
-                                       getattr(row, "geolocation", "all"),
-                                   "region":
-                                       getattr(row, "region", "all"),
-                                   "zone":
-                                       getattr(row, "zone", "all"),
-                                   "host":
-                                       getattr(row, "host", "all"),
-                                   "project_id":
-                                       getattr(row, "tenant_id", "all"),
-                                   "aggregated_metric_name":
-                                       getattr(row, "aggregated_metric_name",
-                                               "all"),
-                                   "quantity":
-                                       quantity,
-                                   "firstrecord_timestamp_unix":
-                                       earliest_record_timestamp_unix,
-                                   "firstrecord_timestamp_string":
-                                       earliest_record_timestamp_string,
-                                   "lastrecord_timestamp_unix":
-                                       latest_record_timestamp_unix,
-                                   "lastrecord_timestamp_string":
-                                       latest_record_timestamp_string,
-                                   "record_count": record_count,
-                                   "service_group":
-                                       getattr(row, "service_group", "all"),
-                                   "service_id":
-                                       getattr(row, "service_id", "all"),
-                                   "usage_date":
-                                       getattr(row, "usage_date", "all"),
-                                   "usage_hour":
-                                       getattr(row, "usage_hour", "all"),
-                                   "usage_minute":
-                                       getattr(row, "usage_minute", "all"),
-                                   "aggregation_period":
-                                       getattr(row, "aggregation_period",
-                                               "all")
-                                   }
-
-            instance_usage_data_json = json.dumps(instance_usage_dict)
-            instance_usage_data_json_list.append(instance_usage_data_json)
-
-        # convert to rdd
-        spark_context = instance_usage_df.rdd.context
-        return spark_context.parallelize(instance_usage_data_json_list)
+        rollup_df = grouped_data.agg(*agg_columns)
+
+        # get quantity for the operation e.g. sum, max, min, avg etc
+        quantity_by_operation = {
+            "sum": rollup_df.quantity_sum,
+            "max": rollup_df.quantity_max,
+            "min": rollup_df.quantity_min,
+            "avg": rollup_df.quantity_sum / rollup_df.quantity_count}
+
+        rolled_up_columns = {
+            "quantity": quantity_by_operation[setter_rollup_operation],
+            "firstrecord_timestamp_unix":
+                rollup_df.firstrecord_timestamp_unix,
+            "firstrecord_timestamp_string":
+                from_unixtime(rollup_df.firstrecord_timestamp_unix),
+            "lastrecord_timestamp_unix":
+                rollup_df.lastrecord_timestamp_unix,
+            "lastrecord_timestamp_string":
+                from_unixtime(rollup_df.lastrecord_timestamp_unix),
+            "record_count": rollup_df.record_count}
+
+        # project_id is set from tenant_id
+        if "tenant_id" in setter_rollup_group_by_list:
+            rolled_up_columns["project_id"] = rollup_df["tenant_id"]
+        else:
+            rolled_up_columns["project_id"] = lit("all")
+
+        # select columns in instance usage schema order, columns that
+        # were not grouped by are set to "all"
+        schema = InstanceUsageUtils._get_instance_usage_schema()
+        select_columns = []
+        for field in schema.fields:
+            if field.name in rolled_up_columns:
+                column = rolled_up_columns[field.name]
+            elif field.name == "processing_meta":
+                column = lit(None)
+            elif field.name in setter_rollup_group_by_list:
+                column = rollup_df[field.name]
+            else:
+                column = lit("all")
+            select_columns.append(
+                column.cast(field.dataType).alias(field.name))
+
+        if with_partial_state:
+            select_columns.extend(
+                [rollup_df[field] for field in
+                 InstanceUsageUtils.PARTIAL_STATE_FIELDS])
+
+        return rollup_df.select(*select_columns)
 
     @staticmethod
     def setter(transform_context, instance_usage_df):
 
-        transform_spec_df = transform_context.transform_spec_df_info
+        transform_spec = TransformSpecCompiler.get_transform_spec(
+            transform_context)
 
         # get rollup operation (sum, max, avg, min)
-        agg_params = transform_spec_df.select(
-            "aggregation_params_map.setter_rollup_operation").\
-            collect()[0].asDict()
-        setter_rollup_operation = agg_params["setter_rollup_operation"]
+        setter_rollup_operation = transform_spec.setter_rollup_operation
 
         instance_usage_trans_df = RollupQuantity.setter_by_operation(
             transform_context,
@@ -179,18 +196,15 @@ class RollupQuantity(SetterComponent):
     def setter_by_operation(transform_context, instance_usage_df,
                             setter_rollup_operation):
 
-        transform_spec_df = transform_context.transform_spec_df_info
+        transform_spec = TransformSpecCompiler.get_transform_spec(
+            transform_context)
 
         # get fields we want to group by for a rollup
-        agg_params = transform_spec_df.select(
-            "aggregation_params_map.setter_rollup_group_by_list"). \
-            collect()[0].asDict()
-        setter_rollup_group_by_list = agg_params["setter_rollup_group_by_list"]
+        setter_rollup_group_by_list = \
+            transform_spec.setter_rollup_group_by_list
 
         # get aggregation period
-        agg_params = transform_spec_df.select(
-            "aggregation_params_map.aggregation_period").collect()[0].asDict()
-        aggregation_period = agg_params["aggregation_period"]
+        aggregation_period = transform_spec.aggregation_period
         group_by_period_list = \
             ComponentUtils._get_instance_group_by_period_list(
                 aggregation_period)
@@ -200,23 +214,22 @@ class RollupQuantity(SetterComponent):
             group_by_period_list + setter_rollup_group_by_list
 
         # perform rollup operation
-        instance_usage_json_rdd = RollupQuantity._rollup_quantity(
+        instance_usage_trans_df = RollupQuantity._rollup_quantity(
             instance_usage_df,
             group_by_columns_list,
             str(setter_rollup_operation))
 
-        sql_context = SQLContext.getOrCreate(instance_usage_df.rdd.context)
-        instance_usage_trans_df = InstanceUsageUtils.create_df_from_json_rdd(
-            sql_context,
-            instance_usage_json_rdd)
-
         return instance_usage_trans_df
 
     @staticmethod
     def do_rollup(setter_rollup_group_by_list,
                   aggregation_period,
                   setter_rollup_operation,
-                  instance_usage_df):
+                  instance_usage_df,
+                  with_partial_state=False):
+        """roll up partial aggregates of the same groups, combining
+        their partial state exactly
+        """
 
         # get aggregation period
         group_by_period_list = \
@@ -228,14 +241,11 @@ class RollupQuantity(SetterComponent):
             setter_rollup_group_by_list
 
         # perform rollup operation
-        instance_usage_json_rdd = RollupQuantity._rollup_quantity(
+        instance_usage_trans_df = RollupQuantity._rollup_quantity(
             instance_usage_df,
             group_by_columns_list,
-            str(setter_rollup_operation))
-
-        sql_context = SQLContext.getOrCreate(instance_usage_df.rdd.context)
-        instance_usage_trans_df = InstanceUsageUtils.create_df_from_json_rdd(
-            sql_context,
-            instance_usage_json_rdd)
+            str(setter_rollup_operation),
+            merge_partial_state=True,
+            with_partial_state=with_partial_state)
 
         return instance_usage_trans_df
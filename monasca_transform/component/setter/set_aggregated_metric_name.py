@@ -12,13 +12,12 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
-from pyspark.sql import SQLContext
+from pyspark.sql.functions import lit
+from pyspark.sql.types import StringType
 
-from monasca_transform.component import InstanceUsageDataAggParams
 from monasca_transform.component.setter import SetterComponent
-from monasca_transform.transform.transform_utils import InstanceUsageUtils
-
-import json
+from monasca_transform.data_driven_specs.transform_spec \
+    import TransformSpecCompiler
 
 
 class SetAggregatedMetricName(SetterComponent):
@@ -26,65 +25,17 @@ class SetAggregatedMetricName(SetterComponent):
     aggregated metric name is available as a parameter 'aggregated_metric_name'
     in aggregation_params in metric processing driver table.
     """
-    @staticmethod
-    def _set_aggregated_metric_name(instance_usage_agg_params):
-
-        row = instance_usage_agg_params.instance_usage_data
-
-        agg_params = instance_usage_agg_params.agg_params
-
-        instance_usage_dict = {"tenant_id": row.tenant_id,
-                               "user_id": row.user_id,
-                               "resource_uuid": row.resource_uuid,
-                               "geolocation": row.geolocation,
-                               "region": row.region,
-                               "zone": row.zone,
-                               "host": row.host,
-                               "project_id": row.project_id,
-                               "aggregated_metric_name":
-                                   agg_params["aggregated_metric_name"],
-                               "quantity": row.quantity,
-                               "firstrecord_timestamp_unix":
-                                   row.firstrecord_timestamp_unix,
-                               "firstrecord_timestamp_string":
-                                   row.firstrecord_timestamp_string,
-                               "lastrecord_timestamp_unix":
-                                   row.lastrecord_timestamp_unix,
-                               "lastrecord_timestamp_string":
-                                   row.lastrecord_timestamp_string,
-                               "record_count": row.record_count,
-                               "service_group": row.service_group,
-                               "service_id": row.service_id,
-                               "usage_date": row.usage_date,
-                               "usage_hour": row.usage_hour,
-                               "usage_minute": row.usage_minute,
-                               "aggregation_period": row.aggregation_period}
-
-        instance_usage_data_json = json.dumps(instance_usage_dict)
-
-        return instance_usage_data_json
-
     @staticmethod
     def setter(transform_context, instance_usage_df):
         """set the aggregated metric name field for elements in instance usage
-        rdd
+        dataframe
         """
 
-        transform_spec_df = transform_context.transform_spec_df_info
-
-        agg_params = transform_spec_df.select(
-            "aggregation_params_map.aggregated_metric_name").collect()[0].\
-            asDict()
-
-        instance_usage_df_agg_params = instance_usage_df.rdd.map(
-            lambda x: InstanceUsageDataAggParams(x, agg_params))
-
-        instance_usage_json_rdd = instance_usage_df_agg_params.map(
-            SetAggregatedMetricName._set_aggregated_metric_name)
-
-        sql_context = SQLContext.getOrCreate(instance_usage_df.rdd.context)
+        transform_spec = TransformSpecCompiler.get_transform_spec(
+            transform_context)
 
-        instance_usage_trans_df = InstanceUsageUtils.create_df_from_json_rdd(
-            sql_context,
-            instance_usage_json_rdd)
+        # set the column in place, rows keep the instance usage schema
+        instance_usage_trans_df = instance_usage_df.withColumn(
+            "aggregated_metric_name",
+            lit(transform_spec.aggregated_metric_name).cast(StringType()))
         return instance_usage_trans_df
@@ -18,10 +18,10 @@ from monasca_transform.component import Component
 from monasca_transform.component.setter.rollup_quantity import RollupQuantity
 from monasca_transform.component.usage.fetch_quantity import FetchQuantity
 from monasca_transform.component.usage import UsageComponent
+from monasca_transform.data_driven_specs.transform_spec \
+    import TransformSpecCompiler
 from monasca_transform.transform.transform_utils import InstanceUsageUtils
 
-import json
-
 
 class CalculateRateException(Exception):
     """Exception thrown when calculating rate
@@ -46,20 +46,16 @@ class CalculateRate(UsageComponent):
         oldest and latest values, and returns the resultant value as an
         instance usage dataframe
         """
-        instance_usage_data_json_list = []
+        instance_usage_dict_list = []
 
-        transform_spec_df = transform_context.transform_spec_df_info
+        transform_spec = TransformSpecCompiler.get_transform_spec(
+            transform_context)
 
         # get aggregated metric name
-        agg_params = transform_spec_df.select(
-            "aggregation_params_map.aggregated_metric_name"). \
-            collect()[0].asDict()
-        aggregated_metric_name = agg_params["aggregated_metric_name"]
+        aggregated_metric_name = transform_spec.aggregated_metric_name
 
         # get aggregation period
-        agg_params = transform_spec_df.select(
-            "aggregation_params_map.aggregation_period").collect()[0].asDict()
-        aggregation_period = agg_params["aggregation_period"]
+        aggregation_period = transform_spec.aggregation_period
 
         # Fetch the oldest quantities
         latest_instance_usage_df = \
@@ -132,16 +128,15 @@ class CalculateRate(UsageComponent):
                                                     DEFAULT_UNAVAILABLE_VALUE)}
                                }
 
-        instance_usage_data_json = json.dumps(instance_usage_dict)
-        instance_usage_data_json_list.append(instance_usage_data_json)
+        instance_usage_dict_list.append(instance_usage_dict)
         spark_context = record_store_df.rdd.context
 
         instance_usage_rdd = \
-            spark_context.parallelize(instance_usage_data_json_list)
+            spark_context.parallelize(instance_usage_dict_list)
 
         sql_context = SQLContext\
             .getOrCreate(record_store_df.rdd.context)
-        instance_usage_df = InstanceUsageUtils.create_df_from_json_rdd(
+        instance_usage_df = InstanceUsageUtils.create_df_from_dict_rdd(
             sql_context,
             instance_usage_rdd)
 
@@ -12,7 +12,6 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
-from collections import namedtuple
 import datetime
 
 from pyspark.sql import SQLContext
@@ -20,14 +19,12 @@ from pyspark.sql import SQLContext
 from monasca_transform.component import Component
 from monasca_transform.component.component_utils import ComponentUtils
 from monasca_transform.component.usage import UsageComponent
-from monasca_transform.transform.grouping.group_sort_by_timestamp \
-    import GroupSortbyTimestamp
-from monasca_transform.transform.grouping.group_sort_by_timestamp_partition \
-    import GroupSortbyTimestampPartition
+from monasca_transform.data_driven_specs.transform_spec \
+    import TransformSpecCompiler
+from monasca_transform.transform.grouping.grouping_engine \
+    import GroupingEngine
 from monasca_transform.transform.transform_utils import InstanceUsageUtils
 
-import json
-
 
 class FetchQuantityException(Exception):
     """Exception thrown when fetching quantity
@@ -42,23 +39,27 @@ class FetchQuantityException(Exception):
         return repr(self.value)
 
 
-GroupedDataWithOperation = namedtuple("GroupedDataWithOperation",
-                                      ["grouped_data",
-                                       "usage_fetch_operation"])
-
-
-class GroupedDataWithOperation(GroupedDataWithOperation):
-    """A tuple which is a wrapper containing record store data
-    and the usage operation
-
-    namdetuple contains:
-
-    grouped_data - grouped record store data
-    usage_fetch_operation - operation
-    """
+class FetchQuantity(UsageComponent):
 
+    # partial state field and the aggregate of record store data it is
+    # read from
+    _PARTIAL_STATE_AGGREGATES = [
+        ("quantity_sum", "sum(event_quantity_for_sum)"),
+        ("quantity_count", "count(event_quantity_for_count)"),
+        ("quantity_min", "min(event_quantity_for_min)"),
+        ("quantity_max", "max(event_quantity_for_max)")]
 
-class FetchQuantity(UsageComponent):
+    @staticmethod
+    def _is_partial_state_valid(usage_fetch_operation,
+                                pre_hourly_operation):
+        """return true if the partial state of raw event quantities
+        describes the fetched quantity for the pre hourly rollup. That is
+        only the case when both use the same operation, e.g. a pre hourly
+        avg of fetched sums is an average of the sums and not of the raw
+        event quantities.
+        """
+        return usage_fetch_operation in ["sum", "max", "min", "avg"] and \
+            usage_fetch_operation == pre_hourly_operation
 
     @staticmethod
     def _supported_fetch_operations():
@@ -73,19 +74,12 @@ class FetchQuantity(UsageComponent):
             return False
 
     @staticmethod
-    def _get_latest_oldest_quantity(grouping_results_with_operation):
+    def _get_latest_oldest_quantity(grouping_results,
+                                    usage_fetch_operation):
         """get quantity for each group by performing the requested
         usage operation and return a instance usage data.
         """
 
-        # row
-        grouping_results = grouping_results_with_operation.\
-            grouped_data
-
-        # usage fetch operation
-        usage_fetch_operation = grouping_results_with_operation.\
-            usage_fetch_operation
-
         group_by_dict = grouping_results.grouping_key_dict
 
         #
@@ -103,12 +97,11 @@ class FetchQuantity(UsageComponent):
         zone = group_by_dict.get("zone", Component.DEFAULT_UNAVAILABLE_VALUE)
         host = group_by_dict.get("host", Component.DEFAULT_UNAVAILABLE_VALUE)
 
-        usage_date = group_by_dict.get("event_date",
-                                       Component.DEFAULT_UNAVAILABLE_VALUE)
-        usage_hour = group_by_dict.get("event_hour",
-                                       Component.DEFAULT_UNAVAILABLE_VALUE)
-        usage_minute = group_by_dict.get("event_minute",
-                                         Component.DEFAULT_UNAVAILABLE_VALUE)
+        usage_period_dict = ComponentUtils._get_usage_period_dict(
+            group_by_dict)
+        usage_date = usage_period_dict["usage_date"]
+        usage_hour = usage_period_dict["usage_hour"]
+        usage_minute = usage_period_dict["usage_minute"]
 
         aggregated_metric_name = group_by_dict.get(
             "aggregated_metric_name", Component.DEFAULT_UNAVAILABLE_VALUE)
@@ -141,6 +134,10 @@ class FetchQuantity(UsageComponent):
         event_type = group_by_dict.get("event_type",
                                        Component.DEFAULT_UNAVAILABLE_VALUE)
 
+        # metric id
+        metric_id = group_by_dict.get("metric_id",
+                                      Component.DEFAULT_UNAVAILABLE_VALUE)
+
         instance_usage_dict = {"tenant_id": tenant_id, "user_id": user_id,
                                "resource_uuid": resource_uuid,
                                "geolocation": geolocation, "region": region,
@@ -163,21 +160,13 @@ class FetchQuantity(UsageComponent):
                                "usage_hour": usage_hour,
                                "usage_minute": usage_minute,
                                "aggregation_period": aggregation_period,
-                               "processing_meta": {"event_type": event_type}
+                               "processing_meta": {"event_type": event_type,
+                                                   "metric_id": metric_id}
                                }
-        instance_usage_data_json = json.dumps(instance_usage_dict)
-
-        return instance_usage_data_json
+        return instance_usage_dict
 
     @staticmethod
-    def _get_quantity(grouped_record_with_operation):
-
-        # row
-        row = grouped_record_with_operation.grouped_data
-
-        # usage fetch operation
-        usage_fetch_operation = grouped_record_with_operation.\
-            usage_fetch_operation
+    def _get_quantity(row, usage_fetch_operation, with_partial_state):
 
         # first record timestamp # FIXME: beginning of epoch?
         earliest_record_timestamp_unix = getattr(
@@ -205,6 +194,25 @@ class FetchQuantity(UsageComponent):
         select_quant_str = "".join((usage_fetch_operation, "(event_quantity)"))
         quantity = getattr(row, select_quant_str, 0.0)
 
+        processing_meta = {
+            "event_type": getattr(row, "event_type",
+                                  Component.DEFAULT_UNAVAILABLE_VALUE),
+            "metric_id": getattr(row, "metric_id",
+                                 Component.DEFAULT_UNAVAILABLE_VALUE)}
+
+        # partial aggregate state of quantity, which lets the pre hourly
+        # processor combine the results of several batches exactly
+        if with_partial_state:
+            for (state_field, select_state_str) in \
+                    FetchQuantity._PARTIAL_STATE_AGGREGATES:
+                state_value = getattr(row, select_state_str, None)
+                if state_value is not None:
+                    processing_meta[state_field] = state_value
+
+        # usage period strings from the period bucket
+        usage_period_dict = ComponentUtils._get_usage_period_dict(
+            row.asDict())
+
         #  create a new instance usage dict
         instance_usage_dict = {"tenant_id": getattr(row, "tenant_id",
                                                     Component.
@@ -261,28 +269,19 @@ class FetchQuantity(UsageComponent):
                                            Component.
                                            DEFAULT_UNAVAILABLE_VALUE),
                                "usage_date":
-                                   getattr(row, "event_date",
-                                           Component.
-                                           DEFAULT_UNAVAILABLE_VALUE),
+                                   usage_period_dict["usage_date"],
                                "usage_hour":
-                                   getattr(row, "event_hour",
-                                           Component.
-                                           DEFAULT_UNAVAILABLE_VALUE),
+                                   usage_period_dict["usage_hour"],
                                "usage_minute":
-                                   getattr(row, "event_minute",
-                                           Component.
-                                           DEFAULT_UNAVAILABLE_VALUE),
+                                   usage_period_dict["usage_minute"],
                                "aggregation_period":
                                    getattr(row, "aggregation_period",
                                            Component.
                                            DEFAULT_UNAVAILABLE_VALUE),
-                               "processing_meta": {"event_type": getattr(
-                                   row, "event_type",
-                                   Component.DEFAULT_UNAVAILABLE_VALUE)}
+                               "processing_meta": processing_meta
                                }
 
-        instance_usage_data_json = json.dumps(instance_usage_dict)
-        return instance_usage_data_json
+        return instance_usage_dict
 
     @staticmethod
     def usage(transform_context, record_store_df):
@@ -291,13 +290,11 @@ class FetchQuantity(UsageComponent):
         timestamp field, applies group stats udf and returns the latest
         quantity as a instance usage dataframe
         """
-        transform_spec_df = transform_context.transform_spec_df_info
+        transform_spec = TransformSpecCompiler.get_transform_spec(
+            transform_context)
 
         # get rollup operation (sum, max, avg, min)
-        agg_params = transform_spec_df.select(
-            "aggregation_params_map.usage_fetch_operation").\
-            collect()[0].asDict()
-        usage_fetch_operation = agg_params["usage_fetch_operation"]
+        usage_fetch_operation = transform_spec.usage_fetch_operation
 
         instance_usage_df = FetchQuantity.usage_by_operation(
             transform_context, record_store_df, usage_fetch_operation)
@@ -312,7 +309,8 @@ class FetchQuantity(UsageComponent):
         timestamp field, applies group stats udf and returns the latest
         quantity as a instance usage dataframe
         """
-        transform_spec_df = transform_context.transform_spec_df_info
+        transform_spec = TransformSpecCompiler.get_transform_spec(
+            transform_context)
 
         # check if operation is valid
         if not FetchQuantity. \
@@ -321,93 +319,142 @@ class FetchQuantity(UsageComponent):
                 "Operation %s is not supported" % usage_fetch_operation)
 
         # get aggregation period
-        agg_params = transform_spec_df.select(
-            "aggregation_params_map.aggregation_period").collect()[0].asDict()
-        aggregation_period = agg_params["aggregation_period"]
+        aggregation_period = transform_spec.aggregation_period
         group_by_period_list = ComponentUtils._get_group_by_period_list(
             aggregation_period)
 
         # get what we want to group by
-        agg_params = transform_spec_df.select(
-            "aggregation_params_map.aggregation_group_by_list"). \
-            collect()[0].asDict()
-        aggregation_group_by_list = agg_params["aggregation_group_by_list"]
+        aggregation_group_by_list = transform_spec.aggregation_group_by_list
 
         # group by columns list
         group_by_columns_list = group_by_period_list + \
             aggregation_group_by_list
 
-        instance_usage_json_rdd = None
+        with_partial_state = FetchQuantity._is_partial_state_valid(
+            usage_fetch_operation, transform_spec.pre_hourly_operation)
+
+        instance_usage_df = FetchQuantity.usage_by_group_by_columns(
+            record_store_df, group_by_columns_list, usage_fetch_operation,
+            metric_id=transform_spec.metric_id,
+            with_partial_state=with_partial_state)
+
+        return instance_usage_df
+
+    @staticmethod
+    def usage_by_group_by_columns(record_store_df, group_by_columns_list,
+                                  usage_fetch_operation, metric_id=None,
+                                  with_partial_state=False):
+        """group record store records by the given group by columns list
+        and apply the usage fetch operation to each group, returning the
+        results as a instance usage dataframe.
+
+        When metric_id is one of the group by columns it is carried over
+        into processing_meta, which allows results for several transform
+        specs to be computed together and split apart afterwards.
+
+        metric_id identifies the specs in the grouping engine log and
+        metric.
+
+        With with_partial_state the sum, count, min and max of the event
+        quantities of each group are added to processing_meta, for sum,
+        max, min and avg operations.
+        """
+        # check if operation is valid
+        if not FetchQuantity. \
+                _is_valid_fetch_operation(usage_fetch_operation):
+            raise FetchQuantityException(
+                "Operation %s is not supported" % usage_fetch_operation)
+
+        instance_usage_df = None
         if (usage_fetch_operation == "latest" or
                 usage_fetch_operation == "oldest"):
 
-            grouped_rows_rdd = None
-
-            # FIXME:
-            # select group by method
-            IS_GROUP_BY_PARTITION = False
-
-            if (IS_GROUP_BY_PARTITION):
-                # GroupSortbyTimestampPartition is a more scalable
-                # since it creates groups using repartitioning and sorting
-                # but is disabled
-
-                # number of groups should be more than what is expected
-                # this might be hard to guess. Setting this to a very
-                # high number is adversely affecting performance
-                num_of_groups = 100
-                grouped_rows_rdd = \
-                    GroupSortbyTimestampPartition. \
-                    fetch_group_latest_oldest_quantity(
-                        record_store_df, transform_spec_df,
-                        group_by_columns_list,
-                        num_of_groups)
-            else:
-                # group using key-value pair RDD's groupByKey()
-                grouped_rows_rdd = \
-                    GroupSortbyTimestamp. \
-                    fetch_group_latest_oldest_quantity(
-                        record_store_df, transform_spec_df,
-                        group_by_columns_list)
-
-            grouped_data_rdd_with_operation = grouped_rows_rdd.map(
-                lambda x:
-                GroupedDataWithOperation(x,
-                                         str(usage_fetch_operation)))
-
-            instance_usage_json_rdd = \
-                grouped_data_rdd_with_operation.map(
-                    FetchQuantity._get_latest_oldest_quantity)
+            # group with the engine which suits the number of groups
+            # in this batch
+            grouped_rows_rdd = \
+                GroupingEngine.fetch_group_latest_oldest_quantity(
+                    record_store_df, group_by_columns_list, metric_id)
+
+            # the operation is shipped once with the closure, not with
+            # every row
+            usage_fetch_operation = str(usage_fetch_operation)
+            instance_usage_rdd = grouped_rows_rdd.map(
+                lambda x: FetchQuantity._get_latest_oldest_quantity(
+                    x, usage_fetch_operation))
+
+            sql_context = SQLContext.getOrCreate(record_store_df.rdd.context)
+            instance_usage_df = \
+                InstanceUsageUtils.create_df_from_dict_rdd(sql_context,
+                                                           instance_usage_rdd)
         else:
+            grouped_record_store_df = FetchQuantity.aggregate_record_store(
+                record_store_df, group_by_columns_list,
+                usage_fetch_operation)
+
+            instance_usage_df = \
+                FetchQuantity.usage_from_aggregated_record_store(
+                    grouped_record_store_df, usage_fetch_operation,
+                    with_partial_state=with_partial_state)
+
+        return instance_usage_df
+
+    @staticmethod
+    def aggregate_record_store(record_store_df, group_by_columns_list,
+                               usage_fetch_operation):
+        """group record store records by the given group by columns list
+        and apply a sum, max, min or avg usage fetch operation, returning
+        the aggregated dataframe
+        """
+        record_store_df_int = \
+            record_store_df.select(
+                record_store_df.event_timestamp_unix.alias(
+                    "event_timestamp_unix_for_min"),
+                record_store_df.event_timestamp_unix.alias(
+                    "event_timestamp_unix_for_max"),
+                record_store_df.event_quantity.alias(
+                    "event_quantity_for_sum"),
+                record_store_df.event_quantity.alias(
+                    "event_quantity_for_count"),
+                record_store_df.event_quantity.alias(
+                    "event_quantity_for_min"),
+                record_store_df.event_quantity.alias(
+                    "event_quantity_for_max"),
+                "*")
+
+        # for standard sum, max, min, avg operations on grouped data,
+        # along with the partial state of quantity
+        agg_operations_map = {
+            "event_quantity": str(usage_fetch_operation),
+            "event_timestamp_unix_for_min": "min",
+            "event_timestamp_unix_for_max": "max",
+            "event_timestamp_unix": "count",
+            "event_quantity_for_sum": "sum",
+            "event_quantity_for_count": "count",
+            "event_quantity_for_min": "min",
+            "event_quantity_for_max": "max"}
+        # do a group by
+        grouped_data = record_store_df_int.groupBy(*group_by_columns_list)
+        grouped_record_store_df = grouped_data.agg(agg_operations_map)
+        return grouped_record_store_df
+
+    @staticmethod
+    def usage_from_aggregated_record_store(grouped_record_store_df,
+                                           usage_fetch_operation,
+                                           with_partial_state=False):
+        """convert record store data aggregated by aggregate_record_store
+        into a instance usage dataframe, with the partial state of quantity
+        in processing_meta when with_partial_state is set
+        """
+        # the operation is shipped once with the closure, not with every
+        # row
+        usage_fetch_operation = str(usage_fetch_operation)
+        instance_usage_rdd = grouped_record_store_df.map(
+            lambda x: FetchQuantity._get_quantity(x, usage_fetch_operation,
+                                                  with_partial_state))
 
-            record_store_df_int = \
-                record_store_df.select(
-                    record_store_df.event_timestamp_unix.alias(
-                        "event_timestamp_unix_for_min"),
-                    record_store_df.event_timestamp_unix.alias(
-                        "event_timestamp_unix_for_max"),
-                    "*")
-
-            # for standard sum, max, min, avg operations on grouped data
-            agg_operations_map = {
-                "event_quantity": str(usage_fetch_operation),
-                "event_timestamp_unix_for_min": "min",
-                "event_timestamp_unix_for_max": "max",
-                "event_timestamp_unix": "count"}
-            # do a group by
-            grouped_data = record_store_df_int.groupBy(*group_by_columns_list)
-            grouped_record_store_df = grouped_data.agg(agg_operations_map)
-
-            grouped_data_rdd_with_operation = grouped_record_store_df.map(
-                lambda x:
-                GroupedDataWithOperation(x,
-                                         str(usage_fetch_operation)))
-
-            instance_usage_json_rdd = grouped_data_rdd_with_operation.map(
-                FetchQuantity._get_quantity)
-
-        sql_context = SQLContext.getOrCreate(record_store_df.rdd.context)
+        sql_context = SQLContext.getOrCreate(
+            grouped_record_store_df.rdd.context)
         instance_usage_df = \
-            InstanceUsageUtils.create_df_from_json_rdd(sql_context,
-                                                       instance_usage_json_rdd)
+            InstanceUsageUtils.create_df_from_dict_rdd(sql_context,
+                                                       instance_usage_rdd)
         return instance_usage_df
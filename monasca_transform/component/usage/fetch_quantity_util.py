@@ -21,11 +21,11 @@ from monasca_transform.component import Component
 from monasca_transform.component.component_utils import ComponentUtils
 from monasca_transform.component.usage.fetch_quantity import FetchQuantity
 from monasca_transform.component.usage import UsageComponent
+from monasca_transform.data_driven_specs.transform_spec \
+    import TransformSpecCompiler
 
 from monasca_transform.transform.transform_utils import InstanceUsageUtils
 
-import json
-
 
 class FetchQuantityUtilException(Exception):
     """Exception thrown when fetching quantity
@@ -136,9 +136,7 @@ class FetchQuantityUtil(UsageComponent):
                                "usage_minute": usage_minute,
                                "aggregation_period": aggregation_period}
 
-        instance_usage_data_json = json.dumps(instance_usage_dict)
-
-        return instance_usage_data_json
+        return instance_usage_dict
 
     @staticmethod
     def usage(transform_context, record_store_df):
@@ -163,13 +161,11 @@ class FetchQuantityUtil(UsageComponent):
 
         sql_context = SQLContext.getOrCreate(record_store_df.rdd.context)
 
-        transform_spec_df = transform_context.transform_spec_df_info
+        transform_spec = TransformSpecCompiler.get_transform_spec(
+            transform_context)
 
         # get rollup operation (sum, max, avg, min)
-        agg_params = transform_spec_df.select(
-            "aggregation_params_map.usage_fetch_operation"). \
-            collect()[0].asDict()
-        usage_fetch_operation = agg_params["usage_fetch_operation"]
+        usage_fetch_operation = transform_spec.usage_fetch_operation
 
         # check if operation is valid
         if not FetchQuantityUtil. \
@@ -182,28 +178,20 @@ class FetchQuantityUtil(UsageComponent):
             transform_context, record_store_df)
 
         # get aggregation period for instance usage dataframe
-        agg_params = transform_spec_df.select(
-            "aggregation_params_map.aggregation_period").collect()[0].asDict()
-        aggregation_period = agg_params["aggregation_period"]
+        aggregation_period = transform_spec.aggregation_period
         group_by_period_list = ComponentUtils.\
             _get_instance_group_by_period_list(aggregation_period)
 
         # get what we want to group by
-        agg_params = transform_spec_df.select(
-            "aggregation_params_map.aggregation_group_by_list").\
-            collect()[0].asDict()
-        aggregation_group_by_list = agg_params["aggregation_group_by_list"]
+        aggregation_group_by_list = transform_spec.aggregation_group_by_list
 
         # group by columns list
         group_by_columns_list = group_by_period_list + \
             aggregation_group_by_list
 
         # get quantity event type
-        agg_params = transform_spec_df.select(
-            "aggregation_params_map.usage_fetch_util_quantity_event_type").\
-            collect()[0].asDict()
         usage_fetch_util_quantity_event_type = \
-            agg_params["usage_fetch_util_quantity_event_type"]
+            transform_spec.usage_fetch_util_quantity_event_type
 
         # check if driver parameter is provided
         if usage_fetch_util_quantity_event_type is None or \
@@ -213,11 +201,8 @@ class FetchQuantityUtil(UsageComponent):
                 % "usage_fetch_util_quantity_event_type")
 
         # get idle perc event type
-        agg_params = transform_spec_df.select(
-            "aggregation_params_map.usage_fetch_util_idle_perc_event_type").\
-            collect()[0].asDict()
         usage_fetch_util_idle_perc_event_type = \
-            agg_params["usage_fetch_util_idle_perc_event_type"]
+            transform_spec.usage_fetch_util_idle_perc_event_type
 
         # check if driver parameter is provided
         if usage_fetch_util_idle_perc_event_type is None or \
@@ -264,12 +249,12 @@ class FetchQuantityUtil(UsageComponent):
             col("idle_perc_df_alias.quantity")
             .alias("idle_perc"))
 
-        instance_usage_json_rdd = \
+        instance_usage_rdd = \
             quant_idle_perc_calc_df.rdd.map(
                 FetchQuantityUtil._format_quantity_util)
 
         instance_usage_df = \
-            InstanceUsageUtils.create_df_from_json_rdd(sql_context,
-                                                       instance_usage_json_rdd)
+            InstanceUsageUtils.create_df_from_dict_rdd(sql_context,
+                                                       instance_usage_rdd)
 
         return instance_usage_df
@@ -25,6 +25,7 @@ class ConfigInitializer(object):
         ConfigInitializer.load_service_options()
         ConfigInitializer.load_stage_processors_options()
         ConfigInitializer.load_pre_hourly_processor_options()
+        ConfigInitializer.load_hourly_state_processor_options()
         if not default_config_files:
             default_config_files = ['/etc/monasca-transform.conf',
                                     'etc/monasca-transform.conf']
@@ -47,7 +48,12 @@ class ConfigInitializer(object):
                 help='Repository for metric and event data_driven_specs'
             ),
             cfg.IntOpt('offsets_max_revisions', default=10,
-                       help="Max revisions of offsets for each application")
+                       help="Max revisions of offsets for each application"),
+            cfg.StrOpt('offsets_recovery_mode', default='recover',
+                       help="What to do with saved offsets when processing "
+                            "fails, recover replaces only offsets which "
+                            "are out of range in kafka, reset deletes all "
+                            "offsets")
         ]
         repo_group = cfg.OptGroup(name='repositories', title='repositories')
         cfg.CONF.register_group(repo_group)
@@ -86,7 +92,27 @@ class ConfigInitializer(object):
                        'KafkaMessageAdapterPreHourly',
                        help='Message adapter implementation'),
             cfg.StrOpt('topic_pre_hourly', default='metrics_pre_hourly',
-                       help='Messaging topic pre hourly')
+                       help='Messaging topic pre hourly'),
+            cfg.BoolOpt('insert_from_executors', default=False,
+                        help='Send aggregated metrics from the executors, '
+                             'one partition at a time, instead of '
+                             'collecting them on the driver'),
+            cfg.IntOpt('insert_batch_size', default=100,
+                       help='Number of metrics sent per request when '
+                            'sending from the executors'),
+            cfg.BoolOpt('batch_send_enabled', default=False,
+                        help='Buffer metrics in the message adapter and '
+                             'send many metrics per request'),
+            cfg.IntOpt('batch_send_size', default=500,
+                       help='Maximum number of buffered metrics before '
+                            'they are sent'),
+            cfg.FloatOpt('batch_send_linger_seconds', default=0.0,
+                         help='Send buffered metrics once the oldest one '
+                              'has been buffered this long, 0 disables '
+                              'time based sends'),
+            cfg.StrOpt('compression_codec', default='none',
+                       help='Compression codec for sent messages, one of '
+                            'none, gzip or snappy')
         ]
         messaging_group = cfg.OptGroup(name='messaging', title='messaging')
         cfg.CONF.register_group(messaging_group)
@@ -113,7 +139,87 @@ class ConfigInitializer(object):
             cfg.StrOpt('work_dir'),
             cfg.StrOpt('spark_home'),
             cfg.BoolOpt('enable_record_store_df_cache'),
-            cfg.StrOpt('record_store_df_cache_storage_level')
+            cfg.StrOpt('record_store_df_cache_storage_level'),
+            cfg.BoolOpt('enable_record_store_column_pruning', default=True,
+                        help='Only keep record store columns which are '
+                             'referenced by transform specs'),
+            cfg.BoolOpt('enable_dimension_encoding', default=False,
+                        help='Replace dimension values in the record store '
+                             'with integer codes before grouping'),
+            cfg.ListOpt('dimension_encoding_columns',
+                        default=['tenant_id', 'resource_uuid', 'host'],
+                        help='Record store columns which are encoded'),
+            cfg.IntOpt('dimension_dictionary_max_size', default=100000,
+                       help='Number of dimension values for which codes '
+                            'are kept across batches'),
+            cfg.BoolOpt('enable_multi_spec_aggregation', default=False,
+                        help='Aggregate transform specs which share a usage '
+                             'operation and group by list in a single pass'),
+            cfg.BoolOpt('enable_grouping_sets_aggregation', default=False,
+                        help='Evaluate transform specs generated from the '
+                             'same event type with grouping sets instead '
+                             'of copying records for each metric_id'),
+            cfg.StrOpt('grouping_engine', default='combiner',
+                       help='Grouping engine for the latest and oldest '
+                            'usage operations, one of combiner, '
+                            'group_by_key, repartition_sort or adaptive, '
+                            'which estimates the number of groups of each '
+                            'spec in every batch to choose one'),
+            cfg.FloatOpt('grouping_approx_distinct_rsd', default=0.05,
+                         help='Relative standard deviation of the '
+                              'approximate count of groups'),
+            cfg.FloatOpt('grouping_combiner_min_records_per_group',
+                         default=2.0,
+                         help='Use the combiner engine when groups have at '
+                              'least this many records on average'),
+            cfg.IntOpt('grouping_group_by_key_max_groups', default=1000,
+                       help='Use the group_by_key engine for up to this '
+                            'many groups when combining saves little'),
+            cfg.IntOpt('grouping_groups_per_partition', default=1000,
+                       help='Number of groups per partition of the '
+                            'repartition_sort engine'),
+            cfg.IntOpt('grouping_max_partitions', default=200,
+                       help='Maximum number of partitions of the '
+                            'repartition_sort engine'),
+            cfg.BoolOpt('publish_grouping_engine_metrics', default=False,
+                        help='Send the chosen grouping engine and the '
+                             'estimated number of groups as a metric'),
+            cfg.BoolOpt('enable_shuffle_partition_tuning', default=False,
+                        help='Set the number of dataframe shuffle '
+                             'partitions of each batch and pre hourly run '
+                             'from its record count, instead of using '
+                             'spark.sql.shuffle.partitions'),
+            cfg.IntOpt('shuffle_target_rows_per_partition', default=50000,
+                       help='Number of records per shuffle partition'),
+            cfg.IntOpt('shuffle_min_partitions', default=1,
+                       help='Minimum number of shuffle partitions'),
+            cfg.IntOpt('shuffle_max_partitions', default=200,
+                       help='Maximum number of shuffle partitions'),
+            cfg.BoolOpt('enable_skew_handling', default=False,
+                        help='Spread records of hot grouping keys over '
+                             'several partitions in the repartition_sort '
+                             'engine and merge their partial results'),
+            cfg.FloatOpt('skew_sample_fraction', default=0.05,
+                         help='Fraction of records sampled to find hot '
+                              'grouping keys'),
+            cfg.FloatOpt('skew_hot_key_factor', default=2.0,
+                         help='A grouping key is hot when it has more than '
+                              'this many times the records of an average '
+                              'partition'),
+            cfg.IntOpt('skew_min_sample_count', default=10,
+                       help='Minimum number of sampled records of a hot '
+                            'grouping key'),
+            cfg.IntOpt('skew_salt_count', default=8,
+                       help='Number of partitions the records of a hot '
+                            'grouping key are spread over'),
+            cfg.BoolOpt('enable_event_type_prefilter', default=True,
+                        help='Drop metrics whose name is not an event type '
+                             'in pre transform specs before joining them '
+                             'with the specs'),
+            cfg.BoolOpt('enable_raw_metric_name_prefilter', default=True,
+                        help='Drop raw metrics whose name is not an event '
+                             'type in pre transform specs before parsing '
+                             'their json')
         ]
         service_group = cfg.OptGroup(name='service', title='service')
         cfg.CONF.register_group(service_group)
@@ -123,6 +229,12 @@ class ConfigInitializer(object):
     def load_stage_processors_options():
         app_opts = [
             cfg.BoolOpt('pre_hourly_processor_enabled'),
+            cfg.BoolOpt('hourly_state_processor_enabled', default=False,
+                        help="Keep hourly aggregation state in the driver "
+                             "and publish hours when they close, instead "
+                             "of writing instance usage to "
+                             "metrics_pre_hourly. Requires "
+                             "pre_hourly_processor_enabled to be False")
         ]
         app_group = cfg.OptGroup(name='stage_processors',
                                  title='stage_processors')
@@ -133,9 +245,31 @@ class ConfigInitializer(object):
     def load_pre_hourly_processor_options():
         app_opts = [
             cfg.BoolOpt('enable_instance_usage_df_cache'),
-            cfg.StrOpt('instance_usage_df_cache_storage_level')
+            cfg.StrOpt('instance_usage_df_cache_storage_level'),
+            cfg.IntOpt('first_run_lookback_hours', default=0,
+                       help="When there are no saved offsets, only read "
+                            "data published in this many hours, 0 reads "
+                            "from the earliest offset"),
+            cfg.IntOpt('max_messages_per_chunk', default=0,
+                       help="Roll up larger backlogs in chunks with at "
+                            "most this many messages for each partition, "
+                            "0 rolls up all messages at once")
         ]
         app_group = cfg.OptGroup(name='pre_hourly_processor',
                                  title='pre_hourly_processor')
         cfg.CONF.register_group(app_group)
         cfg.CONF.register_opts(app_opts, group=app_group)
+
+    @staticmethod
+    def load_hourly_state_processor_options():
+        app_opts = [
+            cfg.StrOpt('state_checkpoint_dir',
+                       default='/var/run/monasca/transform/hourly_state',
+                       help="Directory, on a file system shared by the "
+                            "driver and the executors, where hourly state "
+                            "is checkpointed")
+        ]
+        app_group = cfg.OptGroup(name='hourly_state_processor',
+                                 title='hourly_state_processor')
+        cfg.CONF.register_group(app_group)
+        cfg.CONF.register_opts(app_opts, group=app_group)
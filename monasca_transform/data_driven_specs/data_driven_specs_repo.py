@@ -17,6 +17,9 @@ from oslo_config import cfg
 import simport
 import six
 
+from monasca_transform.data_driven_specs.transform_spec \
+    import TransformSpecCompiler
+
 
 class DataDrivenSpecsRepoFactory(object):
 
@@ -36,8 +39,58 @@ class DataDrivenSpecsRepo(object):
     transform_specs_type = 'transform_specs'
     pre_transform_specs_type = 'pre_transform_specs'
 
+    compiled_transform_specs = None
+    pre_transform_spec_rows = None
+    pre_transform_specs_schema = None
+
     @abc.abstractmethod
     def get_data_driven_specs(self, sql_context=None, type=None):
         raise NotImplementedError(
             "Class %s doesn't implement get_data_driven_specs(self, type=None)"
             % self.__class__.__name__)
+
+    def get_compiled_transform_specs(self, sql_context=None):
+        """get transform specs compiled into a dict of TransformSpec keyed
+        by metric_id. Specs are collected and compiled once and then reused
+        until the repository reports that they have changed.
+        """
+        transform_specs_changed = self.is_transform_specs_changed()
+        if self.compiled_transform_specs is None or transform_specs_changed:
+            transform_specs_df = self.get_data_driven_specs(
+                sql_context=sql_context,
+                data_driven_spec_type=self.transform_specs_type)
+            self.compiled_transform_specs = \
+                TransformSpecCompiler.compile_transform_specs(
+                    transform_specs_df.collect())
+        return self.compiled_transform_specs
+
+    def is_transform_specs_changed(self):
+        """returns True if transform specs have changed since
+        they were last read.
+        """
+        return False
+
+    def get_cached_pre_transform_specs(self, sql_context=None):
+        """get pre transform specs as a tuple of dataframe and list of
+        rows. Specs are collected once and reused until the repository
+        reports that they have changed, the dataframe is created from the
+        collected rows and does not read the repository again.
+        """
+        pre_transform_specs_changed = self.is_pre_transform_specs_changed()
+        if self.pre_transform_spec_rows is None or \
+                pre_transform_specs_changed:
+            pre_transform_specs_df = self.get_data_driven_specs(
+                sql_context=sql_context,
+                data_driven_spec_type=self.pre_transform_specs_type)
+            self.pre_transform_specs_schema = pre_transform_specs_df.schema
+            self.pre_transform_spec_rows = pre_transform_specs_df.collect()
+
+        pre_transform_specs_df = sql_context.createDataFrame(
+            self.pre_transform_spec_rows, self.pre_transform_specs_schema)
+        return (pre_transform_specs_df, self.pre_transform_spec_rows)
+
+    def is_pre_transform_specs_changed(self):
+        """returns True if pre transform specs have changed since
+        they were last read.
+        """
+        return False
@@ -22,9 +22,9 @@ class JSONDataDrivenSpecsRepo(DataDrivenSpecsRepo):
 
     def __init__(self, common_file_system_stub_path=None):
         self._common_file_system_stub_path = common_file_system_stub_path or ''
+        self._specs_mtimes = {}
 
-    def get_data_driven_specs(self, sql_context=None,
-                              data_driven_spec_type=None):
+    def _get_data_driven_specs_path(self, data_driven_spec_type):
         path = None
         if data_driven_spec_type == self.transform_specs_type:
             path = (os.path.join(
@@ -39,7 +39,28 @@ class JSONDataDrivenSpecsRepo(DataDrivenSpecsRepo):
                     "pre_transform_specs/pre_transform_specs.json"
 
                     ))
+        return path
+
+    def get_data_driven_specs(self, sql_context=None,
+                              data_driven_spec_type=None):
+        path = self._get_data_driven_specs_path(data_driven_spec_type)
 
         if os.path.exists(path):
             # read file to json
             return sql_context.read.json(path)
+
+    def _is_specs_changed(self, data_driven_spec_type):
+        """check modification time of the specs file."""
+        path = self._get_data_driven_specs_path(data_driven_spec_type)
+        mtime = None
+        if os.path.exists(path):
+            mtime = os.path.getmtime(path)
+        specs_changed = mtime != self._specs_mtimes.get(data_driven_spec_type)
+        self._specs_mtimes[data_driven_spec_type] = mtime
+        return specs_changed
+
+    def is_transform_specs_changed(self):
+        return self._is_specs_changed(self.transform_specs_type)
+
+    def is_pre_transform_specs_changed(self):
+        return self._is_specs_changed(self.pre_transform_specs_type)
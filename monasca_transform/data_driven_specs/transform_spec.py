@@ -0,0 +1,110 @@
+# Copyright 2016 Hewlett Packard Enterprise Development Company LP
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+from collections import namedtuple
+
+
+TransformSpecBase = namedtuple("TransformSpec",
+                               ["metric_id",
+                                "source",
+                                "usage",
+                                "setters",
+                                "insert",
+                                "aggregated_metric_name",
+                                "aggregation_period",
+                                "aggregation_group_by_list",
+                                "usage_fetch_operation",
+                                "usage_fetch_util_quantity_event_type",
+                                "usage_fetch_util_idle_perc_event_type",
+                                "setter_rollup_group_by_list",
+                                "setter_rollup_operation",
+                                "dimension_list",
+                                "pre_hourly_operation",
+                                "pre_hourly_group_by_list"])
+
+
+class TransformSpec(TransformSpecBase):
+    """A tuple which contains the aggregation parameters of a single
+    transform spec as plain python values, so that components do not have
+    to run a spark job to read each parameter from transform_spec_df.
+
+    namedtuple contains:
+
+    metric_id - metric id the spec applies to
+    source, usage, setters, insert - aggregation pipeline
+    remaining fields - parameters from aggregation_params_map, list
+                       parameters are empty lists when not specified
+
+    Instances are shared by all components processing a metric_id, list
+    fields must not be modified.
+    """
+
+
+class TransformSpecCompiler(object):
+    """utility methods to compile transform specs into TransformSpec"""
+
+    @staticmethod
+    def compile_transform_spec(transform_spec_dict):
+        """compile transform spec dict into TransformSpec."""
+        agg_params = transform_spec_dict.get("aggregation_params_map") or {}
+        aggregation_pipeline = agg_params.get("aggregation_pipeline") or {}
+
+        return TransformSpec(
+            metric_id=transform_spec_dict.get("metric_id"),
+            source=aggregation_pipeline.get("source"),
+            usage=aggregation_pipeline.get("usage"),
+            setters=list(aggregation_pipeline.get("setters") or []),
+            insert=list(aggregation_pipeline.get("insert") or []),
+            aggregated_metric_name=agg_params.get("aggregated_metric_name"),
+            aggregation_period=agg_params.get("aggregation_period"),
+            aggregation_group_by_list=list(
+                agg_params.get("aggregation_group_by_list") or []),
+            usage_fetch_operation=agg_params.get("usage_fetch_operation"),
+            usage_fetch_util_quantity_event_type=agg_params.get(
+                "usage_fetch_util_quantity_event_type"),
+            usage_fetch_util_idle_perc_event_type=agg_params.get(
+                "usage_fetch_util_idle_perc_event_type"),
+            setter_rollup_group_by_list=list(
+                agg_params.get("setter_rollup_group_by_list") or []),
+            setter_rollup_operation=agg_params.get("setter_rollup_operation"),
+            dimension_list=list(agg_params.get("dimension_list") or []),
+            pre_hourly_operation=agg_params.get("pre_hourly_operation"),
+            pre_hourly_group_by_list=list(
+                agg_params.get("pre_hourly_group_by_list") or []))
+
+    @staticmethod
+    def compile_transform_specs(transform_spec_rows):
+        """compile collected transform_specs rows into a dict of
+        TransformSpec keyed by metric_id
+        """
+        transform_specs = {}
+        for row in transform_spec_rows:
+            transform_spec = TransformSpecCompiler.compile_transform_spec(
+                row.asDict(recursive=True))
+            transform_specs[transform_spec.metric_id] = transform_spec
+        return transform_specs
+
+    @staticmethod
+    def get_transform_spec(transform_context):
+        """get compiled transform spec from transform context.
+        If the context only carries transform_spec_df the spec is
+        compiled from it, which takes a single spark job.
+        """
+        transform_spec = transform_context.transform_spec_info
+        if transform_spec is None:
+            transform_spec_row = \
+                transform_context.transform_spec_df_info.collect()[0]
+            transform_spec = TransformSpecCompiler.compile_transform_spec(
+                transform_spec_row.asDict(recursive=True))
+        return transform_spec
@@ -19,21 +19,30 @@ from pyspark.streaming.kafka import KafkaUtils
 from pyspark.streaming.kafka import TopicAndPartition
 from pyspark.streaming import StreamingContext
 
+from pyspark.sql.functions import array
+from pyspark.sql.functions import broadcast
 from pyspark.sql.functions import explode
-from pyspark.sql.functions import from_unixtime
 from pyspark.sql.functions import lit
 from pyspark.sql.functions import when
 from pyspark.sql import SQLContext
+from pyspark.sql.types import StringType
+from pyspark.sql.types import StructType
 
 import json
 import logging
 from oslo_config import cfg
+import re
 import simport
 import time
 
+from monasca_transform.component.component_utils import ComponentUtils
 from monasca_transform.config.config_initializer import ConfigInitializer
 from monasca_transform.transform.builder.generic_transform_builder \
     import GenericTransformBuilder
+from monasca_transform.transform.builder.grouping_sets_transform_builder \
+    import GroupingSetsTransformBuilder
+from monasca_transform.transform.builder.multi_spec_transform_builder \
+    import MultiSpecTransformBuilder
 
 from monasca_transform.data_driven_specs.data_driven_specs_repo \
     import DataDrivenSpecsRepo
@@ -41,11 +50,20 @@ from monasca_transform.data_driven_specs.data_driven_specs_repo \
 from monasca_transform.data_driven_specs.data_driven_specs_repo \
     import DataDrivenSpecsRepoFactory
 
+from monasca_transform.offset_recovery import OffsetRecovery
+from monasca_transform.processor.hourly_state_processor import \
+    HourlyStateProcessor
 from monasca_transform.processor.pre_hourly_processor import PreHourlyProcessor
 
-from monasca_transform.transform import RddTransformContext
+from monasca_transform.transform.dimension_encoding \
+    import DimensionDictionary
+from monasca_transform.transform.dimension_encoding \
+    import DimensionEncodingUtils
+from monasca_transform.transform.shuffle_utils import ShuffleUtils
 from monasca_transform.transform.storage_utils import StorageUtils
 from monasca_transform.transform.transform_utils import MonMetricUtils
+from monasca_transform.transform.transform_utils import RecordStoreUtils
+from monasca_transform.transform import BatchStats
 from monasca_transform.transform import TransformContextUtils
 
 ConfigInitializer.basic_config()
@@ -64,26 +82,91 @@ log.setLevel(logging.DEBUG)
 
 class MonMetricsKafkaProcessor(object):
 
+    # layers of a raw metric in which required fields are looked for
+    _REQUIRED_FIELD_LAYERS = [[], ["metric", "dimensions"], ["meta"]]
+
+    # "name" values in a raw metric json payload
+    _RAW_METRIC_NAME_PATTERN = re.compile(r'"name"\s*:\s*"((?:[^"\\]|\\.)*)"')
+
+    # codes of dimension values, kept across batches
+    dimension_dictionary = None
+
+    # transform context of each batch with data, kept on the driver from
+    # store_offset_ranges until the batch is processed
+    batch_transform_contexts = {}
+
+    # record store columns which are needed by every spec
+    _REQUIRED_RECORD_STORE_COLUMNS = ["event_timestamp_unix",
+                                      "event_quantity",
+                                      "event_type",
+                                      "metric_id"]
+
     @staticmethod
     def log_debug(message):
         print(message)
         log.debug(message)
 
+    @staticmethod
+    def _get_message_count(offset_ranges):
+        """get the number of kafka messages in a batch from its offset
+        ranges, without running a job
+        """
+        return sum(offset_range.untilOffset - offset_range.fromOffset
+                   for offset_range in offset_ranges)
+
     @staticmethod
     def store_offset_ranges(batch_time, rdd):
-        if rdd.isEmpty():
+        my_offset_ranges = rdd.offsetRanges()
+        message_count = MonMetricsKafkaProcessor._get_message_count(
+            my_offset_ranges)
+        if message_count == 0:
             MonMetricsKafkaProcessor.log_debug(
                 "storeOffsetRanges: nothing to process...")
             return rdd
         else:
-            my_offset_ranges = rdd.offsetRanges()
+            batch_stats = BatchStats(message_count=message_count,
+                                     record_count=None,
+                                     metric_id_counts=None)
             transform_context = \
                 TransformContextUtils.get_context(offset_info=my_offset_ranges,
-                                                  batch_time_info=batch_time
+                                                  batch_time_info=batch_time,
+                                                  batch_stats_info=batch_stats
                                                   )
-            rdd_transform_context = \
-                rdd.map(lambda x: RddTransformContext(x, transform_context))
-            return rdd_transform_context
+            # the transform context is the same for every record of the
+            # batch, so it is not copied into the records
+            MonMetricsKafkaProcessor.batch_transform_contexts[batch_time] = \
+                transform_context
+            return rdd
+
+    @staticmethod
+    def process_batch(batch_time, rdd):
+        """process a batch with the transform context stored for it by
+        store_offset_ranges
+        """
+        batch_transform_contexts = \
+            MonMetricsKafkaProcessor.batch_transform_contexts
+        try:
+            transform_context = batch_transform_contexts.get(batch_time)
+            MonMetricsKafkaProcessor.rdd_to_recordstore(
+                rdd, transform_context)
+
+            # publish hours of the hourly state which closed while no
+            # metrics arrived
+            if (transform_context is None and
+                    HourlyStateProcessor.is_time_to_run(batch_time)):
+                HourlyStateProcessor.run_processor(rdd.context, batch_time)
+        finally:
+            # remove the context of this batch, and of earlier batches
+            # which failed before they were processed
+            for stored_batch_time in list(batch_transform_contexts.keys()):
+                if stored_batch_time <= batch_time:
+                    del batch_transform_contexts[stored_batch_time]
+
+            # shuffle partitions of the batch are set on the shared sql
+            # context, later jobs use the configured value again
+            if cfg.CONF.service.enable_shuffle_partition_tuning:
+                ShuffleUtils.reset_shuffle_partitions(
+                    SQLContext.getOrCreate(rdd.context))
 
     @staticmethod
     def print_offset_ranges(my_offset_ranges):
@@ -189,50 +272,193 @@ class MonMetricsKafkaProcessor(object):
         offset_specs.delete_all_kafka_offsets(app_name)
 
     @staticmethod
-    def _validate_raw_mon_metrics(row):
-
-        required_fields = row.required_raw_fields_list
-
-        invalid_list = []
-
-        for required_field in required_fields:
-            required_field_value = None
-
-            # Look for the field in the first layer of the row
-            try:
-                required_field_value = eval(".".join(("row", required_field)))
-            except Exception:
-                pass
-
-            if (required_field_value is None or required_field_value == "" and
-                    row.metric is not None and
-                    row.metric.dimensions is not None):
-                # Look for the field in the dimensions layer of the row
-                try:
-                    required_field_value = eval(
-                        ".".join(("row.metric.dimensions", required_field)))
-                except Exception:
-                    pass
-
-            if (required_field_value is None or required_field_value == "" and
-                    row.meta is not None):
-                # Look for the field in the meta layer of the row
-                try:
-                    required_field_value = eval(
-                        ".".join(("row.meta", required_field)))
-                except Exception:
-                    pass
-
-            if required_field_value is None \
-                    or required_field_value == "":
-                invalid_list.append("invalid")
-
-        if len(invalid_list) <= 0:
-            return row
-        else:
-            print("_validate_raw_mon_metrics : found invalid : ** %s: %s" % (
-                (".".join(("row", required_field))),
-                required_field_value))
+    def _get_field_data_type(struct_type, field_names):
+        """get data type of a possibly nested field, None if the
+        field is not part of struct_type.
+        """
+        data_type = struct_type
+        for field_name in field_names:
+            if not isinstance(data_type, StructType) or \
+                    field_name not in data_type.names:
+                return None
+            data_type = data_type[field_name].dataType
+        return data_type
+
+    @staticmethod
+    def _get_required_field_condition(metrics_df, required_field):
+        """column predicate which is true when the required field is
+        present and not empty. As before, the field is looked for in the
+        first layer of the row, in the dimensions and in the meta layer.
+        """
+        required_field_condition = None
+        for layer in MonMetricsKafkaProcessor._REQUIRED_FIELD_LAYERS:
+            field_names = layer + required_field.split(".")
+            data_type = MonMetricsKafkaProcessor._get_field_data_type(
+                metrics_df.schema, field_names)
+            if data_type is None:
+                continue
+
+            field_column = metrics_df[field_names[0]]
+            for field_name in field_names[1:]:
+                field_column = field_column.getField(field_name)
+
+            condition = field_column.isNotNull()
+            if isinstance(data_type, StringType):
+                condition = condition & (field_column != "")
+
+            if required_field_condition is None:
+                required_field_condition = condition
+            else:
+                required_field_condition = required_field_condition | \
+                    condition
+
+        if required_field_condition is None:
+            # field is not available in metrics
+            required_field_condition = lit(False)
+        return required_field_condition
+
+    @staticmethod
+    def _get_validation_condition(metrics_df, pre_transform_spec_rows):
+        """compile required_raw_fields_list of the pre transform specs
+        into a single column predicate. Event types which have the same
+        required fields share a predicate.
+        """
+        event_types_by_required_fields = {}
+        for row in pre_transform_spec_rows:
+            required_fields = tuple(row.required_raw_fields_list or [])
+            event_types_by_required_fields.setdefault(
+                required_fields, []).append(row.event_type)
+
+        validation_condition = None
+        for required_fields, event_types in \
+                event_types_by_required_fields.items():
+            condition = metrics_df.event_type.isin(*event_types)
+            for required_field in required_fields:
+                condition = condition & MonMetricsKafkaProcessor.\
+                    _get_required_field_condition(metrics_df,
+                                                  required_field)
+            if validation_condition is None:
+                validation_condition = condition
+            else:
+                validation_condition = validation_condition | condition
+
+        if validation_condition is None:
+            validation_condition = lit(False)
+        return validation_condition
+
+    @staticmethod
+    def _is_event_type_raw_metric(raw_metric, event_types):
+        """check the "name" values of a raw metric json payload against
+        event types without decoding the json. Payloads are kept when
+        there is no name value or a name contains escapes, so that only
+        metrics which are certain not to match are dropped.
+        """
+        metric_names = MonMetricsKafkaProcessor._RAW_METRIC_NAME_PATTERN.\
+            findall(raw_metric)
+        if not metric_names:
+            return True
+        for metric_name in metric_names:
+            if "\\" in metric_name or metric_name in event_types:
+                return True
+        return False
+
+    @staticmethod
+    def _prefilter_raw_metric(raw_metric, event_types,
+                              kept_accumulator, dropped_accumulator):
+        """prefilter raw metric and count kept and dropped metrics."""
+        if MonMetricsKafkaProcessor._is_event_type_raw_metric(raw_metric,
+                                                              event_types):
+            kept_accumulator.add(1)
+            return True
+        dropped_accumulator.add(1)
+        return False
+
+    @staticmethod
+    def _prefilter_raw_metrics(raw_mon_metrics, event_types):
+        """drop raw metrics which are not of the event types. Returns the
+        filtered rdd and accumulators of kept and dropped metrics, which
+        are complete once the filtered rdd has been evaluated once.
+        """
+        spark_context = raw_mon_metrics.context
+        prefilter_kept = spark_context.accumulator(0)
+        prefilter_dropped = spark_context.accumulator(0)
+        filtered_raw_mon_metrics = raw_mon_metrics.filter(
+            lambda x: MonMetricsKafkaProcessor._prefilter_raw_metric(
+                x, event_types, prefilter_kept, prefilter_dropped))
+        return filtered_raw_mon_metrics, prefilter_kept, prefilter_dropped
+
+    @staticmethod
+    def _get_metric_id_list_column(metrics_df, metric_id_lists):
+        """metric_id_list column with the lists of the given event types
+        replaced, so that records are generated once for a grouping sets
+        family instead of once for each of its metric_ids.
+        """
+        metric_id_list_column = metrics_df.metric_id_list
+        for event_type, metric_id_list in metric_id_lists.items():
+            metric_id_list_column = when(
+                metrics_df.event_type == event_type,
+                array(*[lit(metric_id) for metric_id in metric_id_list])
+            ).otherwise(metric_id_list_column)
+        return metric_id_list_column
+
+    @staticmethod
+    def _get_record_store_columns(transform_specs, record_store_columns):
+        """get the record store columns which are referenced by transform
+        specs, in record store column order. Group by lists, dimension
+        lists and the period buckets of the aggregation periods are
+        looked at, columns the specs do not know about are dropped.
+        """
+        referenced_columns = set(
+            MonMetricsKafkaProcessor._REQUIRED_RECORD_STORE_COLUMNS)
+        for transform_spec in transform_specs.values():
+            referenced_columns.update(
+                ComponentUtils._get_group_by_period_list(
+                    transform_spec.aggregation_period))
+            referenced_columns.update(
+                transform_spec.aggregation_group_by_list)
+            referenced_columns.update(
+                transform_spec.setter_rollup_group_by_list)
+            referenced_columns.update(transform_spec.dimension_list)
+            referenced_columns.update(
+                transform_spec.pre_hourly_group_by_list)
+        return [column for column in record_store_columns
+                if column in referenced_columns]
+
+    @staticmethod
+    def _get_dimension_dictionary():
+        if MonMetricsKafkaProcessor.dimension_dictionary is None:
+            MonMetricsKafkaProcessor.dimension_dictionary = \
+                DimensionDictionary(
+                    cfg.CONF.service.dimension_dictionary_max_size)
+        return MonMetricsKafkaProcessor.dimension_dictionary
+
+    @staticmethod
+    def _is_empty_batch(raw_rdd, transform_context):
+        """batches from store_offset_ranges are known to have messages,
+        other batches are checked with a job
+        """
+        if transform_context is None:
+            return True
+        batch_stats = transform_context.batch_stats_info
+        if batch_stats is not None:
+            return batch_stats.message_count == 0
+        return raw_rdd.isEmpty()
+
+    @staticmethod
+    def _get_batch_stats(record_store_df, batch_stats):
+        """count record store records by metric_id in a single job. The
+        counts give the record count and the metric_ids to process of
+        the batch.
+        """
+        metric_id_counts = dict(
+            (row.metric_id, row["count"]) for row in
+            record_store_df.groupBy("metric_id").count().collect())
+        message_count = None
+        if batch_stats is not None:
+            message_count = batch_stats.message_count
+        return BatchStats(message_count=message_count,
+                          record_count=sum(metric_id_counts.values()),
+                          metric_id_counts=metric_id_counts)
 
     @staticmethod
     def process_metric(transform_context, record_store_df):
@@ -246,15 +472,22 @@ class MonMetricsKafkaProcessor(object):
                                              record_store_df)
 
     @staticmethod
-    def process_metrics(transform_context, record_store_df):
+    def process_metrics(transform_context, record_store_df,
+                        grouping_sets_families=None):
         """start processing (aggregating) metrics
         """
         #
-        # look in record_store_df for list of metrics to be processed
+        # look in batch stats or record_store_df for list of metrics to be
+        # processed
         #
-        metric_ids_df = record_store_df.select("metric_id").distinct()
-        metric_ids_to_process = [row.metric_id
-                                 for row in metric_ids_df.collect()]
+        batch_stats = transform_context.batch_stats_info
+        if batch_stats is not None and \
+                batch_stats.metric_id_counts is not None:
+            metric_ids_to_process = sorted(batch_stats.metric_id_counts)
+        else:
+            metric_ids_df = record_store_df.select("metric_id").distinct()
+            metric_ids_to_process = [row.metric_id
+                                     for row in metric_ids_df.collect()]
 
         data_driven_specs_repo = DataDrivenSpecsRepoFactory.\
             get_data_driven_specs_repo()
@@ -262,6 +495,25 @@ class MonMetricsKafkaProcessor(object):
         transform_specs_df = data_driven_specs_repo.get_data_driven_specs(
             sql_context=sqlc,
             data_driven_spec_type=DataDrivenSpecsRepo.transform_specs_type)
+        # compiled specs, so that components do not have to read
+        # parameters from transform_spec_df
+        transform_specs = data_driven_specs_repo.\
+            get_compiled_transform_specs(sql_context=sqlc)
+
+        if grouping_sets_families:
+            # families of specs have a single copy of their records in the
+            # record store and are evaluated with grouping sets
+            metric_ids_to_process = GroupingSetsTransformBuilder.\
+                do_transform(transform_context, record_store_df,
+                             transform_specs_df, transform_specs,
+                             grouping_sets_families, metric_ids_to_process)
+
+        if cfg.CONF.service.enable_multi_spec_aggregation:
+            # aggregate specs which share a usage operation and group by
+            # shape together, remaining specs are processed one at a time
+            metric_ids_to_process = MultiSpecTransformBuilder.do_transform(
+                transform_context, record_store_df, transform_specs_df,
+                transform_specs, metric_ids_to_process)
 
         for metric_id in metric_ids_to_process:
             transform_spec_df = transform_specs_df.select(
@@ -274,33 +526,44 @@ class MonMetricsKafkaProcessor(object):
             transform_context = \
                 TransformContextUtils.get_context(
                     transform_context_info=transform_context,
-                    transform_spec_df_info=transform_spec_df)
+                    transform_spec_df_info=transform_spec_df,
+                    transform_spec_info=transform_specs.get(metric_id))
 
             MonMetricsKafkaProcessor.process_metric(
                 transform_context, source_record_store_df)
 
     @staticmethod
-    def rdd_to_recordstore(rdd_transform_context_rdd):
+    def rdd_to_recordstore(raw_rdd, transform_context):
 
-        if rdd_transform_context_rdd.isEmpty():
+        if MonMetricsKafkaProcessor._is_empty_batch(raw_rdd,
+                                                    transform_context):
             MonMetricsKafkaProcessor.log_debug(
                 "rdd_to_recordstore: nothing to process...")
         else:
 
-            sql_context = SQLContext(rdd_transform_context_rdd.context)
+            sql_context = SQLContext(raw_rdd.context)
             data_driven_specs_repo = DataDrivenSpecsRepoFactory.\
                 get_data_driven_specs_repo()
-            pre_transform_specs_df = data_driven_specs_repo.\
-                get_data_driven_specs(
-                    sql_context=sql_context,
-                    data_driven_spec_type=DataDrivenSpecsRepo.
-                    pre_transform_specs_type)
+            # pre transform specs are read once and reused until they
+            # change
+            (pre_transform_specs_df,
+             pre_transform_spec_rows) = data_driven_specs_repo.\
+                get_cached_pre_transform_specs(sql_context=sql_context)
 
             #
             # extract second column containing raw metric data
             #
-            raw_mon_metrics = rdd_transform_context_rdd.map(
-                lambda nt: nt.rdd_info[1])
+            raw_mon_metrics = raw_rdd.map(lambda x: x[1])
+
+            if cfg.CONF.service.enable_raw_metric_name_prefilter:
+                # drop metrics which are not in pre transform specs before
+                # they are parsed
+                raw_event_types = frozenset(
+                    row.event_type for row in pre_transform_spec_rows)
+                (raw_mon_metrics,
+                 prefilter_kept,
+                 prefilter_dropped) = MonMetricsKafkaProcessor.\
+                    _prefilter_raw_metrics(raw_mon_metrics, raw_event_types)
 
             #
             # convert raw metric data rdd to dataframe rdd
@@ -310,27 +573,56 @@ class MonMetricsKafkaProcessor(object):
                     sql_context,
                     raw_mon_metrics)
 
+            if cfg.CONF.service.enable_event_type_prefilter:
+                # drop metrics which are not in pre transform specs before
+                # the join
+                event_types = [row.event_type
+                               for row in pre_transform_spec_rows]
+                raw_mon_metrics_df = raw_mon_metrics_df.where(
+                    raw_mon_metrics_df.metric.name.isin(*event_types))
+
             #
             # filter out unwanted metrics and keep metrics we are interested in
+            # pre transform specs are small, broadcast them so that the join
+            # is a map side lookup and metrics are not shuffled
             #
             cond = [
                 raw_mon_metrics_df.metric.name ==
                 pre_transform_specs_df.event_type]
             filtered_metrics_df = raw_mon_metrics_df.join(
-                pre_transform_specs_df, cond)
+                broadcast(pre_transform_specs_df), cond)
 
             #
             # validate filtered metrics to check if required fields
             # are present and not empty
-            # In order to be able to apply filter function had to convert
-            # data frame rdd to normal rdd. After validation the rdd is
-            # converted back to dataframe rdd
+            # required fields of the pre transform specs are compiled into
+            # column predicates, so that rows are validated without
+            # converting the data frame to a python rdd
+            #
+            validated_mon_metrics_df = filtered_metrics_df.where(
+                MonMetricsKafkaProcessor._get_validation_condition(
+                    filtered_metrics_df, pre_transform_spec_rows))
+
+            #
+            # specs generated from the same event type which can be
+            # evaluated together with grouping sets share a single
+            # intermediate metric record
             #
-            # FIXME: find a way to apply filter function on dataframe rdd data
-            validated_mon_metrics_rdd = filtered_metrics_df.rdd.filter(
-                MonMetricsKafkaProcessor._validate_raw_mon_metrics)
-            validated_mon_metrics_df = sql_context.createDataFrame(
-                validated_mon_metrics_rdd, filtered_metrics_df.schema)
+            grouping_sets_families = {}
+            metric_id_list_column = validated_mon_metrics_df.metric_id_list
+            if cfg.CONF.service.enable_grouping_sets_aggregation:
+                grouping_sets_families = GroupingSetsTransformBuilder.\
+                    get_grouping_sets_families(
+                        pre_transform_spec_rows,
+                        data_driven_specs_repo.get_compiled_transform_specs(
+                            sql_context=sql_context))
+                metric_id_list_column = MonMetricsKafkaProcessor.\
+                    _get_metric_id_list_column(
+                        validated_mon_metrics_df,
+                        GroupingSetsTransformBuilder.
+                        get_record_store_metric_id_lists(
+                            pre_transform_spec_rows,
+                            grouping_sets_families))
 
             #
             # record generator
@@ -346,7 +638,7 @@ class MonMetricsKafkaProcessor(object):
                 validated_mon_metrics_df.metric,
                 validated_mon_metrics_df.event_processing_params,
                 validated_mon_metrics_df.event_type,
-                explode(validated_mon_metrics_df.metric_id_list).alias(
+                explode(metric_id_list_column).alias(
                     "this_metric_id"),
                 validated_mon_metrics_df.service_id)
 
@@ -357,13 +649,17 @@ class MonMetricsKafkaProcessor(object):
             # converting the metric to common standard format helps in writing
             # generic aggregation routines driven by configuration parameters
             #  and can be reused
+            # the aggregation periods of a record are integer epoch buckets,
+            # date and time strings are only formatted for aggregated data
             #
+            event_timestamp_unix = gen_mon_metrics_df.metric.timestamp / 1000
+
+            # local time offset of day and hour buckets, looked up once
+            # for the batch on the driver
+            utc_offset = RecordStoreUtils.get_utc_offset()
+
             record_store_df = gen_mon_metrics_df.select(
-                (gen_mon_metrics_df.metric.timestamp / 1000).alias(
-                    "event_timestamp_unix"),
-                from_unixtime(
-                    gen_mon_metrics_df.metric.timestamp / 1000).alias(
-                    "event_timestamp_string"),
+                event_timestamp_unix.alias("event_timestamp_unix"),
                 gen_mon_metrics_df.event_type.alias("event_type"),
                 gen_mon_metrics_df.event_type.alias("event_quantity_name"),
                 (gen_mon_metrics_df.metric.value / 1.0).alias(
@@ -431,22 +727,22 @@ class MonMetricsKafkaProcessor(object):
                      gen_mon_metrics_df.service_id).otherwise(
                     'NA').alias("service_id"),
 
-                from_unixtime(gen_mon_metrics_df.metric.timestamp / 1000,
-                              'yyyy-MM-dd').alias("event_date"),
-                from_unixtime(gen_mon_metrics_df.metric.timestamp / 1000,
-                              'HH').alias("event_hour"),
-                from_unixtime(gen_mon_metrics_df.metric.timestamp / 1000,
-                              'mm').alias("event_minute"),
-                from_unixtime(gen_mon_metrics_df.metric.timestamp / 1000,
-                              'ss').alias("event_second"),
                 gen_mon_metrics_df.this_metric_id.alias("metric_group"),
-                gen_mon_metrics_df.this_metric_id.alias("metric_id"))
+                gen_mon_metrics_df.this_metric_id.alias("metric_id"),
+                *RecordStoreUtils.get_period_bucket_columns(
+                    event_timestamp_unix, utc_offset))
 
             #
-            # get transform context
+            # only keep the columns which the transform specs refer to,
+            # so that the cached record store and shuffles are smaller.
+            # spark does not compute the columns which are dropped
             #
-            rdd_transform_context = rdd_transform_context_rdd.first()
-            transform_context = rdd_transform_context.transform_context_info
+            if cfg.CONF.service.enable_record_store_column_pruning:
+                record_store_df = record_store_df.select(
+                    MonMetricsKafkaProcessor._get_record_store_columns(
+                        data_driven_specs_repo.get_compiled_transform_specs(
+                            sql_context=sql_context),
+                        record_store_df.columns))
 
             #
             # cache record store rdd
@@ -458,11 +754,76 @@ class MonMetricsKafkaProcessor(object):
                     storage_level_prop)
                 record_store_df.persist(storage_level)
 
+            #
+            # count records by metric_id once, this also fills the record
+            # store cache
+            #
+            batch_stats = MonMetricsKafkaProcessor._get_batch_stats(
+                record_store_df, transform_context.batch_stats_info)
+            transform_context = TransformContextUtils.get_context(
+                transform_context_info=transform_context,
+                batch_stats_info=batch_stats)
+            MonMetricsKafkaProcessor.log_debug(
+                "rdd_to_recordstore: messages: {%s}, records: {%s}, "
+                "metric_ids: {%s}" % (batch_stats.message_count,
+                                      batch_stats.record_count,
+                                      len(batch_stats.metric_id_counts)))
+
+            # batch stats is the first job to evaluate the prefilter, read
+            # the counts before later jobs can evaluate it again
+            if cfg.CONF.service.enable_raw_metric_name_prefilter:
+                MonMetricsKafkaProcessor.log_debug(
+                    "rdd_to_recordstore: raw metric name prefilter: "
+                    "kept: {%s}, dropped: {%s}" % (prefilter_kept.value,
+                                                   prefilter_dropped.value))
+
+            #
+            # size dataframe shuffles for the records of this batch
+            #
+            if cfg.CONF.service.enable_shuffle_partition_tuning:
+                shuffle_partitions = ShuffleUtils.get_shuffle_partitions(
+                    batch_stats.record_count,
+                    cfg.CONF.service.shuffle_target_rows_per_partition,
+                    cfg.CONF.service.shuffle_min_partitions,
+                    cfg.CONF.service.shuffle_max_partitions)
+                ShuffleUtils.set_shuffle_partitions(sql_context,
+                                                    shuffle_partitions)
+                MonMetricsKafkaProcessor.log_debug(
+                    "rdd_to_recordstore: shuffle partitions: {%s}" %
+                    shuffle_partitions)
+
+            #
+            # replace dimension values with integer codes, so that group by
+            # keys are small. codes are decoded before setters and inserts
+            #
+            source_record_store_df = record_store_df
+            if cfg.CONF.service.enable_dimension_encoding:
+                (source_record_store_df,
+                 dimension_encoding) = DimensionEncodingUtils.\
+                    encode_record_store(
+                        sql_context, record_store_df,
+                        MonMetricsKafkaProcessor._get_dimension_dictionary(),
+                        cfg.CONF.service.dimension_encoding_columns)
+                transform_context = TransformContextUtils.get_context(
+                    transform_context_info=transform_context,
+                    dimension_encoding_info=dimension_encoding)
+
             #
             # start processing metrics available in record_store data
             #
             MonMetricsKafkaProcessor.process_metrics(transform_context,
-                                                     record_store_df)
+                                                     source_record_store_df,
+                                                     grouping_sets_families)
+
+            #
+            # merge instance usage of the batch into the hourly state and
+            # publish hours which have closed, while record_store data is
+            # still cached
+            #
+            if HourlyStateProcessor.is_time_to_run(
+                    transform_context.batch_time_info):
+                HourlyStateProcessor.run_processor(
+                    raw_rdd.context, transform_context.batch_time_info)
 
             # remove df from cache
             if cfg.CONF.service.enable_record_store_df_cache:
@@ -479,7 +840,7 @@ class MonMetricsKafkaProcessor(object):
                 transform_context.batch_time_info
 
             MonMetricsKafkaProcessor.save_kafka_offsets(
-                offsets, rdd_transform_context_rdd.context.appName,
+                offsets, raw_rdd.context.appName,
                 batch_time_info)
 
             # call pre hourly processor, if its time to run
@@ -511,13 +872,16 @@ class MonMetricsKafkaProcessor(object):
         # e.g. reduceByKey() or window()
         kvs.transform(
             MonMetricsKafkaProcessor.store_offset_ranges
-        ).foreachRDD(MonMetricsKafkaProcessor.rdd_to_recordstore)
+        ).foreachRDD(MonMetricsKafkaProcessor.process_batch)
 
 
 def invoke():
     # object to keep track of offsets
     ConfigInitializer.basic_config()
 
+    # the hourly state processor replaces the pre hourly processor
+    HourlyStateProcessor.check_config()
+
     # app name
     application_name = "mon_metrics_kafka"
 
@@ -558,15 +922,26 @@ def invoke():
         MonMetricsKafkaProcessor.log_debug(
             "Exception raised during Spark execution : " + str(e))
         # One exception that can occur here is the result of the saved
-        # kafka offsets being obsolete/out of range.  Delete the saved
-        # offsets to improve the chance of success on the next execution.
-
-        # TODO(someone) prevent deleting all offsets for an application,
-        # but just the latest revision
-        MonMetricsKafkaProcessor.log_debug(
-            "Deleting saved offsets for chance of success on next execution")
+        # kafka offsets being obsolete/out of range.
+        if cfg.CONF.repositories.offsets_recovery_mode == "recover":
+            # Only replace offsets of partitions which kafka can no longer
+            # serve, so that the next execution does not replay the topic.
+            MonMetricsKafkaProcessor.log_debug(
+                "Recovering out of range saved offsets for chance of "
+                "success on next execution")
+            OffsetRecovery.recover_offsets(
+                simport.load(cfg.CONF.repositories.offsets)(),
+                application_name,
+                cfg.CONF.messaging.topic,
+                cfg.CONF.messaging.brokers)
+        else:
+            # Delete the saved offsets to improve the chance of success on
+            # the next execution.
+            MonMetricsKafkaProcessor.log_debug(
+                "Deleting saved offsets for chance of success on next "
+                "execution")
 
-        MonMetricsKafkaProcessor.reset_kafka_offsets(application_name)
+            MonMetricsKafkaProcessor.reset_kafka_offsets(application_name)
 
 if __name__ == "__main__":
     invoke()
@@ -15,9 +15,13 @@
 import abc
 import json
 from kafka import KafkaClient
+from kafka.protocol import CODEC_GZIP
+from kafka.protocol import CODEC_NONE
+from kafka.protocol import CODEC_SNAPPY
 from kafka import SimpleProducer
 from oslo_config import cfg
 import simport
+import time
 
 
 class MessageAdapter(object):
@@ -28,43 +32,137 @@ class MessageAdapter(object):
             "Class %s doesn't implement do_send_metric(self, metric)"
             % self.__class__.__name__)
 
+    def do_send_metrics(self, metrics):
+        for metric in metrics:
+            self.do_send_metric(metric)
 
-class KafkaMessageAdapter(MessageAdapter):
+    def do_flush(self):
+        return
 
-    adapter_impl = None
 
-    def __init__(self):
+class KafkaMessageAdapterBase(MessageAdapter):
+    """sends metrics to a kafka topic.
+
+    When messaging.batch_send_enabled is set metrics are buffered and
+    sent many messages per request, once batch_send_size metrics are
+    buffered, once the oldest buffered metric is older than
+    batch_send_linger_seconds, or when do_flush is called at the end of
+    a batch. Messages are compressed with messaging.compression_codec.
+    """
+
+    def __init__(self, topic):
         client_for_writing = KafkaClient(cfg.CONF.messaging.brokers)
-        self.producer = SimpleProducer(client_for_writing)
-        self.topic = cfg.CONF.messaging.topic
+        self.producer = SimpleProducer(
+            client_for_writing,
+            codec=KafkaMessageAdapterBase._get_codec())
+        self.topic = topic
+        self.batch_send_enabled = cfg.CONF.messaging.batch_send_enabled
+        self.batch_send_size = cfg.CONF.messaging.batch_send_size
+        self.batch_send_linger_seconds = \
+            cfg.CONF.messaging.batch_send_linger_seconds
+        self.buffered_messages = []
+        self.buffer_start_time = None
 
     @staticmethod
-    def init():
-        # object to keep track of offsets
-        KafkaMessageAdapter.adapter_impl = simport.load(
-            cfg.CONF.messaging.adapter)()
+    def _get_codec():
+        codecs = {"none": CODEC_NONE,
+                  "gzip": CODEC_GZIP,
+                  "snappy": CODEC_SNAPPY}
+        codec_name = cfg.CONF.messaging.compression_codec
+        if codec_name not in codecs:
+            raise ValueError(
+                "Compression codec %s is not supported" % codec_name)
+        return codecs[codec_name]
+
+    @staticmethod
+    def _get_message(metric):
+        return json.dumps(metric, separators=(',', ':'))
+
+    def _is_buffer_full(self):
+        if len(self.buffered_messages) >= self.batch_send_size:
+            return True
+        if self.batch_send_linger_seconds > 0 and \
+                time.time() - self.buffer_start_time >= \
+                self.batch_send_linger_seconds:
+            return True
+        return False
 
     def do_send_metric(self, metric):
+        if not self.batch_send_enabled:
+            self.producer.send_messages(
+                self.topic,
+                KafkaMessageAdapterBase._get_message(metric))
+            return
+
+        if not self.buffered_messages:
+            self.buffer_start_time = time.time()
+        self.buffered_messages.append(
+            KafkaMessageAdapterBase._get_message(metric))
+        if self._is_buffer_full():
+            self.do_flush()
+        return
+
+    def do_send_metrics(self, metrics):
+        if self.batch_send_enabled:
+            for metric in metrics:
+                self.do_send_metric(metric)
+            return
+
+        # send all metrics in a single request
         self.producer.send_messages(
             self.topic,
-            json.dumps(metric, separators=(',', ':')))
+            *[KafkaMessageAdapterBase._get_message(metric)
+              for metric in metrics])
+        return
+
+    def do_flush(self):
+        """send all buffered messages in a single request."""
+        if self.buffered_messages:
+            buffered_messages = self.buffered_messages
+            self.buffered_messages = []
+            self.buffer_start_time = None
+            self.producer.send_messages(self.topic, *buffered_messages)
         return
 
+
+class KafkaMessageAdapter(KafkaMessageAdapterBase):
+
+    adapter_impl = None
+
+    def __init__(self):
+        super(KafkaMessageAdapter, self).__init__(cfg.CONF.messaging.topic)
+
+    @staticmethod
+    def init():
+        # object to keep track of offsets
+        KafkaMessageAdapter.adapter_impl = simport.load(
+            cfg.CONF.messaging.adapter)()
+
     @staticmethod
     def send_metric(metric):
         if not KafkaMessageAdapter.adapter_impl:
             KafkaMessageAdapter.init()
         KafkaMessageAdapter.adapter_impl.do_send_metric(metric)
 
+    @staticmethod
+    def send_metrics(metrics):
+        if not KafkaMessageAdapter.adapter_impl:
+            KafkaMessageAdapter.init()
+        KafkaMessageAdapter.adapter_impl.do_send_metrics(metrics)
+
+    @staticmethod
+    def flush():
+        if KafkaMessageAdapter.adapter_impl:
+            KafkaMessageAdapter.adapter_impl.do_flush()
+
 
-class KafkaMessageAdapterPreHourly(MessageAdapter):
+class KafkaMessageAdapterPreHourly(KafkaMessageAdapterBase):
 
     adapter_impl = None
 
     def __init__(self):
-        client_for_writing = KafkaClient(cfg.CONF.messaging.brokers)
-        self.producer = SimpleProducer(client_for_writing)
-        self.topic = cfg.CONF.messaging.topic_pre_hourly
+        super(KafkaMessageAdapterPreHourly, self).__init__(
+            cfg.CONF.messaging.topic_pre_hourly)
 
     @staticmethod
     def init():
@@ -72,14 +170,19 @@ class KafkaMessageAdapterPreHourly(MessageAdapter):
         KafkaMessageAdapterPreHourly.adapter_impl = simport.load(
             cfg.CONF.messaging.adapter_pre_hourly)()
 
-    def do_send_metric(self, metric):
-        self.producer.send_messages(
-            self.topic,
-            json.dumps(metric, separators=(',', ':')))
-        return
-
     @staticmethod
     def send_metric(metric):
         if not KafkaMessageAdapterPreHourly.adapter_impl:
             KafkaMessageAdapterPreHourly.init()
         KafkaMessageAdapterPreHourly.adapter_impl.do_send_metric(metric)
+
+    @staticmethod
+    def send_metrics(metrics):
+        if not KafkaMessageAdapterPreHourly.adapter_impl:
+            KafkaMessageAdapterPreHourly.init()
+        KafkaMessageAdapterPreHourly.adapter_impl.do_send_metrics(metrics)
+
+    @staticmethod
+    def flush():
+        if KafkaMessageAdapterPreHourly.adapter_impl:
+            KafkaMessageAdapterPreHourly.adapter_impl.do_flush()
@@ -94,6 +94,15 @@ class MySQLOffsetSpecs(OffsetSpecs):
             MySQLOffsetSpec.app_name == app_name,
             MySQLOffsetSpec.revision == 1).all()}
 
+    def get_kafka_offset_revisions(self, app_name):
+        revisions = {}
+        for offset in self.session.query(MySQLOffsetSpec).filter(
+                MySQLOffsetSpec.app_name == app_name).all():
+            revisions.setdefault(offset.get_revision(), {})[
+                '%s_%s_%s' % (offset.get_app_name(), offset.get_topic(),
+                              offset.get_partition())] = offset
+        return [revisions[revision] for revision in sorted(revisions)]
+
     def delete_all_kafka_offsets(self, app_name):
         try:
             self.session.query(MySQLOffsetSpec).filter(
@@ -0,0 +1,130 @@
+# Copyright 2016 Hewlett Packard Enterprise Development Company LP
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import datetime
+import logging
+
+from pyspark.streaming.kafka import OffsetRange
+
+from monasca_transform.processor.pre_hourly_processor import \
+    PreHourlyProcessor
+
+log = logging.getLogger(__name__)
+
+
+class OffsetRecovery(object):
+    """Repair saved offsets which kafka can no longer serve.
+
+    Instead of deleting all offsets of an application, the until_offset
+    of each partition is compared with the earliest and latest offsets
+    available in kafka. A partition whose latest revision is in range is
+    kept. Otherwise the most recent older revision which is in range is
+    used, and if there is none the offset is clamped to the available
+    range. Partitions without saved offsets start at the earliest offset.
+    """
+
+    GET_LATEST_OFFSETS = -1
+
+    GET_EARLIEST_OFFSETS = -2
+
+    @staticmethod
+    def _get_partition_bounds(brokers, topic):
+        """get a dict of partition to (earliest, latest) offset"""
+        latest_dict = PreHourlyProcessor._get_offsets_from_kafka(
+            brokers, topic, OffsetRecovery.GET_LATEST_OFFSETS)
+        earliest_dict = PreHourlyProcessor._get_offsets_from_kafka(
+            brokers, topic, OffsetRecovery.GET_EARLIEST_OFFSETS)
+
+        partition_bounds = {}
+        for item in latest_dict:
+            partition_bounds[latest_dict[item].partition] = \
+                (earliest_dict[item].offsets[0],
+                 latest_dict[item].offsets[0])
+        return partition_bounds
+
+    @staticmethod
+    def _get_saved_until_offsets(app_name, topic, offset_revisions):
+        """get a dict of partition to the list of until offsets saved in
+        each revision, latest revision first
+        """
+        saved_until_offsets = {}
+        for offset_revision in offset_revisions:
+            for key, value in offset_revision.items():
+                if not key.startswith("%s_%s" % (app_name, topic)):
+                    continue
+                until_offset = value.get_until_offset()
+                if until_offset is None or int(until_offset) < 0:
+                    continue
+                saved_until_offsets.setdefault(
+                    int(value.get_partition()), []).append(int(until_offset))
+        return saved_until_offsets
+
+    @staticmethod
+    def choose_offsets(partition_bounds, saved_until_offsets):
+        """get a dict of partition to the offset processing restarts from
+        and the dict of partitions whose latest saved offset was changed
+        """
+        chosen_offsets = {}
+        changed_partitions = {}
+        for partition, (earliest, latest) in partition_bounds.items():
+            until_offsets = saved_until_offsets.get(partition, [])
+            if until_offsets and earliest <= until_offsets[0] <= latest:
+                # latest revision is fine
+                chosen_offsets[partition] = until_offsets[0]
+                continue
+
+            in_range_offsets = [until_offset for until_offset
+                                in until_offsets
+                                if earliest <= until_offset <= latest]
+            if in_range_offsets:
+                # fall back to an older revision
+                chosen_offset = in_range_offsets[0]
+            elif until_offsets:
+                # clamp to the offsets kafka still has
+                chosen_offset = max(earliest, min(until_offsets[0], latest))
+            else:
+                chosen_offset = earliest
+            chosen_offsets[partition] = chosen_offset
+            changed_partitions[partition] = chosen_offset
+        return chosen_offsets, changed_partitions
+
+    @staticmethod
+    def recover_offsets(offset_specs, app_name, topic, brokers):
+        """save a new revision of offsets which are in the range kafka can
+        serve, if any partition's offset is out of range
+        """
+        offset_revisions = offset_specs.get_kafka_offset_revisions(app_name)
+        saved_until_offsets = OffsetRecovery._get_saved_until_offsets(
+            app_name, topic, offset_revisions)
+        partition_bounds = OffsetRecovery._get_partition_bounds(brokers,
+                                                                topic)
+
+        (chosen_offsets,
+         changed_partitions) = OffsetRecovery.choose_offsets(
+            partition_bounds, saved_until_offsets)
+
+        for partition, offset in changed_partitions.items():
+            log.info("Recovering offset of %s partition %s: saved: %s, "
+                     "available: %s, restarting from: %s" % (
+                         topic, partition,
+                         saved_until_offsets.get(partition, [None])[0],
+                         partition_bounds[partition], offset))
+
+        if changed_partitions:
+            offset_specs.add_all_offsets(
+                app_name,
+                [OffsetRange(topic, partition, offset, offset)
+                 for partition, offset in chosen_offsets.items()],
+                datetime.datetime.now())
+        return chosen_offsets
@@ -92,6 +92,12 @@ class OffsetSpecs(object):
             "Class %s doesn't implement get_kafka_offsets()"
             % self.__class__.__name__)
 
+    def get_kafka_offset_revisions(self, app_name):
+        """get the saved offsets of each revision, latest revision first.
+        Only the latest revision is available unless this is overridden.
+        """
+        return [self.get_kafka_offsets(app_name)]
+
     @abc.abstractmethod
     def delete_all_kafka_offsets(self, app_name):
         raise NotImplementedError(
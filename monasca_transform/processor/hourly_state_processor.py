@@ -0,0 +1,285 @@
+# Copyright 2016 Hewlett Packard Enterprise Development Company LP
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import logging
+
+from oslo_config import cfg
+from pyspark.sql import functions
+from pyspark.sql.functions import from_unixtime
+from pyspark.sql.functions import lit
+from pyspark.sql import SQLContext
+from pyspark.sql.types import DoubleType
+from pyspark.sql.types import StringType
+from pyspark.sql.types import StructField
+from pyspark.sql.types import StructType
+
+from monasca_transform.component.insert.kafka_insert_pre_hourly \
+    import KafkaInsertPreHourly
+from monasca_transform.component.setter.rollup_quantity import RollupQuantity
+from monasca_transform.processor import Processor
+from monasca_transform.processor.pre_hourly_processor import \
+    PreHourlyProcessor
+from monasca_transform.transform.transform_utils import InstanceUsageUtils
+
+LOG = logging.getLogger(__name__)
+
+
+class HourlyStateProcessorException(Exception):
+    """Exception thrown when the hourly state processor is misconfigured
+    Attributes:
+    value: string representing the error
+    """
+
+    def __init__(self, value):
+        self.value = value
+
+    def __str__(self):
+        return repr(self.value)
+
+
+class HourlyStateProcessor(Processor):
+    """Processor which keeps a running hourly aggregate in the streaming
+    driver, instead of publishing instance usage to metrics_pre_hourly
+    and reading it back at the top of the hour.
+
+    Instance usage of each batch is merged into state keyed by metric_id,
+    instance usage group and period. The state holds the partial aggregate
+    state of quantity, so merging is exact. Keys whose hour has closed are
+    rolled up with the pre hourly group by and operation of their
+    transform spec, published, and removed from the state.
+
+    The state is checkpointed as parquet after every batch, which also
+    truncates its lineage, and the latest checkpoint is loaded when the
+    driver starts. Batches without messages still close hours, but the
+    state is only checkpointed again once it has changed.
+
+    The processor replaces the pre hourly processor, the two cannot be
+    enabled together.
+    """
+
+    # instance usage columns which are not part of the state key
+    _NON_KEY_COLUMNS = ["firstrecord_timestamp_string",
+                        "lastrecord_timestamp_string"]
+
+    state_df = None
+
+    # hour of the last run, closed hours have been published up to it
+    state_hour = None
+
+    @staticmethod
+    def log_debug(message):
+        LOG.debug(message)
+
+    @staticmethod
+    def get_app_name():
+        """get name of this application."""
+        return "mon_metrics_kafka_hourly_state"
+
+    @staticmethod
+    def is_time_to_run(check_time):
+        """return True if its time to run this processor. State is
+        updated with every batch.
+        """
+        return cfg.CONF.stage_processors.hourly_state_processor_enabled
+
+    @staticmethod
+    def check_config():
+        """raise an exception if the pre hourly processor is enabled as
+        well. Partial rollups it carries forward would be merged into the
+        state instead of being published.
+        """
+        if (cfg.CONF.stage_processors.hourly_state_processor_enabled and
+                cfg.CONF.stage_processors.pre_hourly_processor_enabled):
+            raise HourlyStateProcessorException(
+                "hourly_state_processor_enabled requires "
+                "pre_hourly_processor_enabled to be False")
+
+    @staticmethod
+    def _get_key_columns():
+        """get the columns which key the state"""
+        schema = InstanceUsageUtils._get_instance_usage_schema()
+        return [field.name for field in schema.fields
+                if isinstance(field.dataType, StringType) and
+                field.name not in HourlyStateProcessor._NON_KEY_COLUMNS] + \
+            ["metric_id"]
+
+    @staticmethod
+    def _get_state_schema():
+        """get state schema."""
+        columns_struct_fields = [
+            StructField(field_name, StringType(), True)
+            for field_name in HourlyStateProcessor._get_key_columns()]
+        columns_struct_fields.extend(
+            [StructField(field_name, DoubleType(), True) for field_name in
+             ["firstrecord_timestamp_unix", "lastrecord_timestamp_unix",
+              "record_count"] + InstanceUsageUtils.PARTIAL_STATE_FIELDS])
+        return StructType(columns_struct_fields)
+
+    @staticmethod
+    def _to_state_df(metric_id, instance_usage_df):
+        """convert instance usage of a transform spec to state rows"""
+        state_columns = RollupQuantity._get_partial_state_columns(
+            instance_usage_df, True)
+        select_columns = []
+        for field in HourlyStateProcessor._get_state_schema().fields:
+            if field.name == "metric_id":
+                column = lit(metric_id)
+            elif field.name in state_columns:
+                column = state_columns[field.name]
+            else:
+                column = instance_usage_df[field.name]
+            select_columns.append(
+                column.cast(field.dataType).alias(field.name))
+        return instance_usage_df.select(*select_columns)
+
+    @staticmethod
+    def _merge_state(state_df):
+        """merge state rows with the same key"""
+        agg_columns = [
+            functions.min(state_df.firstrecord_timestamp_unix).alias(
+                "firstrecord_timestamp_unix"),
+            functions.max(state_df.lastrecord_timestamp_unix).alias(
+                "lastrecord_timestamp_unix"),
+            functions.sum(state_df.record_count).alias("record_count"),
+            functions.sum(state_df.quantity_sum).alias("quantity_sum"),
+            functions.sum(state_df.quantity_count).alias("quantity_count"),
+            functions.min(state_df.quantity_min).alias("quantity_min"),
+            functions.max(state_df.quantity_max).alias("quantity_max")]
+        return state_df.groupBy(
+            *HourlyStateProcessor._get_key_columns()).agg(*agg_columns)
+
+    @staticmethod
+    def _get_closed_condition(state_df, batch_time):
+        """get condition for state whose hour, or day for daily
+        aggregation, is before the hour of the batch
+        """
+        batch_date = batch_time.strftime('%Y-%m-%d')
+        batch_hour = batch_time.strftime('%H')
+        return (state_df.usage_date < batch_date) | \
+            ((state_df.usage_date == batch_date) &
+             (state_df.usage_hour < batch_hour))
+
+    @staticmethod
+    def _emit_state(state_df):
+        """roll up closed state with the pre hourly group by and operation
+        of each transform spec and write results to metrics topic in kafka
+        """
+        instance_usage_df = state_df.select(
+            "*",
+            from_unixtime(state_df.firstrecord_timestamp_unix).alias(
+                "firstrecord_timestamp_string"),
+            from_unixtime(state_df.lastrecord_timestamp_unix).alias(
+                "lastrecord_timestamp_string"),
+            lit(None).cast(DoubleType()).alias("quantity"))
+        PreHourlyProcessor.do_transform_by_metric_id(
+            instance_usage_df, instance_usage_df.metric_id)
+
+    @staticmethod
+    def _get_file_system(spark_context, path):
+        """get hadoop file system of a path"""
+        hadoop_path = spark_context._jvm.org.apache.hadoop.fs.Path(path)
+        return hadoop_path.getFileSystem(
+            spark_context._jsc.hadoopConfiguration())
+
+    @staticmethod
+    def _get_checkpoint_paths(spark_context):
+        """get paths of completed state checkpoints, oldest first"""
+        checkpoint_dir = cfg.CONF.hourly_state_processor.state_checkpoint_dir
+        jvm_path = spark_context._jvm.org.apache.hadoop.fs.Path
+        file_system = HourlyStateProcessor._get_file_system(spark_context,
+                                                            checkpoint_dir)
+        if not file_system.exists(jvm_path(checkpoint_dir)):
+            return []
+
+        checkpoint_paths = []
+        for file_status in file_system.listStatus(jvm_path(checkpoint_dir)):
+            path = file_status.getPath()
+            if file_system.exists(jvm_path(path, "_SUCCESS")):
+                checkpoint_paths.append(path.toString())
+        # checkpoints are named by batch time
+        return sorted(checkpoint_paths)
+
+    @staticmethod
+    def _load_state(sql_context):
+        """load state from the latest checkpoint"""
+        schema = HourlyStateProcessor._get_state_schema()
+        checkpoint_paths = HourlyStateProcessor._get_checkpoint_paths(
+            sql_context._sc)
+        if not checkpoint_paths:
+            return sql_context.createDataFrame(
+                sql_context._sc.emptyRDD(), schema)
+
+        HourlyStateProcessor.log_debug(
+            "Loading hourly state from %s" % checkpoint_paths[-1])
+        return sql_context.read.schema(schema).parquet(checkpoint_paths[-1])
+
+    @staticmethod
+    def _save_state(sql_context, state_df, batch_time):
+        """checkpoint state, remove older checkpoints and return the state
+        read back from the checkpoint
+        """
+        checkpoint_path = "%s/%s" % (
+            cfg.CONF.hourly_state_processor.state_checkpoint_dir,
+            batch_time.strftime('%Y%m%d%H%M%S'))
+        state_df.write.mode("overwrite").parquet(checkpoint_path)
+
+        spark_context = sql_context._sc
+        jvm_path = spark_context._jvm.org.apache.hadoop.fs.Path
+        saved_path = jvm_path(checkpoint_path).toString()
+        for path in HourlyStateProcessor._get_checkpoint_paths(
+                spark_context):
+            if path != saved_path:
+                HourlyStateProcessor._get_file_system(
+                    spark_context, path).delete(jvm_path(path), True)
+
+        return sql_context.read.schema(
+            HourlyStateProcessor._get_state_schema()).parquet(
+            checkpoint_path)
+
+    @staticmethod
+    def run_processor(spark_context, processing_time):
+        """merge instance usage of the batch into the state, publish
+        hours which have closed and checkpoint the remaining state
+        """
+        sql_context = SQLContext.getOrCreate(spark_context)
+
+        if HourlyStateProcessor.state_df is None:
+            HourlyStateProcessor.state_df = HourlyStateProcessor._load_state(
+                sql_context)
+
+        # instance usage kept by the pre hourly insert in this batch
+        batch_instance_usage = KafkaInsertPreHourly.batch_instance_usage
+        KafkaInsertPreHourly.batch_instance_usage = []
+
+        processing_hour = processing_time.strftime('%Y-%m-%d %H')
+        if (not batch_instance_usage and
+                HourlyStateProcessor.state_hour == processing_hour):
+            # no hour has closed since the last run
+            return
+
+        state_df = HourlyStateProcessor.state_df
+        for (metric_id, instance_usage_df) in batch_instance_usage:
+            state_df = state_df.unionAll(HourlyStateProcessor._to_state_df(
+                metric_id, instance_usage_df))
+        state_df = HourlyStateProcessor._merge_state(state_df)
+        state_df.persist()
+
+        closed_condition = HourlyStateProcessor._get_closed_condition(
+            state_df, processing_time)
+        HourlyStateProcessor._emit_state(state_df.where(closed_condition))
+
+        HourlyStateProcessor.state_df = HourlyStateProcessor._save_state(
+            sql_context, state_df.where(~closed_condition), processing_time)
+        HourlyStateProcessor.state_hour = processing_hour
+        state_df.unpersist()
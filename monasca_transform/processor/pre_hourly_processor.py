@@ -20,17 +20,24 @@ from pyspark.streaming.kafka import OffsetRange
 
 import datetime
 import logging
+import math
 from oslo_config import cfg
 import simport
+import time
 
 
 from monasca_transform.component.insert.kafka_insert import KafkaInsert
+from monasca_transform.component.insert.kafka_insert_pre_hourly \
+    import KafkaInsertPreHourly
 from monasca_transform.component.setter.rollup_quantity import RollupQuantity
 from monasca_transform.data_driven_specs.data_driven_specs_repo \
     import DataDrivenSpecsRepo
 from monasca_transform.data_driven_specs.data_driven_specs_repo \
     import DataDrivenSpecsRepoFactory
+from monasca_transform.data_driven_specs.transform_spec \
+    import TransformSpecCompiler
 from monasca_transform.processor import Processor
+from monasca_transform.transform.shuffle_utils import ShuffleUtils
 from monasca_transform.transform.storage_utils import StorageUtils
 from monasca_transform.transform.transform_utils import InstanceUsageUtils
 from monasca_transform.transform import TransformContextUtils
@@ -156,8 +163,24 @@ class PreHourlyProcessor(Processor):
         return offset_dict
 
     @staticmethod
-    def _get_new_offset_range_list(brokers, topic):
-        """get offset range from earliest to latest."""
+    def _get_lookback_offsets_from_kafka(brokers, topic, lookback_hours):
+        """get dict representing kafka offsets at the start of the look
+        back period, or None if there is no look back period.
+        """
+        if not lookback_hours or lookback_hours <= 0:
+            return None
+
+        # offset request times are in milliseconds
+        lookback_time = int((time.time() - lookback_hours * 3600) * 1000)
+        return PreHourlyProcessor._get_offsets_from_kafka(brokers, topic,
+                                                          lookback_time)
+
+    @staticmethod
+    def _get_new_offset_range_list(brokers, topic, lookback_hours=None):
+        """get offset range from earliest to latest. If lookback_hours is
+        set, the range starts at the offsets kafka has for that many hours
+        ago instead of the earliest.
+        """
         offset_range_list = []
 
         # https://cwiki.apache.org/confluence/display/KAFKA/
@@ -173,9 +196,19 @@ class PreHourlyProcessor(Processor):
             _get_offsets_from_kafka(brokers, topic,
                                     GET_EARLIEST_OFFSETS)
 
+        lookback_dict = PreHourlyProcessor.\
+            _get_lookback_offsets_from_kafka(brokers, topic, lookback_hours)
+
         for item in latest_dict:
             until_offset = latest_dict[item].offsets[0]
             from_offset = earliest_dict[item].offsets[0]
+            # kafka returns no offset when the look back time is before the
+            # oldest log segment, then the earliest offset is used
+            if lookback_dict is not None and \
+                    item in lookback_dict and lookback_dict[item].offsets:
+                from_offset = max(from_offset,
+                                  min(lookback_dict[item].offsets[0],
+                                      until_offset))
             partition = latest_dict[item].partition
             topic = latest_dict[item].topic
             offset_range_list.append(OffsetRange(topic,
@@ -242,7 +275,8 @@ class PreHourlyProcessor(Processor):
         range will last from the last saved offsets to current offsets
         available. If there are no last saved offsets available in the
         database the starting offsets will be set to the earliest
-        available in kafka.
+        available in kafka, or to the start of the configured look back
+        period.
         """
 
         offset_specifications = simport.load(cfg.CONF.repositories.offsets)()
@@ -261,11 +295,13 @@ class PreHourlyProcessor(Processor):
             PreHourlyProcessor.log_debug(
                 "No saved offsets available..."
                 "connecting to kafka and fetching "
-                "from earliest available offset ...")
+                "from earliest available offset or from look back "
+                "period ...")
 
             offset_range_list = PreHourlyProcessor._get_new_offset_range_list(
                 cfg.CONF.messaging.brokers,
-                topic)
+                topic,
+                cfg.CONF.pre_hourly_processor.first_run_lookback_hours)
         else:
             PreHourlyProcessor.log_debug(
                 "Saved offsets available..."
@@ -278,6 +314,34 @@ class PreHourlyProcessor(Processor):
                 saved_offset_spec)
         return offset_range_list
 
+    @staticmethod
+    def get_offset_range_chunks(offset_range_list, max_messages_per_chunk):
+        """split an offset range list into a list of chunks, each an
+        offset range list with at most max_messages_per_chunk messages
+        for each partition. Every chunk has a range for every partition,
+        so that the offsets of each chunk can be saved.
+        """
+        if not max_messages_per_chunk or max_messages_per_chunk <= 0:
+            return [offset_range_list]
+
+        num_chunks = max([int(math.ceil(
+            float(o.untilOffset - o.fromOffset) / max_messages_per_chunk))
+            for o in offset_range_list] + [1])
+
+        chunk_list = []
+        for chunk_index in range(num_chunks):
+            chunk = []
+            for o in offset_range_list:
+                from_offset = min(
+                    o.fromOffset + chunk_index * max_messages_per_chunk,
+                    o.untilOffset)
+                until_offset = min(from_offset + max_messages_per_chunk,
+                                   o.untilOffset)
+                chunk.append(OffsetRange(o.topic, o.partition,
+                                         from_offset, until_offset))
+            chunk_list.append(chunk)
+        return chunk_list
+
     @staticmethod
     def fetch_pre_hourly_data(spark_context,
                               offset_range_list):
@@ -311,20 +375,21 @@ class PreHourlyProcessor(Processor):
         return instance_usage_df
 
     @staticmethod
-    def process_instance_usage(transform_context, instance_usage_df):
+    def process_instance_usage(transform_context, instance_usage_df,
+                               carry_forward=False):
         """second stage aggregation. Aggregate instance usage rdd
-        data and write results to metrics topic in kafka.
+        data and write results to metrics topic in kafka. With
+        carry_forward the results are partial rollups, which are written
+        back to metrics_pre_hourly to be rolled up once all chunks are done.
         """
 
-        transform_spec_df = transform_context.transform_spec_df_info
+        transform_spec = TransformSpecCompiler.get_transform_spec(
+            transform_context)
 
         #
         # do a rollup operation
         #
-        agg_params = transform_spec_df.select(
-            "aggregation_params_map.pre_hourly_group_by_list")\
-            .collect()[0].asDict()
-        pre_hourly_group_by_list = agg_params["pre_hourly_group_by_list"]
+        pre_hourly_group_by_list = transform_spec.pre_hourly_group_by_list
 
         if (len(pre_hourly_group_by_list) == 1 and
                 pre_hourly_group_by_list[0] == "default"):
@@ -336,35 +401,46 @@ class PreHourlyProcessor(Processor):
                                         "aggregation_period"]
 
         # get aggregation period
-        agg_params = transform_spec_df.select(
-            "aggregation_params_map.aggregation_period").collect()[0].asDict()
-        aggregation_period = agg_params["aggregation_period"]
+        aggregation_period = transform_spec.aggregation_period
 
         # get 2stage operation
-        agg_params = transform_spec_df.select(
-            "aggregation_params_map.pre_hourly_operation")\
-            .collect()[0].asDict()
-        pre_hourly_operation = agg_params["pre_hourly_operation"]
+        pre_hourly_operation = transform_spec.pre_hourly_operation
 
         instance_usage_df = \
             RollupQuantity.do_rollup(pre_hourly_group_by_list,
                                      aggregation_period,
                                      pre_hourly_operation,
-                                     instance_usage_df)
+                                     instance_usage_df,
+                                     with_partial_state=carry_forward)
+        if carry_forward:
+            # insert partial rollups
+            return KafkaInsertPreHourly.insert(transform_context,
+                                               instance_usage_df)
+
         # insert metrics
         instance_usage_df = KafkaInsert.insert(transform_context,
                                                instance_usage_df)
         return instance_usage_df
 
     @staticmethod
-    def do_transform(instance_usage_df):
+    def do_transform(instance_usage_df, carry_forward=False):
         """start processing (aggregating) metrics
         """
+        PreHourlyProcessor.do_transform_by_metric_id(
+            instance_usage_df, instance_usage_df.processing_meta.metric_id,
+            carry_forward=carry_forward)
+
+    @staticmethod
+    def do_transform_by_metric_id(instance_usage_df, metric_id_column,
+                                  carry_forward=False):
+        """process (aggregate) instance usage of each transform spec, the
+        transform spec metric id is read from metric_id_column
+        """
         #
         # look in instance_usage_df for list of metrics to be processed
         #
         metric_ids_df = instance_usage_df.select(
-            "processing_meta.metric_id").distinct()
+            metric_id_column.alias("metric_id")).distinct()
         metric_ids_to_process = [row.metric_id
                                  for row in metric_ids_df.collect()]
 
@@ -374,32 +450,30 @@ class PreHourlyProcessor(Processor):
         transform_specs_df = data_driven_specs_repo.get_data_driven_specs(
             sql_context=sqlc,
             data_driven_spec_type=DataDrivenSpecsRepo.transform_specs_type)
+        transform_specs = data_driven_specs_repo.\
+            get_compiled_transform_specs(sql_context=sqlc)
 
         for metric_id in metric_ids_to_process:
             transform_spec_df = transform_specs_df.select(
                 ["aggregation_params_map", "metric_id"]
             ).where(transform_specs_df.metric_id == metric_id)
             source_instance_usage_df = instance_usage_df.select("*").where(
-                instance_usage_df.processing_meta.metric_id == metric_id)
+                metric_id_column == metric_id)
 
             # set transform_spec_df in TransformContext
             transform_context = \
                 TransformContextUtils.get_context(
-                    transform_spec_df_info=transform_spec_df)
+                    transform_spec_df_info=transform_spec_df,
+                    transform_spec_info=transform_specs.get(metric_id))
 
             PreHourlyProcessor.process_instance_usage(
-                transform_context, source_instance_usage_df)
+                transform_context, source_instance_usage_df,
+                carry_forward=carry_forward)
 
     @staticmethod
-    def run_processor(spark_context, processing_time):
-        """process data in metrics_pre_hourly queue, starting
-           from the last saved offsets, else start from earliest
-           offsets available
-           """
-
-        offset_range_list = \
-            PreHourlyProcessor.get_processing_offset_range_list(
-                processing_time)
+    def process_offset_range_list(spark_context, offset_range_list,
+                                  carry_forward=False):
+        """aggregate pre hourly data in an offset range list"""
 
         # get pre hourly data
         pre_hourly_rdd = PreHourlyProcessor.fetch_pre_hourly_data(
@@ -409,6 +483,26 @@ class PreHourlyProcessor(Processor):
         instance_usage_df = PreHourlyProcessor.pre_hourly_to_instance_usage_df(
             pre_hourly_rdd)
 
+        #
+        # size dataframe shuffles for the number of instance usage
+        # messages, which is known from the offsets
+        #
+        if cfg.CONF.service.enable_shuffle_partition_tuning:
+            message_count = sum(offset_range.untilOffset -
+                                offset_range.fromOffset
+                                for offset_range in offset_range_list)
+            shuffle_partitions = ShuffleUtils.get_shuffle_partitions(
+                message_count,
+                cfg.CONF.service.shuffle_target_rows_per_partition,
+                cfg.CONF.service.shuffle_min_partitions,
+                cfg.CONF.service.shuffle_max_partitions)
+            ShuffleUtils.set_shuffle_partitions(
+                SQLContext.getOrCreate(spark_context), shuffle_partitions)
+            PreHourlyProcessor.log_debug(
+                "process_offset_range_list: messages: {%s}, shuffle "
+                "partitions: {%s}" % (
+                    message_count, shuffle_partitions))
+
         #
         # cache instance usage df
         #
@@ -420,13 +514,65 @@ class PreHourlyProcessor(Processor):
                 storage_level_prop)
             instance_usage_df.persist(storage_level)
 
-        # aggregate pre hourly data
-        PreHourlyProcessor.do_transform(instance_usage_df)
+        try:
+            # aggregate pre hourly data
+            PreHourlyProcessor.do_transform(instance_usage_df,
+                                            carry_forward=carry_forward)
+        finally:
+            # shuffle partitions are set on the shared sql context, later
+            # jobs use the configured value again
+            if cfg.CONF.service.enable_shuffle_partition_tuning:
+                ShuffleUtils.reset_shuffle_partitions(
+                    SQLContext.getOrCreate(spark_context))
 
         # remove cache
         if cfg.CONF.pre_hourly_processor.enable_instance_usage_df_cache:
             instance_usage_df.unpersist()
 
+    @staticmethod
+    def run_processor(spark_context, processing_time):
+        """process data in metrics_pre_hourly queue, starting
+           from the last saved offsets, else start from earliest
+           offsets available
+           """
+
+        offset_range_list = \
+            PreHourlyProcessor.get_processing_offset_range_list(
+                processing_time)
+
+        chunk_list = PreHourlyProcessor.get_offset_range_chunks(
+            offset_range_list,
+            cfg.CONF.pre_hourly_processor.max_messages_per_chunk)
+
+        if len(chunk_list) > 1:
+            #
+            # a backlog is rolled up one chunk at a time. Partial rollups
+            # of each chunk are written back to metrics_pre_hourly and its
+            # offsets are saved, so a failure does not start over.
+            #
+            for chunk_index, chunk in enumerate(chunk_list):
+                PreHourlyProcessor.log_debug(
+                    "run_processor: chunk: {%s} of {%s}" % (
+                        chunk_index + 1, len(chunk_list)))
+                PreHourlyProcessor.process_offset_range_list(
+                    spark_context, chunk, carry_forward=True)
+                PreHourlyProcessor.save_kafka_offsets(chunk,
+                                                      processing_time)
+
+            #
+            # the partials of all chunks follow the saved offsets, merge
+            # them in a final rollup and publish the results in this run
+            #
+            offset_range_list = \
+                PreHourlyProcessor.get_processing_offset_range_list(
+                    processing_time)
+            PreHourlyProcessor.log_debug(
+                "run_processor: rolling up partials of {%s} chunks" %
+                len(chunk_list))
+
+        PreHourlyProcessor.process_offset_range_list(spark_context,
+                                                     offset_range_list)
+
         # save latest metrics_pre_hourly offsets in the database
         PreHourlyProcessor.save_kafka_offsets(offset_range_list,
                                               processing_time)
@@ -19,7 +19,10 @@ TransformContextBase = namedtuple("TransformContext",
                                   ["config_info",
                                    "offset_info",
                                    "transform_spec_df_info",
-                                   "batch_time_info"])
+                                   "batch_time_info",
+                                   "transform_spec_info",
+                                   "dimension_encoding_info",
+                                   "batch_stats_info"])
 
 
 class TransformContext(TransformContextBase):
@@ -34,20 +37,32 @@ class TransformContext(TransformContextBase):
     transform_spec_df - processing information from
                         transform_spec aggregation driver table
     batch_datetime_info -  current batch processing datetime
+    transform_spec_info - compiled TransformSpec for transform_spec_df,
+                          read by components instead of transform_spec_df
+    dimension_encoding_info - DimensionEncoding of the record store, None
+                              if dimension values are not encoded
+    batch_stats_info - BatchStats of the current batch
     """
 
-RddTransformContextBase = namedtuple("RddTransformContext",
-                                     ["rdd_info",
-                                      "transform_context_info"])
 
+BatchStatsBase = namedtuple("BatchStats",
+                            ["message_count",
+                             "record_count",
+                             "metric_id_counts"])
 
-class RddTransformContext(RddTransformContextBase):
-    """A tuple which is a wrapper containing the RDD and transform_context
 
-    namdetuple contains:
+class BatchStats(BatchStatsBase):
+    """A tuple which contains statistics of a batch, gathered once and
+    reused by all processing of the batch
 
-    rdd_info - rdd
-    transform_context_info - transform context
+    namedtuple contains:
+
+    message_count - number of kafka messages in the batch, from the
+                    offset ranges
+    record_count - number of record store records, None until the record
+                   store is built
+    metric_id_counts - dict of metric_id to number of record store
+                       records, None until the record store is built
     """
 
 
@@ -59,13 +74,19 @@ class TransformContextUtils(object):
                     config_info=None,
                     offset_info=None,
                     transform_spec_df_info=None,
-                    batch_time_info=None):
+                    batch_time_info=None,
+                    transform_spec_info=None,
+                    dimension_encoding_info=None,
+                    batch_stats_info=None):
 
         if transform_context_info is None:
             return TransformContext(config_info,
                                     offset_info,
                                     transform_spec_df_info,
-                                    batch_time_info)
+                                    batch_time_info,
+                                    transform_spec_info,
+                                    dimension_encoding_info,
+                                    batch_stats_info)
         else:
             if config_info is None or config_info == "":
                 # get from passed in transform_context
@@ -87,7 +108,27 @@ class TransformContextUtils(object):
                 batch_time_info = \
                     transform_context_info.batch_time_info
 
+            if transform_spec_info is None and \
+                    transform_spec_df_info is \
+                    transform_context_info.transform_spec_df_info:
+                # compiled spec only belongs to the passed in
+                # transform_spec_df
+                transform_spec_info = \
+                    transform_context_info.transform_spec_info
+
+            if dimension_encoding_info is None:
+                # get from passed in transform_context
+                dimension_encoding_info = \
+                    transform_context_info.dimension_encoding_info
+
+            if batch_stats_info is None:
+                # get from passed in transform_context
+                batch_stats_info = transform_context_info.batch_stats_info
+
             return TransformContext(config_info,
                                     offset_info,
                                     transform_spec_df_info,
-                                    batch_time_info)
+                                    batch_time_info,
+                                    transform_spec_info,
+                                    dimension_encoding_info,
+                                    batch_stats_info)
@@ -14,7 +14,11 @@
 
 from stevedore import extension
 
+from monasca_transform.data_driven_specs.transform_spec \
+    import TransformSpecCompiler
 from monasca_transform.log_utils import LogUtils
+from monasca_transform.transform.dimension_encoding \
+    import DimensionEncodingUtils
 
 
 class GenericTransformBuilder (object):
@@ -67,31 +71,14 @@ class GenericTransformBuilder (object):
             invoke_on_load=False)
 
     @staticmethod
-    def _parse_transform_pipeline(transform_spec_df):
-        """parse aggregation pipeline from metric
+    def _parse_transform_pipeline(transform_spec):
+        """parse aggregation pipeline from compiled metric
         processing configuration
         """
-        # get aggregation pipeline df
-        aggregation_pipeline_df = transform_spec_df\
-            .select("aggregation_params_map.aggregation_pipeline")
-
-        # call components
-        source_row = aggregation_pipeline_df\
-            .select("aggregation_pipeline.source").collect()[0]
-        source = source_row.source
-
-        usage_row = aggregation_pipeline_df\
-            .select("aggregation_pipeline.usage").collect()[0]
-        usage = usage_row.usage
-
-        setter_row_list = aggregation_pipeline_df\
-            .select("aggregation_pipeline.setters").collect()
-        setter_list = [setter_row.setters for setter_row in setter_row_list]
-
-        insert_row_list = aggregation_pipeline_df\
-            .select("aggregation_pipeline.insert").collect()
-        insert_list = [insert_row.insert for insert_row in insert_row_list]
-        return (source, usage, setter_list[0], insert_list[0])
+        return (transform_spec.source,
+                transform_spec.usage,
+                transform_spec.setters,
+                transform_spec.insert)
 
     @staticmethod
     def do_transform(transform_context,
@@ -99,12 +86,13 @@ class GenericTransformBuilder (object):
         """Build a dynamic aggregation pipeline and call components to
         process record store dataframe
         """
-        transform_spec_df = transform_context.transform_spec_df_info
+        transform_spec = TransformSpecCompiler.get_transform_spec(
+            transform_context)
         (source,
          usage,
          setter_list,
          insert_list) = GenericTransformBuilder.\
-            _parse_transform_pipeline(transform_spec_df)
+            _parse_transform_pipeline(transform_spec)
 
         # FIXME: source is a placeholder for non-streaming source
         # in the future?
@@ -115,6 +103,35 @@ class GenericTransformBuilder (object):
         instance_usage_df = usage_component.usage(transform_context,
                                                   record_store_df)
 
+        return GenericTransformBuilder._do_setters_and_inserts(
+            transform_context, instance_usage_df, setter_list, insert_list)
+
+    @staticmethod
+    def do_transform_instance_usage(transform_context,
+                                    instance_usage_df):
+        """Build the remainder of the aggregation pipeline and call setter
+        and insert components to process instance usage dataframe which
+        was already produced by the usage component
+        """
+        transform_spec = TransformSpecCompiler.get_transform_spec(
+            transform_context)
+        (source,
+         usage,
+         setter_list,
+         insert_list) = GenericTransformBuilder.\
+            _parse_transform_pipeline(transform_spec)
+
+        return GenericTransformBuilder._do_setters_and_inserts(
+            transform_context, instance_usage_df, setter_list, insert_list)
+
+    @staticmethod
+    def _do_setters_and_inserts(transform_context, instance_usage_df,
+                                setter_list, insert_list):
+        """call setter and insert components in order."""
+        # setters and inserts work with dimension values, not codes
+        instance_usage_df = DimensionEncodingUtils.decode_instance_usage(
+            transform_context.dimension_encoding_info, instance_usage_df)
+
         for setter in setter_list:
             setter_component = GenericTransformBuilder.\
                 _get_setter_component_manager()[setter].plugin
@@ -0,0 +1,330 @@
+# Copyright 2016 Hewlett Packard Enterprise Development Company LP
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+from collections import namedtuple
+
+from pyspark.sql.functions import array
+from pyspark.sql.functions import explode
+from pyspark.sql.functions import lit
+from pyspark.sql.functions import when
+
+from monasca_transform.component import Component
+from monasca_transform.component.component_utils import ComponentUtils
+from monasca_transform.component.usage.fetch_quantity import FetchQuantity
+from monasca_transform.log_utils import LogUtils
+from monasca_transform.transform.builder.generic_transform_builder \
+    import GenericTransformBuilder
+from monasca_transform.transform import TransformContextUtils
+
+
+GroupingSetsFamilyBase = namedtuple("GroupingSetsFamily",
+                                    ["family_id",
+                                     "event_type",
+                                     "usage_fetch_operation",
+                                     "aggregation_period",
+                                     "metric_ids"])
+
+
+class GroupingSetsFamily(GroupingSetsFamilyBase):
+    """A tuple which describes transform specs that are evaluated
+    together with grouping sets
+
+    namedtuple contains:
+
+    family_id - metric_id used for the family in the record store
+    event_type - event type the specs are generated from
+    usage_fetch_operation - operation shared by the specs
+    aggregation_period - aggregation period shared by the specs
+    metric_ids - metric_ids of the specs in the family
+    """
+
+
+class GroupingSetsTransformBuilder(object):
+    """Evaluate transform specs which are generated from the same event
+    type with grouping sets.
+
+    Specs which use the fetch_quantity usage component with the same
+    source, usage_fetch_operation and aggregation_period and whose
+    metric_ids are only listed in the metric_id_list of one pre transform
+    spec form a family. The record store holds a single record per metric
+    for the whole family instead of a copy per metric_id, and the
+    aggregation_group_by_list of every spec becomes one grouping set of a
+    single group by. The results are split by grouping set and passed on
+    to the setter and insert components of each spec.
+    """
+
+    _GROUPING_SETS_USAGE_COMPONENTS = ["fetch_quantity"]
+
+    _GROUPING_SETS_OPERATIONS = ["sum", "max", "min", "avg"]
+
+    FAMILY_ID_PREFIX = "grouping_sets"
+
+    GROUPING_SET_ID_COLUMN = "grouping_set_id"
+
+    @staticmethod
+    def _get_family_key(transform_spec):
+        """get a key identifying specs of an event type that can be
+        evaluated together. Returns None if the spec has to be processed
+        on its own.
+        """
+        if transform_spec.usage not in \
+                GroupingSetsTransformBuilder._GROUPING_SETS_USAGE_COMPONENTS:
+            return None
+
+        if transform_spec.usage_fetch_operation not in \
+                GroupingSetsTransformBuilder._GROUPING_SETS_OPERATIONS:
+            return None
+
+        return (transform_spec.source,
+                transform_spec.usage_fetch_operation,
+                transform_spec.aggregation_period)
+
+    @staticmethod
+    def get_grouping_sets_families(pre_transform_spec_rows,
+                                   transform_specs):
+        """get a dict of family_id to GroupingSetsFamily for the specs
+        which can be evaluated with grouping sets
+        """
+        # a metric_id which is generated from several event types has to
+        # stay in the record store as it is
+        metric_id_counts = {}
+        for row in pre_transform_spec_rows:
+            for metric_id in set(row.metric_id_list or []):
+                metric_id_counts[metric_id] = \
+                    metric_id_counts.get(metric_id, 0) + 1
+
+        families = {}
+        for row in pre_transform_spec_rows:
+            metric_ids_by_family_key = {}
+            for metric_id in row.metric_id_list or []:
+                transform_spec = transform_specs.get(metric_id)
+                if transform_spec is None or \
+                        metric_id_counts[metric_id] > 1:
+                    continue
+                family_key = GroupingSetsTransformBuilder.\
+                    _get_family_key(transform_spec)
+                if family_key is None:
+                    continue
+                family_metric_ids = metric_ids_by_family_key.setdefault(
+                    family_key, [])
+                if metric_id not in family_metric_ids:
+                    family_metric_ids.append(metric_id)
+
+            for family_key, metric_ids in metric_ids_by_family_key.items():
+                # nothing is saved for a single spec
+                if len(metric_ids) < 2:
+                    continue
+                (source,
+                 usage_fetch_operation,
+                 aggregation_period) = family_key
+                family_id = ":".join(
+                    [GroupingSetsTransformBuilder.FAMILY_ID_PREFIX,
+                     row.event_type,
+                     usage_fetch_operation,
+                     aggregation_period])
+                families[family_id] = GroupingSetsFamily(
+                    family_id=family_id,
+                    event_type=row.event_type,
+                    usage_fetch_operation=usage_fetch_operation,
+                    aggregation_period=aggregation_period,
+                    metric_ids=metric_ids)
+        return families
+
+    @staticmethod
+    def get_record_store_metric_id_lists(pre_transform_spec_rows,
+                                         families):
+        """get a dict of event type to the list of metric_ids records
+        are generated for, where the metric_ids of each family are
+        replaced by the family_id. Only event types which have families
+        are in the dict.
+        """
+        family_ids_by_metric_id = {}
+        for family in families.values():
+            for metric_id in family.metric_ids:
+                family_ids_by_metric_id[metric_id] = family.family_id
+
+        metric_id_lists = {}
+        for row in pre_transform_spec_rows:
+            metric_id_list = []
+            for metric_id in row.metric_id_list or []:
+                metric_id = family_ids_by_metric_id.get(metric_id, metric_id)
+                if metric_id not in metric_id_list:
+                    metric_id_list.append(metric_id)
+            if metric_id_list != list(row.metric_id_list or []):
+                metric_id_lists[row.event_type] = metric_id_list
+        return metric_id_lists
+
+    @staticmethod
+    def _get_grouping_sets(family, transform_specs, group_by_period_list):
+        """get the list of distinct grouping sets of a family and a dict
+        of metric_id to the index of its grouping set. Period columns are
+        part of every group by and metric_id is the same for the whole
+        family, so neither is part of the grouping sets.
+        """
+        grouping_sets = []
+        grouping_set_index = {}
+        for metric_id in family.metric_ids:
+            grouping_set = tuple(sorted(set(
+                group_by_column for group_by_column in
+                transform_specs[metric_id].aggregation_group_by_list
+                if group_by_column not in group_by_period_list and
+                group_by_column != "metric_id")))
+            if grouping_set not in grouping_sets:
+                grouping_sets.append(grouping_set)
+            grouping_set_index[metric_id] = grouping_sets.index(grouping_set)
+        return grouping_sets, grouping_set_index
+
+    @staticmethod
+    def _expand_grouping_sets(record_store_df, group_by_period_list,
+                              grouping_sets):
+        """add a grouping set id column to the record store, with a row
+        for each grouping set when there is more than one. Columns which
+        are not part of a row's grouping set are set to the unavailable
+        value, which is also what a spec that does not group by a column
+        reports for it.
+        """
+        grouping_set_id_column = \
+            GroupingSetsTransformBuilder.GROUPING_SET_ID_COLUMN
+        grouping_set_columns = sorted(set(
+            group_by_column for grouping_set in grouping_sets
+            for group_by_column in grouping_set))
+
+        if len(grouping_sets) == 1:
+            grouping_set_id = lit(0)
+        else:
+            grouping_set_id = explode(
+                array(*[lit(index) for index in range(len(grouping_sets))]))
+
+        # only keep the columns needed for the aggregation, before
+        # rows are generated for each grouping set
+        expanded_df = record_store_df.select(
+            ["event_timestamp_unix", "event_quantity"] +
+            group_by_period_list + grouping_set_columns +
+            [grouping_set_id.alias(grouping_set_id_column)])
+
+        select_list = ["event_timestamp_unix", "event_quantity"] + \
+            group_by_period_list + [grouping_set_id_column]
+        for group_by_column in grouping_set_columns:
+            grouping_set_ids = [index for index, grouping_set
+                                in enumerate(grouping_sets)
+                                if group_by_column in grouping_set]
+            if len(grouping_set_ids) == len(grouping_sets):
+                select_list.append(group_by_column)
+            else:
+                select_list.append(
+                    when(expanded_df[grouping_set_id_column].isin(
+                        *grouping_set_ids),
+                        expanded_df[group_by_column]).otherwise(
+                        lit(Component.DEFAULT_UNAVAILABLE_VALUE)).alias(
+                        group_by_column))
+
+        return (expanded_df.select(select_list),
+                group_by_period_list + grouping_set_columns +
+                [grouping_set_id_column])
+
+    @staticmethod
+    def _do_transform_family(transform_context,
+                             record_store_df,
+                             transform_specs_df,
+                             transform_specs,
+                             family):
+        """aggregate record store data of a family with one group by over
+        all its grouping sets and then run setters and inserts for each
+        spec
+        """
+        group_by_period_list = ComponentUtils._get_group_by_period_list(
+            family.aggregation_period)
+
+        (grouping_sets,
+         grouping_set_index) = GroupingSetsTransformBuilder.\
+            _get_grouping_sets(family, transform_specs, group_by_period_list)
+
+        LogUtils.log_debug(
+            "GroupingSetsTransformBuilder: family: {%s}, grouping sets: "
+            "{%s}, metric_ids: {%s}" % (family.family_id,
+                                        str(grouping_sets),
+                                        str(family.metric_ids)))
+
+        source_record_store_df = record_store_df.where(
+            record_store_df.metric_id == family.family_id)
+
+        (expanded_record_store_df,
+         group_by_columns_list) = GroupingSetsTransformBuilder.\
+            _expand_grouping_sets(source_record_store_df,
+                                  group_by_period_list,
+                                  grouping_sets)
+
+        grouped_record_store_df = FetchQuantity.aggregate_record_store(
+            expanded_record_store_df, group_by_columns_list,
+            family.usage_fetch_operation)
+
+        # aggregated data will be read once for every spec
+        grouped_record_store_df.cache()
+
+        grouping_set_id_column = grouped_record_store_df[
+            GroupingSetsTransformBuilder.GROUPING_SET_ID_COLUMN]
+        for metric_id in family.metric_ids:
+            transform_spec_df = transform_specs_df.select(
+                ["aggregation_params_map", "metric_id"]
+            ).where(transform_specs_df.metric_id == metric_id)
+
+            spec_grouped_record_store_df = grouped_record_store_df.where(
+                grouping_set_id_column == grouping_set_index[metric_id]
+            ).withColumn("metric_id", lit(metric_id))
+
+            spec_instance_usage_df = \
+                FetchQuantity.usage_from_aggregated_record_store(
+                    spec_grouped_record_store_df,
+                    family.usage_fetch_operation,
+                    with_partial_state=FetchQuantity.
+                    _is_partial_state_valid(
+                        family.usage_fetch_operation,
+                        transform_specs[metric_id].pre_hourly_operation))
+
+            spec_transform_context = \
+                TransformContextUtils.get_context(
+                    transform_context_info=transform_context,
+                    transform_spec_df_info=transform_spec_df,
+                    transform_spec_info=transform_specs[metric_id])
+
+            GenericTransformBuilder.do_transform_instance_usage(
+                spec_transform_context, spec_instance_usage_df)
+
+        grouped_record_store_df.unpersist()
+
+    @staticmethod
+    def do_transform(transform_context,
+                     record_store_df,
+                     transform_specs_df,
+                     transform_specs,
+                     families,
+                     metric_ids_to_process):
+        """process all families in the record store and return the list
+        of metric_ids that still have to be processed.
+        """
+        processed_metric_ids = set()
+        for metric_id in metric_ids_to_process:
+            family = families.get(metric_id)
+            if family is None:
+                continue
+            GroupingSetsTransformBuilder._do_transform_family(
+                transform_context,
+                record_store_df,
+                transform_specs_df,
+                transform_specs,
+                family)
+            processed_metric_ids.add(metric_id)
+
+        return [metric_id for metric_id in metric_ids_to_process
+                if metric_id not in processed_metric_ids]
@@ -0,0 +1,162 @@
+# Copyright 2016 Hewlett Packard Enterprise Development Company LP
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+from monasca_transform.component.component_utils import ComponentUtils
+from monasca_transform.component.usage.fetch_quantity import FetchQuantity
+from monasca_transform.log_utils import LogUtils
+from monasca_transform.transform.builder.generic_transform_builder \
+    import GenericTransformBuilder
+from monasca_transform.transform import TransformContextUtils
+
+
+class MultiSpecTransformBuilder(object):
+    """Evaluate transform specs which share a usage operation and
+    group by shape together.
+
+    Instead of running a separate usage aggregation for every metric_id,
+    specs which use the fetch_quantity usage component with the same
+    usage_fetch_operation, aggregation_period and aggregation_group_by_list
+    are aggregated with a single group by over the record store, with
+    metric_id added to the group by columns. The combined instance usage
+    data is then split by metric_id and passed on to the setter and insert
+    components of each spec.
+    """
+
+    _GROUPABLE_USAGE_COMPONENTS = ["fetch_quantity"]
+
+    @staticmethod
+    def _get_usage_group_key(transform_spec):
+        """get a key identifying specs that can be aggregated together.
+        Returns None if the spec has to be processed on its own.
+        """
+        if transform_spec.usage not in \
+                MultiSpecTransformBuilder._GROUPABLE_USAGE_COMPONENTS:
+            return None
+
+        return (transform_spec.usage_fetch_operation,
+                transform_spec.aggregation_period,
+                tuple(transform_spec.aggregation_group_by_list))
+
+    @staticmethod
+    def _get_usage_groups(transform_specs, metric_ids_to_process):
+        """get a dict of usage group key to list of metric_ids
+        for the specs which are to be processed in this batch.
+        """
+        usage_groups = {}
+        for metric_id in metric_ids_to_process:
+            transform_spec = transform_specs.get(metric_id)
+            if transform_spec is None:
+                continue
+            usage_group_key = MultiSpecTransformBuilder.\
+                _get_usage_group_key(transform_spec)
+            if usage_group_key is None:
+                continue
+            usage_groups.setdefault(usage_group_key, []).append(metric_id)
+        return usage_groups
+
+    @staticmethod
+    def _do_transform_usage_group(transform_context,
+                                  record_store_df,
+                                  transform_specs_df,
+                                  transform_specs,
+                                  usage_group_key,
+                                  metric_ids):
+        """aggregate record store data for all metric_ids in a usage
+        group in one pass and then run setters and inserts for each spec
+        """
+        (usage_fetch_operation,
+         aggregation_period,
+         aggregation_group_by_list) = usage_group_key
+
+        group_by_columns_list = \
+            ComponentUtils._get_group_by_period_list(aggregation_period) + \
+            list(aggregation_group_by_list)
+
+        # metric_id is needed to split the results for each spec
+        if "metric_id" not in group_by_columns_list:
+            group_by_columns_list.append("metric_id")
+
+        LogUtils.log_debug(
+            "MultiSpecTransformBuilder: operation: {%s}, group by: {%s}, "
+            "metric_ids: {%s}" % (usage_fetch_operation,
+                                  str(group_by_columns_list),
+                                  str(metric_ids)))
+
+        source_record_store_df = record_store_df.where(
+            record_store_df.metric_id.isin(*metric_ids))
+
+        # partial state is only kept if it is valid for every spec
+        with_partial_state = all(
+            FetchQuantity._is_partial_state_valid(
+                usage_fetch_operation,
+                transform_specs[metric_id].pre_hourly_operation)
+            for metric_id in metric_ids)
+
+        instance_usage_df = FetchQuantity.usage_by_group_by_columns(
+            source_record_store_df,
+            group_by_columns_list,
+            usage_fetch_operation,
+            metric_id=",".join(metric_ids),
+            with_partial_state=with_partial_state)
+
+        # instance usage data will be read once for every spec
+        if len(metric_ids) > 1:
+            instance_usage_df.cache()
+
+        for metric_id in metric_ids:
+            transform_spec_df = transform_specs_df.select(
+                ["aggregation_params_map", "metric_id"]
+            ).where(transform_specs_df.metric_id == metric_id)
+
+            spec_instance_usage_df = instance_usage_df.where(
+                instance_usage_df.processing_meta.metric_id == metric_id)
+
+            spec_transform_context = \
+                TransformContextUtils.get_context(
+                    transform_context_info=transform_context,
+                    transform_spec_df_info=transform_spec_df,
+                    transform_spec_info=transform_specs[metric_id])
+
+            GenericTransformBuilder.do_transform_instance_usage(
+                spec_transform_context, spec_instance_usage_df)
+
+        if len(metric_ids) > 1:
+            instance_usage_df.unpersist()
+
+    @staticmethod
+    def do_transform(transform_context,
+                     record_store_df,
+                     transform_specs_df,
+                     transform_specs,
+                     metric_ids_to_process):
+        """process all specs which can be aggregated together and
+        return the list of metric_ids that still have to be processed
+        one at a time.
+        """
+        usage_groups = MultiSpecTransformBuilder._get_usage_groups(
+            transform_specs, metric_ids_to_process)
+
+        processed_metric_ids = set()
+        for usage_group_key, metric_ids in usage_groups.items():
+            MultiSpecTransformBuilder._do_transform_usage_group(
+                transform_context,
+                record_store_df,
+                transform_specs_df,
+                transform_specs,
+                usage_group_key,
+                metric_ids)
+            processed_metric_ids.update(metric_ids)
+
+        return [metric_id for metric_id in metric_ids_to_process
+                if metric_id not in processed_metric_ids]
@@ -0,0 +1,195 @@
+# Copyright 2016 Hewlett Packard Enterprise Development Company LP
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+from collections import namedtuple
+
+from pyspark.sql.functions import array
+from pyspark.sql.functions import broadcast
+from pyspark.sql.functions import coalesce
+from pyspark.sql.functions import explode
+from pyspark.sql.types import LongType
+from pyspark.sql.types import StringType
+from pyspark.sql.types import StructField
+from pyspark.sql.types import StructType
+
+
+DimensionEncodingBase = namedtuple("DimensionEncoding",
+                                   ["encoded_columns",
+                                    "code_df"])
+
+
+class DimensionEncoding(DimensionEncodingBase):
+    """A tuple which describes how the record store of a batch was
+    encoded
+
+    namedtuple contains:
+
+    encoded_columns - record store columns which hold codes
+    code_df - dataframe of dimension_value, dimension_code for the values
+              in the batch
+    """
+
+
+class DimensionDictionary(object):
+    """Integer codes for dimension values, kept across batches.
+
+    A value is given a code the first time it is seen. When there are
+    more than max_size values, the values which were not seen for the
+    most batches are evicted. A code is never given to another value, so
+    codes of evicted values cannot be confused.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.codes = {}
+        self.last_seen_batch = {}
+        self.batch_count = 0
+        self.next_code = 0
+
+    def update(self, values):
+        """add the values seen in a batch and return a dict of value to
+        code for them
+        """
+        self.batch_count += 1
+        batch_codes = {}
+        for value in values:
+            if value not in self.codes:
+                self.codes[value] = self.next_code
+                self.next_code += 1
+            self.last_seen_batch[value] = self.batch_count
+            batch_codes[value] = self.codes[value]
+
+        if len(self.codes) > self.max_size:
+            self._evict()
+        return batch_codes
+
+    def _evict(self):
+        """evict least recently seen values, values of the current
+        batch are kept
+        """
+        evictable_values = sorted(
+            (last_seen_batch, value) for value, last_seen_batch in
+            self.last_seen_batch.items()
+            if last_seen_batch < self.batch_count)
+        evict_count = len(self.codes) - self.max_size
+        for (last_seen_batch, value) in evictable_values[:evict_count]:
+            del self.codes[value]
+            del self.last_seen_batch[value]
+
+
+class DimensionEncodingUtils(object):
+    """utility methods to encode record store dimension values as
+    integer codes and decode them in instance usage data
+    """
+
+    # columns which select the records of a spec are never encoded
+    _UNENCODED_COLUMNS = ["event_type", "metric_id"]
+
+    @staticmethod
+    def _get_code_df_schema():
+        return StructType([StructField("dimension_value", StringType(), True),
+                           StructField("dimension_code", LongType(), True)])
+
+    @staticmethod
+    def _get_batch_values(record_store_df, encoded_columns):
+        """get the distinct values of the encoded columns with one job"""
+        values_df = record_store_df.select(
+            explode(array(*[record_store_df[column]
+                            for column in encoded_columns])).alias(
+                "dimension_value")).distinct()
+        return [row.dimension_value for row in values_df.collect()]
+
+    @staticmethod
+    def encode_record_store(sql_context, record_store_df,
+                            dimension_dictionary, encoded_columns):
+        """replace values in the encoded columns of the record store with
+        their codes. Returns the encoded record store and the
+        DimensionEncoding needed to decode instance usage data.
+        """
+        string_columns = [field.name for field in record_store_df.schema
+                          if isinstance(field.dataType, StringType)]
+        encoded_columns = [column for column in encoded_columns
+                           if column in string_columns and column not in
+                           DimensionEncodingUtils._UNENCODED_COLUMNS]
+        if not encoded_columns:
+            return record_store_df, None
+
+        batch_codes = dimension_dictionary.update(
+            DimensionEncodingUtils._get_batch_values(record_store_df,
+                                                     encoded_columns))
+        code_df = sql_context.createDataFrame(
+            list(batch_codes.items()),
+            DimensionEncodingUtils._get_code_df_schema())
+
+        # the codes of the batch are broadcast, so that each column is
+        # encoded with a map side lookup
+        encoded_df = record_store_df
+        for column in encoded_columns:
+            column_code_df = broadcast(code_df.select(
+                code_df.dimension_value.alias("_value_" + column),
+                code_df.dimension_code.alias("_code_" + column)))
+            encoded_df = encoded_df.join(
+                column_code_df,
+                encoded_df[column] == column_code_df["_value_" + column])
+
+        select_list = []
+        for column in record_store_df.columns:
+            if column in encoded_columns:
+                select_list.append(
+                    encoded_df["_code_" + column].alias(column))
+            else:
+                select_list.append(encoded_df[column])
+
+        return (encoded_df.select(select_list),
+                DimensionEncoding(encoded_columns=encoded_columns,
+                                  code_df=code_df))
+
+    @staticmethod
+    def decode_instance_usage(dimension_encoding, instance_usage_df):
+        """replace codes in instance usage data with dimension values.
+        Columns which were not grouped by have the unavailable value,
+        which is not a code and is kept.
+        """
+        if dimension_encoding is None:
+            return instance_usage_df
+
+        decoded_columns = list(dimension_encoding.encoded_columns)
+        # project_id is reported from tenant_id
+        if "tenant_id" in decoded_columns:
+            decoded_columns.append("project_id")
+        decoded_columns = [column for column in decoded_columns
+                           if column in instance_usage_df.columns]
+
+        code_df = dimension_encoding.code_df
+        decoded_df = instance_usage_df
+        for column in decoded_columns:
+            column_code_df = broadcast(code_df.select(
+                code_df.dimension_code.cast(StringType()).alias(
+                    "_code_" + column),
+                code_df.dimension_value.alias("_value_" + column)))
+            decoded_df = decoded_df.join(
+                column_code_df,
+                decoded_df[column] == column_code_df["_code_" + column],
+                "left_outer")
+
+        select_list = []
+        for column in instance_usage_df.columns:
+            if column in decoded_columns:
+                select_list.append(
+                    coalesce(decoded_df["_value_" + column],
+                             decoded_df[column]).alias(column))
+            else:
+                select_list.append(decoded_df[column])
+
+        return decoded_df.select(select_list)
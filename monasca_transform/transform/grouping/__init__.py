@@ -13,21 +13,8 @@
 # under the License.
 
 from collections import namedtuple
-
-RecordStoreWithGroupByBase = namedtuple("RecordStoreWithGroupBy",
-                                        ["record_store_data",
-                                         "group_by_columns_list"])
-
-
-class RecordStoreWithGroupBy(RecordStoreWithGroupByBase):
-    """A tuple which is a wrapper containing record store data
-    and the group by columns
-
-    namdetuple contains:
-
-    record_store_data - record store data
-    group_by_columns_list - group by columns list
-    """
+import datetime
+import operator
 
 GroupingResultsBase = namedtuple("GroupingResults",
                                  ["grouping_key",
@@ -47,21 +34,58 @@ class GroupingResults(GroupingResultsBase):
     """
 
 
+class GroupingKey(object):
+    """Grouping key for a list of group by columns.
+
+    The key of a record is a tuple of its group by column values, read
+    with an attribute getter which is compiled once for the column list.
+    Tuple keys hash cheaply, and since values are never joined into a
+    string they can contain any character. The group by dict of a key is
+    built by pairing the key with the column list.
+    """
+
+    def __init__(self, group_by_columns_list):
+        self.group_by_columns_list = list(group_by_columns_list)
+        self._compile()
+
+    def _compile(self):
+        self._get_values = None
+        if len(self.group_by_columns_list) > 1:
+            self._get_values = operator.attrgetter(
+                *self.group_by_columns_list)
+        elif len(self.group_by_columns_list) == 1:
+            get_value = operator.attrgetter(self.group_by_columns_list[0])
+            self._get_values = lambda record: (get_value(record),)
+
+    def __getstate__(self):
+        # only the column list is shipped to executors, getters are
+        # compiled again when unpickled
+        return {"group_by_columns_list": self.group_by_columns_list}
+
+    def __setstate__(self, state):
+        self.group_by_columns_list = state["group_by_columns_list"]
+        self._compile()
+
+    def get_key(self, record):
+        """get the grouping key tuple of a record"""
+        if self._get_values is None:
+            return ()
+        return self._get_values(record)
+
+    def get_key_dict(self, key):
+        """get a dict of group by column to value for a grouping key"""
+        return dict(zip(self.group_by_columns_list, key))
+
+
 class Grouping(object):
     """Base class for all grouping classes."""
 
     @staticmethod
-    def _parse_grouping_key(grouping_str):
-        """parse grouping key which in "^key1=value1^key2=value2..." format
-        into a dictionary of key value pairs
+    def _get_timestamp_string(timestamp_unix):
+        """format an event timestamp for output, the record store only
+        carries the unix timestamp
         """
-        group_by_dict = {}
-        #
-        # convert key=value^key1=value1 string into a dict
-        #
-        for key_val_pair in grouping_str.split("^"):
-            if "=" in key_val_pair:
-                key_val = key_val_pair.split("=")
-                group_by_dict[key_val[0]] = key_val[1]
-
-        return group_by_dict
+        if timestamp_unix is None:
+            return None
+        return datetime.datetime.fromtimestamp(
+            timestamp_unix).strftime('%Y-%m-%d %H:%M:%S')
@@ -0,0 +1,138 @@
+# Copyright 2016 Hewlett Packard Enterprise Development Company LP
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+from monasca_transform.transform.grouping import Grouping
+from monasca_transform.transform.grouping import GroupingKey
+from monasca_transform.transform.grouping import GroupingResults
+
+
+class GroupFirstLastByTimestamp(Grouping):
+    """Find the oldest and latest record in each group using a combiner.
+
+    Unlike GroupSortbyTimestamp, which collects and sorts every record
+    of a group, only the first and last record seen so far and a record
+    count are kept for each group. Records are combined on the map side
+    before the shuffle, so memory use does not grow with the group size.
+    """
+
+    @staticmethod
+    def _prepare_for_group_by(grouping_key, record_store_data):
+        """creates a key-value pair where the key is the grouping key
+        tuple and the value contains the event timestamp and quantity
+        fields of the record.
+        """
+        event_record = (record_store_data.event_timestamp_unix,
+                        record_store_data.event_quantity)
+
+        # return a key-value pair
+        return [grouping_key.get_key(record_store_data), event_record]
+
+    @staticmethod
+    def _create_combiner(event_record):
+        """start a (first, last, count) combiner from a single record."""
+        return (event_record, event_record, 1.0)
+
+    @staticmethod
+    def _merge_value(combiner, event_record):
+        """add a record to a (first, last, count) combiner. On equal
+        timestamps the earlier record stays first and the later record
+        becomes last.
+        """
+        (first_record, last_record, count) = combiner
+        if event_record[0] < first_record[0]:
+            first_record = event_record
+        if event_record[0] >= last_record[0]:
+            last_record = event_record
+        return (first_record, last_record, count + 1)
+
+    @staticmethod
+    def _merge_combiners(combiner1, combiner2):
+        """merge two (first, last, count) combiners."""
+        (first_record1, last_record1, count1) = combiner1
+        (first_record2, last_record2, count2) = combiner2
+
+        first_record = first_record1
+        if first_record2[0] < first_record1[0]:
+            first_record = first_record2
+
+        last_record = last_record1
+        if last_record2[0] >= last_record1[0]:
+            last_record = last_record2
+
+        return (first_record, last_record, count1 + count2)
+
+    @staticmethod
+    def _get_group_first_last_quantity(grouping_key, group_key_combiner):
+        """Return stats that include first row key, first_event_timestamp,
+        first event quantity, last_event_timestamp and last event quantity
+        """
+        (group_key, (first_record, last_record, count)) = group_key_combiner
+
+        (first_event_timestamp_unix,
+         first_event_quantity) = first_record
+
+        (last_event_timestamp_unix,
+         last_event_quantity) = last_record
+
+        # timestamp strings are only formatted for the group results
+        first_event_timestamp_string = Grouping._get_timestamp_string(
+            first_event_timestamp_unix)
+        last_event_timestamp_string = Grouping._get_timestamp_string(
+            last_event_timestamp_unix)
+
+        results_dict = {"firstrecord_timestamp_unix":
+                        first_event_timestamp_unix,
+                        "firstrecord_timestamp_string":
+                        first_event_timestamp_string,
+                        "firstrecord_quantity": first_event_quantity,
+                        "lastrecord_timestamp_unix":
+                        last_event_timestamp_unix,
+                        "lastrecord_timestamp_string":
+                        last_event_timestamp_string,
+                        "lastrecord_quantity": last_event_quantity,
+                        "record_count": count}
+
+        group_key_dict = grouping_key.get_key_dict(group_key)
+
+        return GroupingResults(group_key, results_dict, group_key_dict)
+
+    @staticmethod
+    def fetch_group_latest_oldest_quantity(record_store_df,
+                                           transform_spec_df,
+                                           group_by_columns_list):
+        """function to group record store data and get first and last
+        timestamp along with quantity within each group
+
+        This function uses key-value pair rdd's combineByKey function to
+        do group_by
+        """
+        grouping_key = GroupingKey(group_by_columns_list)
+
+        # convert rdd into key-value rdd
+        record_store_rdd_key_val = record_store_df.rdd.map(
+            lambda x: GroupFirstLastByTimestamp._prepare_for_group_by(
+                grouping_key, x))
+
+        # keep first and last record for each group
+        record_store_rdd_combined = record_store_rdd_key_val.combineByKey(
+            GroupFirstLastByTimestamp._create_combiner,
+            GroupFirstLastByTimestamp._merge_value,
+            GroupFirstLastByTimestamp._merge_combiners)
+
+        # find stats for a group
+        record_store_grouped_rows = record_store_rdd_combined.map(
+            lambda x: GroupFirstLastByTimestamp._get_group_first_last_quantity(
+                grouping_key, x))
+
+        return record_store_grouped_rows
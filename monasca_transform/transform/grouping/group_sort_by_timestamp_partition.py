@@ -12,9 +12,12 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+from pyspark.rdd import portable_hash
+
 from monasca_transform.transform.grouping import Grouping
-from monasca_transform.transform.grouping import GroupingResults
-from monasca_transform.transform.grouping import RecordStoreWithGroupBy
+from monasca_transform.transform.grouping import GroupingKey
+from monasca_transform.transform.grouping.group_first_last_by_timestamp \
+    import GroupFirstLastByTimestamp
 
 
 class GroupSortbyTimestampPartition(Grouping):
@@ -26,140 +29,105 @@ class GroupSortbyTimestampPartition(Grouping):
 
     @staticmethod
     def _get_group_first_last_quantity_udf(partition_list_iter):
-        """user defined function to to through a list of partitions. Each
-        partition contains elements for a group. All the elements are sorted by
-        timestamp.
-        The stats include first row key, first_event_timestamp,
-        fist event quantity, last_event_timestamp and last event quantity
+        """user defined function to to through a list of partitions. The
+        elements of a partition are sorted by grouping key, salt and
+        timestamp, so the elements of each salted group are next to each
+        other and a partition can contain any number of groups.
+
+        Yields the grouping key and a (first, last, count) combiner for
+        each salted group, where first and last are (event timestamp,
+        event quantity) tuples.
         """
-        first_row = None
-        last_row = None
+        group_composite = None
+        first_record = None
+        last_record = None
 
         count = 0.0
         for row in partition_list_iter:
 
-            # set the first row
-            if first_row is None:
-                first_row = row
+            # a new group starts when the grouping key or salt changes
+            if group_composite is not None and \
+                    row[0][:2] != group_composite:
+                yield (group_composite[0],
+                       (first_record, last_record, count))
+                group_composite = None
+                count = 0.0
+
+            event_record = (row[1].event_timestamp_unix,
+                            row[1].event_quantity)
 
-            # set the last row
-            last_row = row
+            # set the first record
+            if group_composite is None:
+                group_composite = row[0][:2]
+                first_record = event_record
+
+            # set the last record
+            last_record = event_record
             count = count + 1
 
-        first_event_timestamp_unix = None
-        first_event_timestamp_string = None
-        first_event_quantity = None
-        first_row_key = None
-        if first_row is not None:
-            first_event_timestamp_unix = first_row[1].event_timestamp_unix
-            first_event_timestamp_string = first_row[1].event_timestamp_string
-            first_event_quantity = first_row[1].event_quantity
-
-            # extract the grouping_key from composite grouping_key
-            # composite grouping key is a list, where first item is the
-            # grouping key and second item is the event_timestamp_string
-            first_row_key = first_row[0][0]
-
-        last_event_timestamp_unix = None
-        last_event_timestamp_string = None
-        last_event_quantity = None
-        if last_row is not None:
-            last_event_timestamp_unix = last_row[1].event_timestamp_unix
-            last_event_timestamp_string = last_row[1].event_timestamp_string
-            last_event_quantity = last_row[1].event_quantity
-
-        results_dict = {"firstrecord_timestamp_unix":
-                        first_event_timestamp_unix,
-                        "firstrecord_timestamp_string":
-                        first_event_timestamp_string,
-                        "firstrecord_quantity": first_event_quantity,
-                        "lastrecord_timestamp_unix":
-                        last_event_timestamp_unix,
-                        "lastrecord_timestamp_string":
-                        last_event_timestamp_string,
-                        "lastrecord_quantity": last_event_quantity,
-                        "record_count": count}
-
-        first_row_key_dict = Grouping._parse_grouping_key(first_row_key)
-
-        yield [GroupingResults(first_row_key, results_dict,
-                               first_row_key_dict)]
+        if group_composite is not None:
+            yield (group_composite[0], (first_record, last_record, count))
 
     @staticmethod
-    def _prepare_for_group_by(record_store_with_group_by_rdd):
+    def _prepare_for_group_by(grouping_key, hot_keys, salt_count, index,
+                              record_store_data):
         """creates a new rdd where the first element of each row
-        contains array of grouping key and event timestamp fields.
-        Grouping key and event timestamp fields are used by
-        partitioning and sorting function to partition the data
-        by grouping key and then sort the elements in a group by the
-        timestamp
+        contains array of grouping key, salt and event timestamp fields.
+        Grouping key and salt are used by partitioning function to
+        partition the data and all three fields are used to sort the
+        elements in a partition, so that a group is sorted by timestamp.
+
+        Records of hot grouping keys are spread over salt_count salts by
+        their position in the input partition, all other records get
+        salt 0.
         """
-
-        # get the record store data and group by columns
-        record_store_data = record_store_with_group_by_rdd.record_store_data
-
-        group_by_columns_list = \
-            record_store_with_group_by_rdd.group_by_columns_list
-
-        # construct a group by key
-        # key1=value1^key2=value2^...
-        group_by_key_value = ""
-        for gcol in group_by_columns_list:
-            group_by_key_value = \
-                "^".join((group_by_key_value,
-                          "=".join((gcol, eval(".".join(("record_store_data",
-                                                         gcol)))))))
+        key = grouping_key.get_key(record_store_data)
+        salt = 0
+        if key in hot_keys:
+            salt = index % salt_count
 
         # return a key-value rdd
-        # key is a composite key which consists of grouping key and
-        # event_timestamp_string
-        return [[group_by_key_value,
-                 record_store_data.event_timestamp_string], record_store_data]
+        # key is a composite key which consists of grouping key tuple, salt
+        # and event_timestamp_unix
+        return [[key, salt, record_store_data.event_timestamp_unix],
+                record_store_data]
 
     @staticmethod
     def _get_partition_by_group(group_composite):
-        """get a hash of the grouping key, which is then used by partitioning
-        function to get partition where the groups data should end up in.
-        It uses hash % num_partitions to get partition
+        """get a hash of the grouping key and salt, which is then used by
+        partitioning function to get partition where the groups data should
+        end up in. It uses hash % num_partitions to get partition
         """
-        # FIXME: find out of hash function in python gives same value on
-        # different machines
-        # Look at using portable_hash method in spark rdd
-        grouping_key = group_composite[0]
-        grouping_key_hash = hash(grouping_key)
-        # log_debug("group_by_sort_by_timestamp_partition: got hash : %s" \
-        #    % str(returnhash))
-        return grouping_key_hash
+        # portable_hash gives the same value for a grouping key tuple
+        # on all executors
+        return portable_hash((group_composite[0], group_composite[1]))
 
     @staticmethod
     def _sort_by_timestamp(group_composite):
-        """get timestamp which will be used to sort grouped data
+        """get grouping key, salt and timestamp which will be used to sort
+        grouped data, so that the elements of a group are next to each
+        other and ordered by timestamp
         """
-        event_timestamp_string = group_composite[1]
-        return event_timestamp_string
+        return (group_composite[0], group_composite[1], group_composite[2])
 
     @staticmethod
     def _group_sort_by_timestamp_partition(record_store_df,
-                                           group_by_columns_list,
-                                           num_of_groups):
+                                           grouping_key,
+                                           num_of_groups,
+                                           hot_keys,
+                                           salt_count):
         """component that does a group by and then sorts all
         the items within the group by event timestamp.
         """
-        # convert the dataframe rdd to normal rdd and add the group by
-        # column list
-        record_store_with_group_by_rdd = record_store_df.rdd.\
-            map(lambda x: RecordStoreWithGroupBy(x, group_by_columns_list))
-
         # prepare the data for repartitionAndSortWithinPartitions function
-        record_store_rdd_prepared = \
-            record_store_with_group_by_rdd.\
-            map(GroupSortbyTimestampPartition._prepare_for_group_by)
-
-        # repartition data based on a grouping key and sort the items within
-        # group by timestamp
-        # give high number of partitions
-        # numPartitions > number of groups expected, so that each group gets
-        # allocated a separate partition
+        record_store_rdd_prepared = record_store_df.rdd.mapPartitions(
+            lambda records: (
+                GroupSortbyTimestampPartition._prepare_for_group_by(
+                    grouping_key, hot_keys, salt_count, index, record)
+                for index, record in enumerate(records)))
+
+        # repartition data based on a grouping key and salt and sort the
+        # items within partition by grouping key, salt and timestamp
         record_store_rdd_partitioned_sorted = \
             record_store_rdd_prepared.\
             repartitionAndSortWithinPartitions(
@@ -172,55 +140,87 @@ class GroupSortbyTimestampPartition(Grouping):
         return record_store_rdd_partitioned_sorted
 
     @staticmethod
-    def _remove_none_filter(row):
-        """remove any rows which have None as grouping key
-        [GroupingResults(grouping_key="key1", results={})] rows get created
-        when partition does not get any grouped data assigned to it
+    def get_hot_keys(record_store_df, group_by_columns_list, num_of_groups,
+                     sample_fraction, hot_key_factor, min_sample_count):
+        """find grouping keys which are expected to hold more than
+        hot_key_factor times the records of an average partition, by
+        counting keys in a sample of the record store
         """
-        if len(row[0].results) > 0 and row[0].grouping_key is not None:
-            return row
+        grouping_key = GroupingKey(group_by_columns_list)
+        sample_key_counts = record_store_df.rdd.sample(
+            False, sample_fraction).map(
+            lambda x: (grouping_key.get_key(x), 1)).countByKey()
+
+        sample_count = sum(sample_key_counts.values())
+        if sample_count < min_sample_count:
+            return set()
+
+        hot_key_min_count = \
+            hot_key_factor * float(sample_count) / num_of_groups
+        return set(key for key, key_count in sample_key_counts.items()
+                   if key_count > hot_key_min_count and
+                   key_count >= min_sample_count)
 
     @staticmethod
     def fetch_group_first_last_quantity(record_store_df,
                                         transform_spec_df,
                                         group_by_columns_list,
-                                        num_of_groups):
+                                        num_of_groups,
+                                        hot_keys=None,
+                                        salt_count=1):
         """function to group record store data, sort by timestamp within group
         and get first and last timestamp along with quantity within each group
 
-        To do group by it uses custom partitioning function which creates a new
-        partition
-        for each group and uses RDD's repartitionAndSortWithinPartitions
-        function to do the grouping and sorting within the group.
+        To do group by it uses custom partitioning function which assigns
+        each group to a partition and uses RDD's
+        repartitionAndSortWithinPartitions function to do the grouping and
+        sorting within the group.
 
         This is more scalable than just using RDD's group_by as using this
         technique
         group is not materialized into a list and stored in memory, but rather
         it uses RDD's in built partitioning capability to do the sort
 
-        num_of_groups should be more than expected groups, otherwise the same
-        partition can get used for two groups which will cause incorrect
-        results.
+        num_of_groups is the number of partitions used. A partition can
+        contain several groups, so it only has to be large enough to
+        spread the groups over the executors.
+
+        Records of grouping keys in hot_keys are salted over salt_count
+        partitions, so that a single large group does not set the time
+        taken by the slowest partition. The partial results of salted
+        groups are merged afterwards.
         """
+        grouping_key = GroupingKey(group_by_columns_list)
+        hot_keys = hot_keys or set()
+        if not hot_keys:
+            salt_count = 1
 
         # group and order elements in group using repartition
         record_store_grouped_data_rdd = \
             GroupSortbyTimestampPartition.\
             _group_sort_by_timestamp_partition(record_store_df,
-                                               group_by_columns_list,
-                                               num_of_groups)
-
-        # do some operations on all elements in the group
-        grouping_results_tuple_with_none = \
-            record_store_grouped_data_rdd.\
-            mapPartitions(GroupSortbyTimestampPartition.
-                          _get_group_first_last_quantity_udf)
-
-        # filter all rows which have no data (where grouping key is None) and
-        # convert resuts into grouping results tuple
-        grouping_results_tuple1 = grouping_results_tuple_with_none.\
-            filter(GroupSortbyTimestampPartition._remove_none_filter)
-
-        grouping_results_tuple = grouping_results_tuple1.map(lambda x: x[0])
+                                               grouping_key,
+                                               num_of_groups,
+                                               hot_keys,
+                                               salt_count)
+
+        # get first and last record and count for each salted group
+        group_combiner_rdd = record_store_grouped_data_rdd.mapPartitions(
+            GroupSortbyTimestampPartition._get_group_first_last_quantity_udf)
+
+        if salt_count > 1:
+            # merge the partial results of salted groups, which are only
+            # a few rows for each hot key
+            hot_group_combiner_rdd = group_combiner_rdd.filter(
+                lambda x: x[0] in hot_keys).reduceByKey(
+                GroupFirstLastByTimestamp._merge_combiners)
+            group_combiner_rdd = group_combiner_rdd.filter(
+                lambda x: x[0] not in hot_keys).union(
+                hot_group_combiner_rdd)
+
+        # convert results into grouping results tuple
+        grouping_results_tuple = group_combiner_rdd.map(
+            lambda x: GroupFirstLastByTimestamp.
+            _get_group_first_last_quantity(grouping_key, x))
 
         return grouping_results_tuple
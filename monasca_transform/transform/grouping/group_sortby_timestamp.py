@@ -13,8 +13,8 @@
 # under the License.
 
 from monasca_transform.transform.grouping import Grouping
+from monasca_transform.transform.grouping import GroupingKey
 from monasca_transform.transform.grouping import GroupingResults
-from monasca_transform.transform.grouping import RecordStoreWithGroupBy
 
 
 class GroupSortbyTimestamp(Grouping):
@@ -25,49 +25,11 @@ class GroupSortbyTimestamp(Grouping):
         # LOG.debug(logStr)
 
     @staticmethod
-    def _get_groupby_key(row_decorated):
-        """Build a group by key using the group by column list.
-
-        row_decorated: [[Rows(a=1, b=1, c=2, d=3)],[groupby_a,groupby_b]]
+    def _prepare_for_groupby(grouping_key, record_store_data):
+        """creates a key-value pair where the key is the grouping key
+        tuple of the record and the value is the record
         """
-        # LOG.debug(whoami(row_decorated))
-        # LOG.debug(row_decorated)
-
-        groupby_columns_list = row_decorated[1]
-        groupby_key = ""
-        for gcol in groupby_columns_list:
-            groupby_key = "^".join((groupby_key,
-                                    eval(".".join(("row", gcol)))))
-            return groupby_key
-
-    @staticmethod
-    def _prepare_for_groupby(record_store_with_groupby_rdd):
-        """creates a new rdd where the first element of each row
-        contains array of grouping key and event timestamp fields.
-        Grouping key and event timestamp fields are used by
-        partitioning and sorting function to partition the data
-        by grouping key and then sort the elements in a group by the
-        timestamp
-        """
-
-        # get the record store data and group by columns
-        record_store_data = record_store_with_groupby_rdd.record_store_data
-
-        groupby_columns_list = \
-            record_store_with_groupby_rdd.groupby_columns_list
-
-        # construct a group by key
-        # key1=value1^key2=value2^...
-        groupby_key_value = ""
-        for gcol in groupby_columns_list:
-            groupby_key_value = \
-                "^".join((groupby_key_value,
-                          "=".join((gcol,
-                                    eval(".".join(("record_store_data",
-                                                   gcol)))))))
-
-        # return a key-value rdd
-        return [groupby_key_value, record_store_data]
+        return [grouping_key.get_key(record_store_data), record_store_data]
 
     @staticmethod
     def _sortby_timestamp(result_iterable):
@@ -77,19 +39,15 @@ class GroupSortbyTimestamp(Grouping):
         # use group_sortby_timestamp_partitions module instead if you run
         # into OOM
         sorted_list = sorted(result_iterable.data,
-                             key=lambda row: row.event_timestamp_string)
+                             key=lambda row: row.event_timestamp_unix)
         return sorted_list
 
     @staticmethod
-    def _group_sortby_timestamp(record_store_df, groupby_columns_list):
-        # convert the dataframe rdd to normal rdd and add the group by column
-        # list
-        record_store_with_groupby_rdd = record_store_df.rdd.\
-            map(lambda x: RecordStoreWithGroupBy(x, groupby_columns_list))
-
-        # convert rdd into key-value rdd
-        record_store_with_groupby_rdd_key_val = record_store_with_groupby_rdd.\
-            map(GroupSortbyTimestamp._prepare_for_groupby)
+    def _group_sortby_timestamp(record_store_df, grouping_key):
+        # convert the dataframe rdd into key-value rdd
+        record_store_with_groupby_rdd_key_val = record_store_df.rdd.map(
+            lambda x: GroupSortbyTimestamp._prepare_for_groupby(
+                grouping_key, x))
 
         first_step = record_store_with_groupby_rdd_key_val.groupByKey()
         record_store_rdd_grouped_sorted = first_step.mapValues(
@@ -98,7 +56,7 @@ class GroupSortbyTimestamp(Grouping):
         return record_store_rdd_grouped_sorted
 
     @staticmethod
-    def _get_group_first_last_quantity_udf(grouplistiter):
+    def _get_group_first_last_quantity_udf(grouping_key, grouplistiter):
         """Return stats that include first row key, first_event_timestamp,
         first event quantity, last_event_timestamp and last event quantity
         """
@@ -126,7 +84,8 @@ class GroupSortbyTimestamp(Grouping):
 
         if first_row is not None:
             first_event_timestamp_unix = first_row.event_timestamp_unix
-            first_event_timestamp_string = first_row.event_timestamp_string
+            first_event_timestamp_string = Grouping._get_timestamp_string(
+                first_event_timestamp_unix)
             first_event_quantity = first_row.event_quantity
 
         last_event_timestamp_unix = None
@@ -135,7 +94,8 @@ class GroupSortbyTimestamp(Grouping):
 
         if last_row is not None:
             last_event_timestamp_unix = last_row.event_timestamp_unix
-            last_event_timestamp_string = last_row.event_timestamp_string
+            last_event_timestamp_string = Grouping._get_timestamp_string(
+                last_event_timestamp_unix)
             last_event_quantity = last_row.event_quantity
 
         results_dict = {"firstrecord_timestamp_unix":
@@ -150,7 +110,7 @@ class GroupSortbyTimestamp(Grouping):
                         "lastrecord_quantity": last_event_quantity,
                         "record_count": count}
 
-        group_key_dict = Grouping._parse_grouping_key(group_key)
+        group_key_dict = grouping_key.get_key_dict(group_key)
 
         return GroupingResults(group_key, results_dict, group_key_dict)
 
@@ -163,15 +123,17 @@ class GroupSortbyTimestamp(Grouping):
 
         This function uses key-value pair rdd's groupBy function to do groupby
         """
+        grouping_key = GroupingKey(groupby_columns_list)
+
         # group and order elements in group
         record_store_grouped_data_rdd = \
             GroupSortbyTimestamp._group_sortby_timestamp(record_store_df,
-                                                         groupby_columns_list)
+                                                         grouping_key)
 
         # find stats for a group
         record_store_grouped_rows = \
             record_store_grouped_data_rdd.\
-            map(GroupSortbyTimestamp.
-                _get_group_first_last_quantity_udf)
+            map(lambda x: GroupSortbyTimestamp.
+                _get_group_first_last_quantity_udf(grouping_key, x))
 
         return record_store_grouped_rows
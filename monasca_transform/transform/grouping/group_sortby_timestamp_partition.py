@@ -12,9 +12,11 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+from pyspark.rdd import portable_hash
+
 from monasca_transform.transform.grouping import Grouping
+from monasca_transform.transform.grouping import GroupingKey
 from monasca_transform.transform.grouping import GroupingResults
-from monasca_transform.transform.grouping import RecordStoreWithGroupBy
 
 
 class GroupSortbyTimestampPartition(Grouping):
@@ -25,7 +27,8 @@ class GroupSortbyTimestampPartition(Grouping):
         # LOG.debug(logStr)
 
     @staticmethod
-    def _get_group_first_last_quantity_udf(partitionlistiter):
+    def _get_group_first_last_quantity_udf(grouping_key,
+                                           partitionlistiter):
         """user defined function to to through a list of partitions. Each
         partition contains elements for a group. All the elements are sorted by
         timestamp.
@@ -52,12 +55,13 @@ class GroupSortbyTimestampPartition(Grouping):
         first_row_key = None
         if first_row is not None:
             first_event_timestamp_unix = first_row[1].event_timestamp_unix
-            first_event_timestamp_string = first_row[1].event_timestamp_string
+            first_event_timestamp_string = Grouping._get_timestamp_string(
+                first_event_timestamp_unix)
             first_event_quantity = first_row[1].event_quantity
 
             # extract the grouping_key from composite grouping_key
             # composite grouping key is a list, where first item is the
-            # grouping key and second item is the event_timestamp_string
+            # grouping key and second item is the event_timestamp_unix
             first_row_key = first_row[0][0]
 
         last_event_timestamp_unix = None
@@ -65,7 +69,8 @@ class GroupSortbyTimestampPartition(Grouping):
         last_event_quantity = None
         if last_row is not None:
             last_event_timestamp_unix = last_row[1].event_timestamp_unix
-            last_event_timestamp_string = last_row[1].event_timestamp_string
+            last_event_timestamp_string = Grouping._get_timestamp_string(
+                last_event_timestamp_unix)
             last_event_quantity = last_row[1].event_quantity
 
         results_dict = {"firstrecord_timestamp_unix":
@@ -80,13 +85,13 @@ class GroupSortbyTimestampPartition(Grouping):
                         "lastrecord_quantity": last_event_quantity,
                         "record_count": count}
 
-        first_row_key_dict = Grouping._parse_grouping_key(first_row_key)
+        first_row_key_dict = grouping_key.get_key_dict(first_row_key or ())
 
         yield [GroupingResults(first_row_key, results_dict,
                                first_row_key_dict)]
 
     @staticmethod
-    def _prepare_for_groupby(record_store_with_groupby_rdd):
+    def _prepare_for_groupby(grouping_key, record_store_data):
         """creates a new rdd where the first element of each row
         contains array of grouping key and event timestamp fields.
         Grouping key and event timestamp fields are used by
@@ -94,27 +99,11 @@ class GroupSortbyTimestampPartition(Grouping):
         by grouping key and then sort the elements in a group by the
         timestamp
         """
-
-        # get the record store data and group by columns
-        record_store_data = record_store_with_groupby_rdd.record_store_data
-
-        groupby_columns_list = \
-            record_store_with_groupby_rdd.groupby_columns_list
-
-        # construct a group by key
-        # key1=value1^key2=value2^...
-        groupby_key_value = ""
-        for gcol in groupby_columns_list:
-            groupby_key_value = \
-                "^".join((groupby_key_value,
-                          "=".join((gcol, eval(".".join(("record_store_data",
-                                                         gcol)))))))
-
         # return a key-value rdd
-        # key is a composite key which consists of grouping key and
-        # event_timestamp_string
-        return [[groupby_key_value,
-                 record_store_data.event_timestamp_string], record_store_data]
+        # key is a composite key which consists of grouping key tuple and
+        # event_timestamp_unix
+        return [[grouping_key.get_key(record_store_data),
+                 record_store_data.event_timestamp_unix], record_store_data]
 
     @staticmethod
     def _get_partition_by_group(group_composite):
@@ -122,11 +111,10 @@ class GroupSortbyTimestampPartition(Grouping):
         function to get partition where the groups data should end up in.
         It uses hash % num_partitions to get partition
         """
-        # FIXME: find out of hash function in python gives same value on
-        # different machines
-        # Look at using portable_hash method in spark rdd
+        # portable_hash gives the same value for a grouping key tuple
+        # on all executors
         grouping_key = group_composite[0]
-        grouping_key_hash = hash(grouping_key)
+        grouping_key_hash = portable_hash(grouping_key)
         # log_debug("groupby_sortby_timestamp_partition: got hash : %s" \
         #    % str(returnhash))
         return grouping_key_hash
@@ -135,25 +123,20 @@ class GroupSortbyTimestampPartition(Grouping):
     def _sortby_timestamp(group_composite):
         """get timestamp which will be used to sort grouped data
         """
-        event_timestamp_string = group_composite[1]
-        return event_timestamp_string
+        event_timestamp_unix = group_composite[1]
+        return event_timestamp_unix
 
     @staticmethod
     def _group_sortby_timestamp_partition(record_store_df,
-                                          groupby_columns_list,
+                                          grouping_key,
                                           num_of_groups):
         """component that does a group by and then sorts all
         the items within the group by event timestamp.
         """
-        # convert the dataframe rdd to normal rdd and add the group by
-        # column list
-        record_store_with_groupby_rdd = record_store_df.rdd.\
-            map(lambda x: RecordStoreWithGroupBy(x, groupby_columns_list))
-
         # prepare the data for repartitionAndSortWithinPartitions function
-        record_store_rdd_prepared = \
-            record_store_with_groupby_rdd.\
-            map(GroupSortbyTimestampPartition._prepare_for_groupby)
+        record_store_rdd_prepared = record_store_df.rdd.map(
+            lambda x: GroupSortbyTimestampPartition._prepare_for_groupby(
+                grouping_key, x))
 
         # repartition data based on a grouping key and sort the items within
         # group by timestamp
@@ -203,18 +186,20 @@ class GroupSortbyTimestampPartition(Grouping):
         results.
         """
 
+        grouping_key = GroupingKey(groupby_columns_list)
+
         # group and order elements in group using repartition
         record_store_grouped_data_rdd = \
             GroupSortbyTimestampPartition.\
             _group_sortby_timestamp_partition(record_store_df,
-                                              groupby_columns_list,
+                                              grouping_key,
                                               num_of_groups)
 
         # do some operations on all elements in the group
         grouping_results_tuple_with_none = \
             record_store_grouped_data_rdd.\
-            mapPartitions(GroupSortbyTimestampPartition.
-                          _get_group_first_last_quantity_udf)
+            mapPartitions(lambda x: GroupSortbyTimestampPartition.
+                          _get_group_first_last_quantity_udf(grouping_key, x))
 
         # filter all rows which have no data (where grouping key is None) and
         # convert resuts into grouping results tuple
@@ -0,0 +1,240 @@
+# Copyright 2016 Hewlett Packard Enterprise Development Company LP
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+from collections import namedtuple
+import math
+import time
+
+from oslo_config import cfg
+from pyspark.sql.functions import approxCountDistinct
+from pyspark.sql.functions import concat_ws
+from pyspark.sql.functions import count
+from pyspark.sql.functions import lit
+
+from monasca_transform.log_utils import LogUtils
+from monasca_transform.messaging.adapter import KafkaMessageAdapter
+from monasca_transform.transform.grouping.group_first_last_by_timestamp \
+    import GroupFirstLastByTimestamp
+from monasca_transform.transform.grouping.group_sort_by_timestamp \
+    import GroupSortbyTimestamp
+from monasca_transform.transform.grouping.group_sort_by_timestamp_partition \
+    import GroupSortbyTimestampPartition
+
+
+GroupingEngineChoiceBase = namedtuple("GroupingEngineChoice",
+                                      ["engine",
+                                       "estimated_groups",
+                                       "record_count",
+                                       "num_partitions"])
+
+
+class GroupingEngineChoice(GroupingEngineChoiceBase):
+    """A tuple which describes the grouping engine chosen for a spec
+
+    namedtuple contains:
+
+    engine - one of the GroupingEngine engine names
+    estimated_groups - approximate number of groups in the batch
+    record_count - number of records in the batch
+    num_partitions - number of partitions used by the engine, None when
+                     the default is used
+    """
+
+
+class GroupingEngine(object):
+    """Choose how record store data is grouped for the latest and oldest
+    usage fetch operations.
+
+    The number of groups is estimated with a single approximate distinct
+    count job. When groups have many records the combiner engine reduces
+    the data on the map side. When most groups have a single record
+    combining saves little, and the records are either grouped with
+    groupByKey, if there are few groups, or partitioned and sorted by
+    grouping key with a partition count derived from the estimate.
+    """
+
+    COMBINER = "combiner"
+
+    GROUP_BY_KEY = "group_by_key"
+
+    REPARTITION_SORT = "repartition_sort"
+
+    ADAPTIVE = "adaptive"
+
+    METRIC_NAME = "monasca.transform.grouping_engine"
+
+    @staticmethod
+    def _get_engines():
+        return [GroupingEngine.COMBINER,
+                GroupingEngine.GROUP_BY_KEY,
+                GroupingEngine.REPARTITION_SORT]
+
+    @staticmethod
+    def _estimate_groups(record_store_df, group_by_columns_list):
+        """get the approximate number of groups and the number of records
+        with one job
+        """
+        if not group_by_columns_list:
+            record_count = record_store_df.count()
+            return (1 if record_count else 0), record_count
+
+        group_key = concat_ws("^", *[record_store_df[column].cast("string")
+                                     for column in group_by_columns_list])
+        row = record_store_df.agg(
+            approxCountDistinct(
+                group_key,
+                rsd=cfg.CONF.service.grouping_approx_distinct_rsd).alias(
+                "estimated_groups"),
+            count(lit(1)).alias("record_count")).first()
+        return row.estimated_groups, row.record_count
+
+    @staticmethod
+    def _get_num_partitions(estimated_groups):
+        """get the number of partitions for the repartition sort engine"""
+        num_partitions = int(math.ceil(
+            float(estimated_groups) /
+            cfg.CONF.service.grouping_groups_per_partition))
+        return max(1, min(num_partitions,
+                          cfg.CONF.service.grouping_max_partitions))
+
+    @staticmethod
+    def choose(estimated_groups, record_count):
+        """choose a grouping engine for the estimated number of groups and
+        the number of records
+        """
+        configured_engine = cfg.CONF.service.grouping_engine
+        if configured_engine in GroupingEngine._get_engines():
+            engine = configured_engine
+        elif estimated_groups == 0 or \
+                float(record_count) / estimated_groups >= \
+                cfg.CONF.service.grouping_combiner_min_records_per_group:
+            engine = GroupingEngine.COMBINER
+        elif estimated_groups <= \
+                cfg.CONF.service.grouping_group_by_key_max_groups:
+            engine = GroupingEngine.GROUP_BY_KEY
+        else:
+            engine = GroupingEngine.REPARTITION_SORT
+
+        num_partitions = None
+        if engine == GroupingEngine.REPARTITION_SORT:
+            num_partitions = GroupingEngine._get_num_partitions(
+                estimated_groups)
+
+        return GroupingEngineChoice(engine=engine,
+                                    estimated_groups=estimated_groups,
+                                    record_count=record_count,
+                                    num_partitions=num_partitions)
+
+    @staticmethod
+    def _publish_choice(choice, metric_id):
+        """send the chosen engine as a metric, with the estimated number
+        of groups as its value
+        """
+        current_epoch_seconds = time.time()
+        metric = {"metric": {"name": GroupingEngine.METRIC_NAME,
+                             "dimensions": {"metric_id": metric_id,
+                                            "engine": choice.engine},
+                             "timestamp": int(current_epoch_seconds * 1000),
+                             "value": float(choice.estimated_groups),
+                             "value_meta": {
+                                 "record_count": choice.record_count,
+                                 "num_partitions": choice.num_partitions}},
+                  "meta": {"tenantId":
+                           cfg.CONF.messaging.publish_kafka_tenant_id,
+                           "region": "useast"},
+                  "creation_time": int(current_epoch_seconds)}
+        KafkaMessageAdapter.send_metric(metric)
+        KafkaMessageAdapter.flush()
+
+    @staticmethod
+    def select(record_store_df, group_by_columns_list, metric_id):
+        """get the grouping engine to use for a spec in this batch"""
+        configured_engine = cfg.CONF.service.grouping_engine
+        if configured_engine in GroupingEngine._get_engines() and \
+                configured_engine != GroupingEngine.REPARTITION_SORT:
+            # nothing has to be estimated
+            return GroupingEngineChoice(engine=configured_engine,
+                                        estimated_groups=None,
+                                        record_count=None,
+                                        num_partitions=None)
+
+        (estimated_groups,
+         record_count) = GroupingEngine._estimate_groups(
+            record_store_df, group_by_columns_list)
+        choice = GroupingEngine.choose(estimated_groups, record_count)
+
+        LogUtils.log_debug(
+            "GroupingEngine: metric_id: {%s}, engine: {%s}, estimated "
+            "groups: {%s}, records: {%s}, partitions: {%s}" % (
+                metric_id, choice.engine, choice.estimated_groups,
+                choice.record_count, choice.num_partitions))
+
+        if cfg.CONF.service.publish_grouping_engine_metrics:
+            GroupingEngine._publish_choice(choice, metric_id)
+
+        return choice
+
+    @staticmethod
+    def _get_hot_keys(record_store_df, group_by_columns_list,
+                      num_partitions, metric_id):
+        """get the grouping keys which are salted by the repartition sort
+        engine, when skew handling is enabled
+        """
+        if not cfg.CONF.service.enable_skew_handling or num_partitions < 2:
+            return set()
+
+        hot_keys = GroupSortbyTimestampPartition.get_hot_keys(
+            record_store_df, group_by_columns_list, num_partitions,
+            cfg.CONF.service.skew_sample_fraction,
+            cfg.CONF.service.skew_hot_key_factor,
+            cfg.CONF.service.skew_min_sample_count)
+
+        LogUtils.log_debug(
+            "GroupingEngine: metric_id: {%s}, hot keys: {%s}" % (
+                metric_id, str(list(hot_keys))))
+        return hot_keys
+
+    @staticmethod
+    def fetch_group_latest_oldest_quantity(record_store_df,
+                                           group_by_columns_list,
+                                           metric_id):
+        """group record store data with the engine selected for this
+        batch and get first and last timestamp along with quantity
+        within each group
+        """
+        choice = GroupingEngine.select(record_store_df,
+                                       group_by_columns_list,
+                                       metric_id)
+
+        if choice.engine == GroupingEngine.REPARTITION_SORT:
+            hot_keys = GroupingEngine._get_hot_keys(
+                record_store_df, group_by_columns_list,
+                choice.num_partitions, metric_id)
+            return GroupSortbyTimestampPartition.\
+                fetch_group_first_last_quantity(
+                    record_store_df, None,
+                    group_by_columns_list,
+                    choice.num_partitions,
+                    hot_keys=hot_keys,
+                    salt_count=min(cfg.CONF.service.skew_salt_count,
+                                   choice.num_partitions))
+        elif choice.engine == GroupingEngine.GROUP_BY_KEY:
+            return GroupSortbyTimestamp.fetch_group_latest_oldest_quantity(
+                record_store_df, None,
+                group_by_columns_list)
+        else:
+            return GroupFirstLastByTimestamp.\
+                fetch_group_latest_oldest_quantity(
+                    record_store_df, None,
+                    group_by_columns_list)
@@ -0,0 +1,66 @@
+# Copyright 2016 Hewlett Packard Enterprise Development Company LP
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import math
+
+from pyspark.sql import SQLContext
+
+
+class ShuffleUtils(object):
+    """shuffle util functions"""
+
+    SHUFFLE_PARTITIONS_PROPERTY = "spark.sql.shuffle.partitions"
+
+    # spark default when the property is not configured
+    DEFAULT_SHUFFLE_PARTITIONS = "200"
+
+    @staticmethod
+    def get_shuffle_partitions(record_count, target_rows_per_partition,
+                               min_partitions, max_partitions):
+        """get the number of shuffle partitions for a record count, so
+        that each partition gets about target_rows_per_partition rows
+        """
+        num_partitions = int(math.ceil(
+            float(record_count) / target_rows_per_partition))
+        return max(min_partitions, min(num_partitions, max_partitions))
+
+    @staticmethod
+    def set_shuffle_partitions(sql_context, num_partitions):
+        """set the number of partitions used by dataframe aggregations and
+        joins. Dataframes are created with the given sql context and with
+        the shared one returned by getOrCreate, so both are set.
+        """
+        sql_contexts = [sql_context,
+                        SQLContext.getOrCreate(sql_context._sc)]
+        for context in sql_contexts:
+            context.setConf(ShuffleUtils.SHUFFLE_PARTITIONS_PROPERTY,
+                            str(num_partitions))
+
+    @staticmethod
+    def get_configured_shuffle_partitions(spark_context):
+        """get the number of shuffle partitions the spark context is
+        configured with
+        """
+        return spark_context.getConf().get(
+            ShuffleUtils.SHUFFLE_PARTITIONS_PROPERTY,
+            ShuffleUtils.DEFAULT_SHUFFLE_PARTITIONS)
+
+    @staticmethod
+    def reset_shuffle_partitions(sql_context):
+        """set the number of shuffle partitions back to the configured
+        value, so that it does not carry over to later jobs
+        """
+        ShuffleUtils.set_shuffle_partitions(
+            sql_context,
+            ShuffleUtils.get_configured_shuffle_partitions(sql_context._sc))
@@ -12,15 +12,20 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import calendar
 import logging
+import time
 
+from pyspark.sql.functions import floor
 from pyspark.sql import SQLContext
 from pyspark.sql.types import ArrayType
 from pyspark.sql.types import DoubleType
+from pyspark.sql.types import LongType
 from pyspark.sql.types import MapType
 from pyspark.sql.types import StringType
 from pyspark.sql.types import StructField
 from pyspark.sql.types import StructType
+import six
 
 LOG = logging.getLogger(__name__)
 
@@ -42,6 +47,12 @@ class TransformUtils(object):
 
 class InstanceUsageUtils(TransformUtils):
     """utility methods to transform instance usage data."""
+
+    # processing_meta keys with the partial aggregate state of quantity,
+    # from which instance usage of the same group can be rolled up exactly
+    PARTIAL_STATE_FIELDS = ["quantity_sum", "quantity_count",
+                            "quantity_min", "quantity_max"]
+
     @staticmethod
     def _get_instance_usage_schema():
         """get instance usage schema."""
@@ -84,21 +95,102 @@ class InstanceUsageUtils(TransformUtils):
         instance_usage_schema_df = sql_context.jsonRDD(jsonrdd, schema)
         return instance_usage_schema_df
 
+    @staticmethod
+    def _to_string(value):
+        """convert a non string value to string. Floats are converted
+        with repr, which keeps their full precision.
+        """
+        if value is None or isinstance(value, six.string_types):
+            return value
+        if isinstance(value, float):
+            return repr(value)
+        return str(value)
+
+    @staticmethod
+    def _get_instance_usage_row(schema, instance_usage_dict):
+        """convert instance usage dict into a tuple with values in schema
+        field order and of schema field types.
+        """
+        instance_usage_row = []
+        for field in schema.fields:
+            value = instance_usage_dict.get(field.name)
+            if value is not None:
+                if isinstance(field.dataType, DoubleType):
+                    value = float(value)
+                elif isinstance(field.dataType, MapType):
+                    value = dict(
+                        (key, InstanceUsageUtils._to_string(map_value))
+                        for key, map_value in value.items())
+                else:
+                    value = InstanceUsageUtils._to_string(value)
+            instance_usage_row.append(value)
+        return tuple(instance_usage_row)
+
+    @staticmethod
+    def create_df_from_dict_rdd(sql_context, instance_usage_dict_rdd):
+        """create instance usage df from rdd of instance usage dicts,
+        without converting the dicts to and from json.
+        """
+        schema = InstanceUsageUtils._get_instance_usage_schema()
+        instance_usage_row_rdd = instance_usage_dict_rdd.map(
+            lambda x: InstanceUsageUtils._get_instance_usage_row(schema, x))
+        instance_usage_schema_df = sql_context.createDataFrame(
+            instance_usage_row_rdd, schema)
+        return instance_usage_schema_df
+
 
 class RecordStoreUtils(TransformUtils):
     """utility methods to transform record store data."""
+
+    # record store columns with the start of each aggregation period in
+    # epoch seconds, and the length of the period in seconds
+    PERIOD_BUCKET_COLUMNS = [("event_day_bucket", 86400),
+                             ("event_hour_bucket", 3600),
+                             ("event_minute_bucket", 60),
+                             ("event_second_bucket", 1)]
+
+    @staticmethod
+    def get_utc_offset(timestamp_unix=None):
+        """get the offset of local time from UTC in seconds at a unix
+        timestamp, or now.
+        """
+        if timestamp_unix is None:
+            timestamp_unix = time.time()
+        timestamp_unix = int(timestamp_unix)
+        return calendar.timegm(time.localtime(timestamp_unix)) - \
+            timestamp_unix
+
+    @staticmethod
+    def get_period_bucket_columns(event_timestamp_unix_column,
+                                  utc_offset=None):
+        """get integer period bucket columns for a unix timestamp column,
+        grouping by period uses these instead of date and time strings.
+        A bucket is the start of its period in local time, as epoch
+        seconds. Days and hours start at a local time, the buckets are
+        computed with the utc offset, which is the offset now if it is
+        not given, so that no strings are formatted for each record.
+        """
+        if utc_offset is None:
+            utc_offset = RecordStoreUtils.get_utc_offset()
+        bucket_columns = []
+        for (bucket_column, bucket_seconds) in \
+                RecordStoreUtils.PERIOD_BUCKET_COLUMNS:
+            bucket = floor((event_timestamp_unix_column + utc_offset) /
+                           bucket_seconds) * bucket_seconds - utc_offset
+            bucket_columns.append(
+                bucket.cast(LongType()).alias(bucket_column))
+        return bucket_columns
+
     @staticmethod
     def _get_record_store_df_schema():
         """get instance usage schema."""
 
-        columns = ["event_timestamp_string",
-                   "event_type", "event_quantity_name",
+        columns = ["event_type", "event_quantity_name",
                    "event_status", "event_version",
                    "record_type", "resource_uuid", "tenant_id",
                    "user_id", "region", "zone",
                    "host", "project_id", "service_group", "service_id",
-                   "event_date", "event_hour", "event_minute",
-                   "event_second", "metric_group", "metric_id"]
+                   "metric_group", "metric_id"]
 
         columns_struct_fields = [StructField(field_name, StringType(), True)
                                  for field_name in columns]
@@ -111,6 +203,11 @@ class RecordStoreUtils(TransformUtils):
                                      StructField("event_quantity",
                                                  DoubleType(), True))
 
+        columns_struct_fields.extend(
+            [StructField(bucket_column, LongType(), True)
+             for (bucket_column, bucket_seconds) in
+             RecordStoreUtils.PERIOD_BUCKET_COLUMNS])
+
         schema = StructType(columns_struct_fields)
 
         return schema
@@ -123,9 +220,18 @@ class RecordStoreUtils(TransformUtils):
 
     @staticmethod
     def create_df_from_json(sql_context, jsonpath):
-        """create a record store df from json file."""
+        """create a record store df from json file. Period bucket columns
+        are derived from event_timestamp_unix.
+        """
         schema = RecordStoreUtils._get_record_store_df_schema()
+        bucket_columns = [bucket_column for (bucket_column, bucket_seconds)
+                          in RecordStoreUtils.PERIOD_BUCKET_COLUMNS]
         record_store_df = sql_context.read.json(jsonpath, schema)
+        record_store_df = record_store_df.select(
+            [column for column in record_store_df.columns
+             if column not in bucket_columns] +
+            RecordStoreUtils.get_period_bucket_columns(
+                record_store_df.event_timestamp_unix))
         return record_store_df
 
 
@@ -321,10 +427,18 @@ class GroupingResultsUtils(TransformUtils):
     """utility methods to transform record store data."""
     @staticmethod
     def _get_grouping_results_df_schema(group_by_column_list):
-        """get grouping results schema."""
-
-        group_by_field_list = [StructField(field_name, StringType(), True)
-                               for field_name in group_by_column_list]
+        """get grouping results schema. The grouping key tuple and the
+        grouping key dict are both structs of the group by columns, period
+        bucket columns hold longs.
+        """
+        bucket_columns = [bucket_column for (bucket_column, bucket_seconds)
+                          in RecordStoreUtils.PERIOD_BUCKET_COLUMNS]
+        group_by_field_list = [
+            StructField(field_name,
+                        LongType() if field_name in bucket_columns
+                        else StringType(),
+                        True)
+            for field_name in group_by_column_list]
 
         # Initialize columns for string fields
         columns = ["firstrecord_timestamp_string",
@@ -349,7 +463,7 @@ class GroupingResultsUtils(TransformUtils):
 
         grouping_results = \
             StructType([StructField("grouping_key",
-                                    StringType(), True),
+                                    StructType(group_by_field_list), True),
                         StructField("results",
                                     instance_usage_schema_part,
                                     True),
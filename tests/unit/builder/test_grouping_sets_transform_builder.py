@@ -0,0 +1,142 @@
+# Copyright 2016 Hewlett Packard Enterprise Development Company LP
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+import mock
+
+from oslo_config import cfg
+from pyspark import SQLContext
+from pyspark.streaming.kafka import OffsetRange
+
+from monasca_transform.config.config_initializer import ConfigInitializer
+from monasca_transform.data_driven_specs.data_driven_specs_repo \
+    import DataDrivenSpecsRepoFactory
+from monasca_transform.driver.mon_metrics_kafka \
+    import MonMetricsKafkaProcessor
+from monasca_transform.transform.builder.grouping_sets_transform_builder \
+    import GroupingSetsTransformBuilder
+from monasca_transform.transform import TransformContextUtils
+
+from tests.unit.messaging.adapter import DummyAdapter
+from tests.unit.spark_context_test import SparkContextTest
+from tests.unit.test_resources.kafka_data.data_provider import DataProvider
+from tests.unit.test_resources.mock_component_manager \
+    import MockComponentManager
+
+
+class GroupingSetsTransformBuilderTest(SparkContextTest):
+
+    def setUp(self):
+        super(GroupingSetsTransformBuilderTest, self).setUp()
+        # configure the system with a dummy messaging adapter
+        ConfigInitializer.basic_config(
+            default_config_files=[
+                'tests/unit/test_resources/config/'
+                'test_config_with_dummy_messaging_adapter.conf'])
+        # reset metric_id list dummy adapter
+        if not DummyAdapter.adapter_impl:
+            DummyAdapter.init()
+        DummyAdapter.adapter_impl.metric_list = []
+
+    def tearDown(self):
+        cfg.CONF.clear_override('enable_grouping_sets_aggregation',
+                                group='service')
+        super(GroupingSetsTransformBuilderTest, self).tearDown()
+
+    def _get_published_metrics(self, enable_grouping_sets_aggregation):
+        """run a batch and return the metrics sent to the adapter
+        without the fields that depend on the current time
+        """
+        cfg.CONF.set_override('enable_grouping_sets_aggregation',
+                              enable_grouping_sets_aggregation,
+                              group='service')
+        DummyAdapter.adapter_impl.metric_list = []
+
+        with open(DataProvider.kafka_data_path) as f:
+            raw_lines = f.read().splitlines()
+        raw_tuple_list = [eval(raw_line) for raw_line in raw_lines]
+
+        rdd_monasca = self.spark_context.parallelize(raw_tuple_list)
+
+        myOffsetRanges = [
+            OffsetRange("metrics", 1, 10, 20)]  # mimic rdd.offsetRanges()
+
+        transform_context = TransformContextUtils.get_context(
+            offset_info=myOffsetRanges,
+            batch_time_info=self.get_dummy_batch_time())
+
+        MonMetricsKafkaProcessor.rdd_to_recordstore(
+            rdd_monasca, transform_context)
+
+        metrics = []
+        for metric in DummyAdapter.adapter_impl.metric_list:
+            metrics.append((metric.get('metric').get('name'),
+                            sorted(metric.get('metric')
+                                   .get('dimensions').items()),
+                            metric.get('metric').get('value'),
+                            sorted(metric.get('metric')
+                                   .get('value_meta').items())))
+        return metrics
+
+    @mock.patch('monasca_transform.transform.builder.'
+                'generic_transform_builder.GenericTransformBuilder.'
+                '_get_insert_component_manager')
+    @mock.patch('monasca_transform.transform.builder.'
+                'generic_transform_builder.GenericTransformBuilder.'
+                '_get_setter_component_manager')
+    @mock.patch('monasca_transform.transform.builder.'
+                'generic_transform_builder.GenericTransformBuilder.'
+                '_get_usage_component_manager')
+    def test_grouping_sets_aggregation_matches_per_spec(self,
+                                                        usage_manager,
+                                                        setter_manager,
+                                                        insert_manager):
+
+        usage_manager.return_value = MockComponentManager.get_usage_cmpt_mgr()
+        setter_manager.return_value = \
+            MockComponentManager.get_setter_cmpt_mgr()
+        insert_manager.return_value = \
+            MockComponentManager.get_insert_cmpt_mgr()
+
+        per_spec_metrics = self._get_published_metrics(False)
+        grouping_sets_metrics = self._get_published_metrics(True)
+
+        self.assertTrue(len(per_spec_metrics) > 0)
+        self.assertItemsEqual(per_spec_metrics, grouping_sets_metrics)
+
+    def test_grouping_sets_families(self):
+        sql_context = SQLContext(self.spark_context)
+        data_driven_specs_repo = DataDrivenSpecsRepoFactory.\
+            get_data_driven_specs_repo()
+        (pre_transform_specs_df,
+         pre_transform_spec_rows) = data_driven_specs_repo.\
+            get_cached_pre_transform_specs(sql_context=sql_context)
+        transform_specs = data_driven_specs_repo.\
+            get_compiled_transform_specs(sql_context=sql_context)
+
+        families = GroupingSetsTransformBuilder.get_grouping_sets_families(
+            pre_transform_spec_rows, transform_specs)
+
+        family_id = "grouping_sets:vm.mem.total_mb:avg:hourly"
+        self.assertIn(family_id, families)
+        self.assertEqual(["vm_mem_total_mb_all", "vm_mem_total_mb_project"],
+                         families[family_id].metric_ids)
+
+        # specs which are alone for their event type are not in a family
+        for family in families.values():
+            self.assertNotEqual("mem.total_mb", family.event_type)
+
+        metric_id_lists = GroupingSetsTransformBuilder.\
+            get_record_store_metric_id_lists(pre_transform_spec_rows,
+                                             families)
+        self.assertEqual([family_id], metric_id_lists["vm.mem.total_mb"])
+        self.assertNotIn("mem.total_mb", metric_id_lists)
@@ -0,0 +1,109 @@
+# Copyright 2016 Hewlett Packard Enterprise Development Company LP
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+import mock
+
+from oslo_config import cfg
+from pyspark.streaming.kafka import OffsetRange
+
+from monasca_transform.config.config_initializer import ConfigInitializer
+from monasca_transform.driver.mon_metrics_kafka \
+    import MonMetricsKafkaProcessor
+from monasca_transform.transform import TransformContextUtils
+
+from tests.unit.messaging.adapter import DummyAdapter
+from tests.unit.spark_context_test import SparkContextTest
+from tests.unit.test_resources.kafka_data.data_provider import DataProvider
+from tests.unit.test_resources.mock_component_manager \
+    import MockComponentManager
+
+
+class MultiSpecTransformBuilderTest(SparkContextTest):
+
+    def setUp(self):
+        super(MultiSpecTransformBuilderTest, self).setUp()
+        # configure the system with a dummy messaging adapter
+        ConfigInitializer.basic_config(
+            default_config_files=[
+                'tests/unit/test_resources/config/'
+                'test_config_with_dummy_messaging_adapter.conf'])
+        # reset metric_id list dummy adapter
+        if not DummyAdapter.adapter_impl:
+            DummyAdapter.init()
+        DummyAdapter.adapter_impl.metric_list = []
+
+    def tearDown(self):
+        cfg.CONF.clear_override('enable_multi_spec_aggregation',
+                                group='service')
+        super(MultiSpecTransformBuilderTest, self).tearDown()
+
+    def _get_published_metrics(self, enable_multi_spec_aggregation):
+        """run a batch and return the metrics sent to the adapter
+        without the fields that depend on the current time
+        """
+        cfg.CONF.set_override('enable_multi_spec_aggregation',
+                              enable_multi_spec_aggregation,
+                              group='service')
+        DummyAdapter.adapter_impl.metric_list = []
+
+        with open(DataProvider.kafka_data_path) as f:
+            raw_lines = f.read().splitlines()
+        raw_tuple_list = [eval(raw_line) for raw_line in raw_lines]
+
+        rdd_monasca = self.spark_context.parallelize(raw_tuple_list)
+
+        myOffsetRanges = [
+            OffsetRange("metrics", 1, 10, 20)]  # mimic rdd.offsetRanges()
+
+        transform_context = TransformContextUtils.get_context(
+            offset_info=myOffsetRanges,
+            batch_time_info=self.get_dummy_batch_time())
+
+        MonMetricsKafkaProcessor.rdd_to_recordstore(
+            rdd_monasca, transform_context)
+
+        metrics = []
+        for metric in DummyAdapter.adapter_impl.metric_list:
+            metrics.append((metric.get('metric').get('name'),
+                            sorted(metric.get('metric')
+                                   .get('dimensions').items()),
+                            metric.get('metric').get('value'),
+                            sorted(metric.get('metric')
+                                   .get('value_meta').items())))
+        return metrics
+
+    @mock.patch('monasca_transform.transform.builder.'
+                'generic_transform_builder.GenericTransformBuilder.'
+                '_get_insert_component_manager')
+    @mock.patch('monasca_transform.transform.builder.'
+                'generic_transform_builder.GenericTransformBuilder.'
+                '_get_setter_component_manager')
+    @mock.patch('monasca_transform.transform.builder.'
+                'generic_transform_builder.GenericTransformBuilder.'
+                '_get_usage_component_manager')
+    def test_multi_spec_aggregation_matches_per_spec(self,
+                                                     usage_manager,
+                                                     setter_manager,
+                                                     insert_manager):
+
+        usage_manager.return_value = MockComponentManager.get_usage_cmpt_mgr()
+        setter_manager.return_value = \
+            MockComponentManager.get_setter_cmpt_mgr()
+        insert_manager.return_value = \
+            MockComponentManager.get_insert_cmpt_mgr()
+
+        per_spec_metrics = self._get_published_metrics(False)
+        multi_spec_metrics = self._get_published_metrics(True)
+
+        self.assertTrue(len(per_spec_metrics) > 0)
+        self.assertItemsEqual(per_spec_metrics, multi_spec_metrics)
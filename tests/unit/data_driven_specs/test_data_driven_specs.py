@@ -504,3 +504,46 @@ class TestJSONDataDrivenSpecsRepo(TestDataDrivenSpecsRepo):
 
         self.check_pre_transform_specs_data_frame(
             json_pre_transform_specs_data_frame)
+
+    def test_compiled_transform_specs(self):
+
+        transform_specs = \
+            self.data_driven_specs_repo.get_compiled_transform_specs(
+                sql_context=self.sql_context)
+
+        json_transform_specs_data_frame = \
+            self.data_driven_specs_repo.get_data_driven_specs(
+                sql_context=self.sql_context,
+                data_driven_spec_type=DataDrivenSpecsRepo.transform_specs_type)
+
+        for row in json_transform_specs_data_frame.collect():
+            transform_spec = transform_specs[row.metric_id]
+            agg_params = row.aggregation_params_map
+            self.assertEqual(agg_params.aggregated_metric_name,
+                             transform_spec.aggregated_metric_name)
+            self.assertEqual(agg_params.aggregation_period,
+                             transform_spec.aggregation_period)
+            self.assertEqual(agg_params.aggregation_pipeline.usage,
+                             transform_spec.usage)
+            self.assertEqual(agg_params.aggregation_pipeline.setters,
+                             transform_spec.setters)
+
+        # specs are compiled once and reused while unchanged
+        self.assertIs(
+            transform_specs,
+            self.data_driven_specs_repo.get_compiled_transform_specs(
+                sql_context=self.sql_context))
+
+    def test_cached_pre_transform_specs(self):
+
+        (pre_transform_specs_df, pre_transform_spec_rows) = \
+            self.data_driven_specs_repo.get_cached_pre_transform_specs(
+                sql_context=self.sql_context)
+
+        self.check_pre_transform_specs_data_frame(pre_transform_specs_df)
+
+        # specs are read once and reused while unchanged
+        (cached_pre_transform_specs_df, cached_pre_transform_spec_rows) = \
+            self.data_driven_specs_repo.get_cached_pre_transform_specs(
+                sql_context=self.sql_context)
+        self.assertIs(pre_transform_spec_rows, cached_pre_transform_spec_rows)
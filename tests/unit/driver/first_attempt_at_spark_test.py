@@ -20,9 +20,10 @@ from oslo_config import cfg
 from pyspark.streaming.kafka import OffsetRange
 
 from monasca_transform.config.config_initializer import ConfigInitializer
+from monasca_transform.data_driven_specs.transform_spec \
+    import TransformSpecCompiler
 from monasca_transform.driver.mon_metrics_kafka \
     import MonMetricsKafkaProcessor
-from monasca_transform.transform import RddTransformContext
 from monasca_transform.transform import TransformContextUtils
 
 from tests.unit.messaging.adapter import DummyAdapter
@@ -34,6 +35,12 @@ from tests.unit.test_resources.mock_component_manager \
 
 class SparkUnitTest(unittest.TestCase):
 
+    def setUp(self):
+        ConfigInitializer.basic_config(
+            default_config_files=[
+                'tests/unit/test_resources/config/'
+                'test_config_with_dummy_messaging_adapter.conf'])
+
     def test_transform_to_recordstore(self):
         # simply verify that the transform method is called first, then
         # rdd to recordstore
@@ -41,7 +48,7 @@ class SparkUnitTest(unittest.TestCase):
         transformed_stream = MagicMock(name='transformed_stream')
         kafka_stream.transform.return_value = transformed_stream
         transformed_stream_expected = call.foreachRDD(
-            MonMetricsKafkaProcessor.rdd_to_recordstore
+            MonMetricsKafkaProcessor.process_batch
         ).call_list()
         kafka_stream_expected = call.transform(
             MonMetricsKafkaProcessor.store_offset_ranges
@@ -54,6 +61,101 @@ class SparkUnitTest(unittest.TestCase):
         self.assertEqual(
             transformed_stream_expected, transformed_stream.mock_calls)
 
+    def test_get_message_count(self):
+        offset_ranges = [OffsetRange("metrics", 0, 10, 20),
+                         OffsetRange("metrics", 1, 5, 5)]
+        self.assertEqual(
+            10, MonMetricsKafkaProcessor._get_message_count(offset_ranges))
+
+    @mock.patch('monasca_transform.driver.mon_metrics_kafka.'
+                'MonMetricsKafkaProcessor.rdd_to_recordstore')
+    def test_process_batch_removes_transform_contexts(self,
+                                                      rdd_to_recordstore):
+        rdd_to_recordstore.side_effect = ValueError("batch failed")
+        batch_transform_contexts = \
+            MonMetricsKafkaProcessor.batch_transform_contexts
+        batch_transform_contexts.clear()
+        batch_transform_contexts.update({1: "failed_before_processing",
+                                         2: "failed_in_processing",
+                                         3: "next_batch"})
+
+        self.assertRaises(ValueError,
+                          MonMetricsKafkaProcessor.process_batch,
+                          2, MagicMock(name='rdd'))
+
+        self.assertEqual("failed_in_processing",
+                         rdd_to_recordstore.call_args[0][1])
+        self.assertEqual({3: "next_batch"}, batch_transform_contexts)
+        batch_transform_contexts.clear()
+
+    @mock.patch('monasca_transform.driver.mon_metrics_kafka.SQLContext')
+    @mock.patch('monasca_transform.driver.mon_metrics_kafka.ShuffleUtils')
+    @mock.patch('monasca_transform.driver.mon_metrics_kafka.'
+                'MonMetricsKafkaProcessor.rdd_to_recordstore')
+    def test_process_batch_resets_shuffle_partitions(self,
+                                                     rdd_to_recordstore,
+                                                     shuffle_utils,
+                                                     sql_context):
+        rdd = MagicMock(name='rdd')
+        MonMetricsKafkaProcessor.process_batch(1, rdd)
+        self.assertFalse(shuffle_utils.reset_shuffle_partitions.called)
+
+        cfg.CONF.set_override('enable_shuffle_partition_tuning', True,
+                              group='service')
+        rdd_to_recordstore.side_effect = ValueError("batch failed")
+        try:
+            self.assertRaises(ValueError,
+                              MonMetricsKafkaProcessor.process_batch,
+                              2, rdd)
+        finally:
+            cfg.CONF.clear_override('enable_shuffle_partition_tuning',
+                                    group='service')
+        sql_context.getOrCreate.assert_called_once_with(rdd.context)
+        shuffle_utils.reset_shuffle_partitions.assert_called_once_with(
+            sql_context.getOrCreate.return_value)
+
+    @mock.patch('monasca_transform.driver.mon_metrics_kafka.'
+                'HourlyStateProcessor')
+    @mock.patch('monasca_transform.driver.mon_metrics_kafka.'
+                'MonMetricsKafkaProcessor.rdd_to_recordstore')
+    def test_process_batch_runs_hourly_state_on_empty_batch(
+            self, rdd_to_recordstore, hourly_state_processor):
+        hourly_state_processor.is_time_to_run.return_value = True
+        batch_transform_contexts = \
+            MonMetricsKafkaProcessor.batch_transform_contexts
+        batch_transform_contexts.clear()
+        batch_transform_contexts[2] = "batch_with_messages"
+        rdd = MagicMock(name='rdd')
+
+        # batches with messages run the processor in rdd_to_recordstore
+        MonMetricsKafkaProcessor.process_batch(2, rdd)
+        self.assertFalse(hourly_state_processor.run_processor.called)
+
+        # empty batches still publish hours which have closed
+        MonMetricsKafkaProcessor.process_batch(3, rdd)
+        hourly_state_processor.run_processor.assert_called_once_with(
+            rdd.context, 3)
+
+    def test_get_record_store_columns(self):
+        transform_spec = TransformSpecCompiler.compile_transform_spec(
+            {"metric_id": "vm_mem_total_mb_project",
+             "aggregation_params_map": {
+                 "aggregation_period": "hourly",
+                 "aggregation_group_by_list": ["host", "tenant_id"],
+                 "setter_rollup_group_by_list": ["tenant_id"],
+                 "dimension_list": ["aggregation_period", "project_id"]}})
+        record_store_columns = ["event_timestamp_unix", "event_type",
+                                "event_quantity", "resource_uuid",
+                                "tenant_id", "mount", "host", "metric_id",
+                                "event_day_bucket", "event_hour_bucket"]
+
+        self.assertEqual(
+            ["event_timestamp_unix", "event_type", "event_quantity",
+             "tenant_id", "host", "metric_id", "event_hour_bucket"],
+            MonMetricsKafkaProcessor._get_record_store_columns(
+                {transform_spec.metric_id: transform_spec},
+                record_store_columns))
+
 
 class SparkTest(SparkContextTest):
 
@@ -107,18 +209,15 @@ class SparkTest(SparkContextTest):
             offset_info=myOffsetRanges,
             batch_time_info=self.get_dummy_batch_time())
 
-        rdd_monasca_with_offsets = rdd_monasca.map(
-            lambda x: RddTransformContext(x, transform_context))
-
         # Do something simple with the RDD
-        result = simple_count_transform(rdd_monasca_with_offsets)
+        result = simple_count_transform(rdd_monasca)
 
         # Verify it worked
         self.assertEqual(result, 363)
 
         # Call the primary method in mon_metrics_kafka
         MonMetricsKafkaProcessor.rdd_to_recordstore(
-            rdd_monasca_with_offsets)
+            rdd_monasca, transform_context)
 
         # get the metrics that have been submitted to the dummy message adapter
         metrics = DummyAdapter.adapter_impl.metric_list
@@ -0,0 +1,98 @@
+# Copyright 2016 Hewlett Packard Enterprise Development Company LP
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+import json
+import unittest
+
+from monasca_transform.driver.mon_metrics_kafka \
+    import MonMetricsKafkaProcessor
+
+from tests.unit.spark_context_test import SparkContextTest
+
+
+class RawMetricPrefilterTest(unittest.TestCase):
+
+    event_types = frozenset(["mem.total_mb", "cpu.idle_perc"])
+
+    @staticmethod
+    def _get_raw_metric(name, dimensions=None):
+        metric = {"metric": {"name": name,
+                             "dimensions": dimensions or {},
+                             "timestamp": 1453308000000,
+                             "value": 1.0},
+                  "meta": {"tenantId": "tenant1", "region": "useast"},
+                  "creation_time": 1453308000}
+        return json.dumps(metric)
+
+    def _is_event_type_raw_metric(self, raw_metric):
+        return MonMetricsKafkaProcessor._is_event_type_raw_metric(
+            raw_metric, self.event_types)
+
+    def test_metric_of_event_type_is_kept(self):
+        self.assertTrue(self._is_event_type_raw_metric(
+            self._get_raw_metric("mem.total_mb")))
+        self.assertTrue(self._is_event_type_raw_metric(
+            '{"metric" : { "name" :  "cpu.idle_perc", "value": 1.0}}'))
+
+    def test_metric_of_other_event_type_is_dropped(self):
+        self.assertFalse(self._is_event_type_raw_metric(
+            self._get_raw_metric("mem.free_mb")))
+
+    def test_escaped_name_is_kept(self):
+        # names with escapes are not decoded, so they are never dropped
+        self.assertTrue(self._is_event_type_raw_metric(
+            '{"metric": {"name": "mem\\u002efree_mb", "value": 1.0}}'))
+        self.assertTrue(self._is_event_type_raw_metric(
+            self._get_raw_metric('mem."free"_mb')))
+
+    def test_payload_without_name_is_kept(self):
+        self.assertTrue(self._is_event_type_raw_metric(
+            '{"metric": {"value": 1.0}}'))
+        self.assertTrue(self._is_event_type_raw_metric("not json"))
+
+    def test_dimension_named_name(self):
+        # the value of a "name" dimension matches the pattern too, the
+        # metric is kept if any of the names is an event type
+        self.assertTrue(self._is_event_type_raw_metric(
+            self._get_raw_metric("mem.total_mb",
+                                 {"name": "mem.free_mb"})))
+        self.assertTrue(self._is_event_type_raw_metric(
+            self._get_raw_metric("mem.free_mb",
+                                 {"name": "mem.total_mb"})))
+        self.assertFalse(self._is_event_type_raw_metric(
+            self._get_raw_metric("mem.free_mb",
+                                 {"name": "host1"})))
+        # a dimension value "name" is not a name key
+        self.assertFalse(self._is_event_type_raw_metric(
+            self._get_raw_metric("mem.free_mb",
+                                 {"service": "name",
+                                  "hostname": "mem.total_mb"})))
+
+
+class RawMetricPrefilterCountTest(SparkContextTest):
+
+    def test_kept_and_dropped_counts(self):
+        raw_metrics = [RawMetricPrefilterTest._get_raw_metric(name)
+                       for name in ["mem.total_mb", "mem.free_mb",
+                                    "cpu.idle_perc", "mem.free_mb",
+                                    "disk.total_space_mb"]]
+        (filtered_raw_metrics,
+         prefilter_kept,
+         prefilter_dropped) = MonMetricsKafkaProcessor.\
+            _prefilter_raw_metrics(
+                self.spark_context.parallelize(raw_metrics, 2),
+                RawMetricPrefilterTest.event_types)
+
+        self.assertEqual(2, filtered_raw_metrics.count())
+        self.assertEqual(2, prefilter_kept.value)
+        self.assertEqual(3, prefilter_dropped.value)
@@ -0,0 +1,100 @@
+# Copyright 2016 Hewlett Packard Enterprise Development Company LP
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+import mock
+import pickle
+
+from oslo_config import cfg
+from pyspark import cloudpickle
+from pyspark.rdd import RDD
+from pyspark.sql import SQLContext
+
+from monasca_transform.component.insert import InsertComponent
+from monasca_transform.config.config_initializer import ConfigInitializer
+from monasca_transform.transform.transform_utils import InstanceUsageUtils
+
+from tests.unit.messaging.adapter import DummyAdapter
+from tests.unit.spark_context_test import SparkContextTest
+
+
+class InsertFromExecutorsTest(SparkContextTest):
+
+    def setUp(self):
+        super(InsertFromExecutorsTest, self).setUp()
+        # configure the system with a dummy messaging adapter
+        ConfigInitializer.basic_config(
+            default_config_files=[
+                'tests/unit/test_resources/config/'
+                'test_config_with_dummy_messaging_adapter.conf'])
+        cfg.CONF.set_override('insert_batch_size', 2, group='messaging')
+        cfg.CONF.set_override('publish_kafka_tenant_id', 'tenant_x',
+                              group='messaging')
+        # reset metric_id list dummy adapter
+        if not DummyAdapter.adapter_impl:
+            DummyAdapter.init()
+        DummyAdapter.adapter_impl.metric_list = []
+        self.sql_context = SQLContext.getOrCreate(self.spark_context)
+
+    def tearDown(self):
+        super(InsertFromExecutorsTest, self).tearDown()
+        for name in cfg.CONF.messaging:
+            cfg.CONF.clear_override(name, group='messaging')
+        InsertComponent._executor_messaging_options = None
+
+    @staticmethod
+    def _run_on_executor(rdd, partition_function):
+        """run a partition function in this process after shipping it
+        the way spark does, so that the dummy adapter can be inspected
+        """
+        shipped_function = pickle.loads(cloudpickle.dumps(partition_function))
+        shipped_function(iter(rdd.collect()))
+
+    def test_write_metrics_from_partitions(self):
+        instance_usage_dict_list = [
+            {"host": "host%s" % index, "aggregated_metric_name": "mem.total",
+             "quantity": float(index), "record_count": 1.0}
+            for index in range(3)]
+        instance_usage_df = InstanceUsageUtils.create_df_from_dict_rdd(
+            self.sql_context,
+            self.spark_context.parallelize(instance_usage_dict_list))
+        agg_params = {"dimension_list": ["host"]}
+
+        with mock.patch.object(RDD, "foreachPartition", autospec=True,
+                               side_effect=self._run_on_executor), \
+                mock.patch.object(DummyAdapter, "send_metrics",
+                                  wraps=DummyAdapter.send_metrics) \
+                as send_metrics, \
+                mock.patch.object(ConfigInitializer,
+                                  "basic_config") as basic_config:
+            InsertComponent._write_metrics_from_partitions(
+                instance_usage_df, DummyAdapter,
+                lambda row: InsertComponent._get_metric(row, agg_params))
+
+        # configuration files are not read on executors, messaging
+        # options are shipped with the closure
+        self.assertFalse(basic_config.called)
+        self.assertEqual(cfg.CONF.messaging.brokers,
+                         InsertComponent._executor_messaging_options[
+                             "brokers"])
+
+        # metrics are sent in batches of insert_batch_size
+        self.assertEqual([2, 1], [len(call[0][0]) for call
+                                  in send_metrics.call_args_list])
+
+        metrics = DummyAdapter.adapter_impl.metric_list
+        self.assertEqual(["host0", "host1", "host2"],
+                         sorted(metric["metric"]["dimensions"]["host"]
+                                for metric in metrics))
+        for metric in metrics:
+            self.assertEqual("tenant_x", metric["meta"]["tenantId"])
+            self.assertEqual("mem.total", metric["metric"]["name"])
@@ -35,3 +35,14 @@ class DummyAdapter(MessageAdapter):
         if not DummyAdapter.adapter_impl:
             DummyAdapter.init()
         DummyAdapter.adapter_impl.do_send_metric(metric)
+
+    @staticmethod
+    def send_metrics(metrics):
+        if not DummyAdapter.adapter_impl:
+            DummyAdapter.init()
+        DummyAdapter.adapter_impl.do_send_metrics(metrics)
+
+    @staticmethod
+    def flush():
+        if DummyAdapter.adapter_impl:
+            DummyAdapter.adapter_impl.do_flush()
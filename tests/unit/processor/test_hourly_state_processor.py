@@ -0,0 +1,226 @@
+# Copyright 2016 Hewlett Packard Enterprise Development Company LP
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+import datetime
+import mock
+import shutil
+import tempfile
+
+from oslo_config import cfg
+from pyspark.sql import SQLContext
+
+from monasca_transform.component.insert.dummy_insert import DummyInsert
+from monasca_transform.component.insert.kafka_insert_pre_hourly \
+    import KafkaInsertPreHourly
+from monasca_transform.config.config_initializer import ConfigInitializer
+from monasca_transform.processor.hourly_state_processor \
+    import HourlyStateProcessor
+from monasca_transform.processor.hourly_state_processor \
+    import HourlyStateProcessorException
+from monasca_transform.transform.transform_utils import InstanceUsageUtils
+
+from tests.unit.messaging.adapter import DummyAdapter
+from tests.unit.spark_context_test import SparkContextTest
+
+
+class TestHourlyStateProcessor(SparkContextTest):
+
+    def setUp(self):
+        super(TestHourlyStateProcessor, self).setUp()
+        ConfigInitializer.basic_config(
+            default_config_files=[
+                'tests/unit/test_resources/config/'
+                'test_config_with_dummy_messaging_adapter.conf'])
+        self.sql_context = SQLContext.getOrCreate(self.spark_context)
+        self.state_checkpoint_dir = tempfile.mkdtemp()
+        cfg.CONF.set_override('state_checkpoint_dir',
+                              self.state_checkpoint_dir,
+                              group='hourly_state_processor')
+        # reset metric_id list dummy adapter
+        if not DummyAdapter.adapter_impl:
+            DummyAdapter.init()
+        DummyAdapter.adapter_impl.metric_list = []
+
+    def tearDown(self):
+        super(TestHourlyStateProcessor, self).tearDown()
+        cfg.CONF.clear_override('state_checkpoint_dir',
+                                group='hourly_state_processor')
+        shutil.rmtree(self.state_checkpoint_dir)
+        HourlyStateProcessor.state_df = None
+        HourlyStateProcessor.state_hour = None
+        KafkaInsertPreHourly.batch_instance_usage = []
+
+    def _get_instance_usage_df(self, usage_list):
+        instance_usage_dict_list = [
+            {"host": host, "usage_date": "2016-06-20",
+             "usage_hour": usage_hour, "aggregation_period": "hourly",
+             "aggregated_metric_name": "mem.total_mb_agg",
+             "quantity": quantity, "record_count": quantity_count,
+             "firstrecord_timestamp_unix": 1466421899.0,
+             "lastrecord_timestamp_unix": 1466422184.0,
+             "processing_meta": {"metric_id": "mem_total_all",
+                                 "quantity_sum": quantity * quantity_count,
+                                 "quantity_count": quantity_count,
+                                 "quantity_min": quantity,
+                                 "quantity_max": quantity}}
+            for (host, usage_hour, quantity, quantity_count) in usage_list]
+        return InstanceUsageUtils.create_df_from_dict_rdd(
+            self.sql_context,
+            self.spark_context.parallelize(instance_usage_dict_list))
+
+    def test_state_is_merged_and_closed_by_hour(self):
+        first_batch_df = HourlyStateProcessor._to_state_df(
+            "mem_total_all",
+            self._get_instance_usage_df([("host1", "11", 10.0, 2.0),
+                                         ("host2", "11", 4.0, 1.0)]))
+        second_batch_df = HourlyStateProcessor._to_state_df(
+            "mem_total_all",
+            self._get_instance_usage_df([("host1", "11", 40.0, 1.0),
+                                         ("host1", "12", 8.0, 1.0)]))
+
+        state_df = HourlyStateProcessor._merge_state(
+            first_batch_df.unionAll(second_batch_df))
+
+        state_list = sorted(
+            (row.host, row.usage_hour, row.quantity_sum,
+             row.quantity_count, row.quantity_max, row.record_count)
+            for row in state_df.collect())
+        self.assertEqual([("host1", "11", 60.0, 3.0, 40.0, 3.0),
+                          ("host1", "12", 8.0, 1.0, 8.0, 1.0),
+                          ("host2", "11", 4.0, 1.0, 4.0, 1.0)],
+                         state_list)
+
+        # a batch in hour 12 closes hour 11
+        closed_condition = HourlyStateProcessor._get_closed_condition(
+            state_df, datetime.datetime(2016, 6, 20, 12, 10))
+        self.assertEqual(["11", "11"],
+                         [row.usage_hour for row in
+                          state_df.where(closed_condition).collect()])
+        self.assertEqual(["12"],
+                         [row.usage_hour for row in
+                          state_df.where(~closed_condition).collect()])
+
+    def test_state_checkpoint_round_trip(self):
+        state_df = HourlyStateProcessor._to_state_df(
+            "mem_total_all",
+            self._get_instance_usage_df([("host1", "11", 10.0, 2.0)]))
+
+        HourlyStateProcessor._save_state(
+            self.sql_context, state_df,
+            datetime.datetime(2016, 6, 20, 11, 10))
+        HourlyStateProcessor._save_state(
+            self.sql_context, state_df.where(state_df.host == "none"),
+            datetime.datetime(2016, 6, 20, 11, 20))
+        HourlyStateProcessor._save_state(
+            self.sql_context, state_df,
+            datetime.datetime(2016, 6, 20, 11, 30))
+
+        # only the latest checkpoint is kept, and it is loaded
+        checkpoint_paths = HourlyStateProcessor._get_checkpoint_paths(
+            self.spark_context)
+        self.assertEqual(1, len(checkpoint_paths))
+        self.assertTrue(checkpoint_paths[0].endswith("20160620113000"))
+
+        loaded_df = HourlyStateProcessor._load_state(self.sql_context)
+        self.assertEqual(HourlyStateProcessor._get_state_schema(),
+                         loaded_df.schema)
+        self.assertEqual(state_df.collect(), loaded_df.collect())
+
+    def test_load_state_without_checkpoint(self):
+        loaded_df = HourlyStateProcessor._load_state(self.sql_context)
+        self.assertEqual(HourlyStateProcessor._get_state_schema(),
+                         loaded_df.schema)
+        self.assertEqual(0, loaded_df.count())
+
+    @mock.patch('monasca_transform.processor.pre_hourly_processor.KafkaInsert',
+                DummyInsert)
+    def test_closed_hours_are_emitted_and_state_is_checkpointed(self):
+        KafkaInsertPreHourly.batch_instance_usage = [
+            ("mem_total_all",
+             self._get_instance_usage_df([("host1", "11", 10.0, 2.0),
+                                          ("host2", "11", 4.0, 1.0)]))]
+        HourlyStateProcessor.run_processor(
+            self.spark_context, datetime.datetime(2016, 6, 20, 11, 50))
+
+        # nothing is published while the hour is open
+        self.assertEqual([], DummyAdapter.adapter_impl.metric_list)
+        self.assertEqual([], KafkaInsertPreHourly.batch_instance_usage)
+
+        KafkaInsertPreHourly.batch_instance_usage = [
+            ("mem_total_all",
+             self._get_instance_usage_df([("host1", "11", 40.0, 1.0),
+                                          ("host1", "12", 8.0, 1.0)]))]
+        HourlyStateProcessor.run_processor(
+            self.spark_context, datetime.datetime(2016, 6, 20, 11, 55))
+        self.assertEqual([], DummyAdapter.adapter_impl.metric_list)
+
+        # a batch without instance usage in hour 12 closes hour 11
+        HourlyStateProcessor.run_processor(
+            self.spark_context, datetime.datetime(2016, 6, 20, 12, 5))
+
+        # averages of each host over both batches of the hour
+        metrics = sorted(
+            (value.get('metric').get('name'),
+             value.get('metric').get('dimensions').get('host'),
+             value.get('metric').get('value'),
+             value.get('metric').get('value_meta').get('record_count'))
+            for value in DummyAdapter.adapter_impl.metric_list)
+        self.assertEqual([('mem.total_mb_agg', 'host1', 20.0, 3.0),
+                          ('mem.total_mb_agg', 'host2', 4.0, 1.0)],
+                         metrics)
+
+        # the open hour is in the latest checkpoint
+        HourlyStateProcessor.state_df = None
+        loaded_df = HourlyStateProcessor._load_state(self.sql_context)
+        self.assertEqual([("host1", "12", 8.0, 1.0)],
+                         [(row.host, row.usage_hour, row.quantity_sum,
+                           row.quantity_count)
+                          for row in loaded_df.collect()])
+
+    @mock.patch('monasca_transform.processor.hourly_state_processor.'
+                'HourlyStateProcessor._save_state')
+    @mock.patch('monasca_transform.processor.hourly_state_processor.'
+                'HourlyStateProcessor._emit_state')
+    def test_empty_batch_in_same_hour_is_skipped(self, emit_state,
+                                                 save_state):
+        HourlyStateProcessor.run_processor(
+            self.spark_context, datetime.datetime(2016, 6, 20, 11, 50))
+        self.assertEqual(1, emit_state.call_count)
+        self.assertEqual(1, save_state.call_count)
+
+        HourlyStateProcessor.run_processor(
+            self.spark_context, datetime.datetime(2016, 6, 20, 11, 55))
+        self.assertEqual(1, emit_state.call_count)
+        self.assertEqual(1, save_state.call_count)
+
+        HourlyStateProcessor.run_processor(
+            self.spark_context, datetime.datetime(2016, 6, 20, 12, 0))
+        self.assertEqual(2, emit_state.call_count)
+        self.assertEqual(2, save_state.call_count)
+
+    def test_pre_hourly_processor_cannot_be_enabled(self):
+        cfg.CONF.set_override('hourly_state_processor_enabled', True,
+                              group='stage_processors')
+        cfg.CONF.set_override('pre_hourly_processor_enabled', True,
+                              group='stage_processors')
+        try:
+            self.assertRaises(HourlyStateProcessorException,
+                              HourlyStateProcessor.check_config)
+            cfg.CONF.set_override('pre_hourly_processor_enabled', False,
+                                  group='stage_processors')
+            HourlyStateProcessor.check_config()
+        finally:
+            cfg.CONF.clear_override('hourly_state_processor_enabled',
+                                    group='stage_processors')
+            cfg.CONF.clear_override('pre_hourly_processor_enabled',
+                                    group='stage_processors')
@@ -11,9 +11,12 @@
 # WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
 # License for the specific language governing permissions and limitations
 # under the License.
+import json
 import mock
 import unittest
 
+from oslo_config import cfg
+
 from pyspark.streaming.kafka import OffsetRange
 
 from monasca_transform.component.insert.dummy_insert import DummyInsert
@@ -124,9 +127,134 @@ class TestPreHourlyProcessorAgg(SparkContextTest):
                          .get("metric")
                          .get('value_meta').get('record_count'))
 
+    def test_offset_range_chunks(self):
+        chunk_list = PreHourlyProcessor.get_offset_range_chunks(
+            [OffsetRange("metrics_pre_hourly", 0, 10, 35),
+             OffsetRange("metrics_pre_hourly", 1, 5, 10)], 10)
+
+        self.assertEqual(
+            [[(10, 20), (5, 10)], [(20, 30), (10, 10)], [(30, 35), (10, 10)]],
+            [[(o.fromOffset, o.untilOffset) for o in chunk]
+             for chunk in chunk_list])
+
+        # chunking is disabled with 0
+        chunk_list = PreHourlyProcessor.get_offset_range_chunks(
+            [OffsetRange("metrics_pre_hourly", 0, 10, 35)], 0)
+        self.assertEqual(1, len(chunk_list))
+
+    @mock.patch('monasca_transform.processor.pre_hourly_processor.KafkaInsert',
+                DummyInsert)
+    @mock.patch('monasca_transform.component.insert.kafka_insert_pre_hourly.'
+                'KafkaMessageAdapterPreHourly')
+    @mock.patch('monasca_transform.processor.pre_hourly_processor.'
+                'PreHourlyProcessor.save_kafka_offsets')
+    @mock.patch('monasca_transform.processor.pre_hourly_processor.'
+                'PreHourlyProcessor.fetch_pre_hourly_data')
+    @mock.patch('monasca_transform.processor.pre_hourly_processor.'
+                'PreHourlyProcessor.get_processing_offset_range_list')
+    def test_pre_hourly_processor_chunks(self,
+                                         offset_range_list,
+                                         pre_hourly_data,
+                                         save_kafka_offsets,
+                                         pre_hourly_adapter):
+
+        with open(DataProvider.metrics_pre_hourly_data_path) as f:
+            raw_lines = f.read().splitlines()
+        raw_tuple_list = [eval(raw_line) for raw_line in raw_lines]
+
+        # each chunk has data of both metrics
+        chunk_tuple_lists = {10: [raw_tuple_list[i] for i in [0, 1, 3]],
+                             13: [raw_tuple_list[i] for i in [2, 4, 5]]}
+
+        def get_partial_tuple_list():
+            return [('', json.dumps(call[0][0])) for call in
+                    pre_hourly_adapter.send_metric.call_args_list]
+
+        # partials written by the chunks follow the backlog
+        pre_hourly_data.side_effect = \
+            lambda spark_context, offset_ranges: \
+            self.spark_context.parallelize(
+                chunk_tuple_lists[offset_ranges[0].fromOffset]
+                if offset_ranges[0].fromOffset in chunk_tuple_lists
+                else get_partial_tuple_list())
+
+        offset_range_list.side_effect = [
+            [OffsetRange("metrics_pre_hourly", 1, 10, 16)],
+            [OffsetRange("metrics_pre_hourly", 1, 16, 20)]]
+        cfg.CONF.set_override('max_messages_per_chunk', 3,
+                              group='pre_hourly_processor')
+        try:
+            PreHourlyProcessor.run_processor(
+                self.spark_context, self.get_dummy_batch_time())
+        finally:
+            cfg.CONF.clear_override('max_messages_per_chunk',
+                                    group='pre_hourly_processor')
+
+        # partial rollups are carried forward and offsets saved per chunk,
+        # then the partials are rolled up in the same run
+        self.assertEqual(4, pre_hourly_adapter.send_metric.call_count)
+        self.assertEqual(
+            [[(10, 13)], [(13, 16)], [(16, 20)]],
+            [[(o.fromOffset, o.untilOffset) for o in call[0][0]]
+             for call in save_kafka_offsets.call_args_list])
+
+        metrics = DummyAdapter.adapter_impl.metric_list
+        mem_usable_mb_agg_metric = [
+            value for value in metrics
+            if value.get('metric').get('name') ==
+            'mem.usable_mb_agg' and
+            value.get('metric').get('dimensions').get('host') ==
+            'all'][0]
+        self.assertAlmostEqual(10283.1,
+                               mem_usable_mb_agg_metric
+                               .get('metric').get('value'))
+        self.assertEqual(60.0,
+                         mem_usable_mb_agg_metric
+                         .get("metric")
+                         .get('value_meta').get('record_count'))
+        self.assertEqual("2016-06-20 11:24:59",
+                         mem_usable_mb_agg_metric
+                         .get("metric")
+                         .get('value_meta').get('firstrecord_timestamp'))
+
     def simple_count_transform(self, rdd):
         return rdd.count()
 
+    @mock.patch('monasca_transform.processor.pre_hourly_processor.'
+                'PreHourlyProcessor._get_offsets_from_kafka')
+    def test_new_offset_range_list_with_lookback(self, offsets_from_kafka):
+
+        def get_offsets(brokers, topic, offset_time):
+            # partition 0 has data before the look back time, partition 1
+            # only has newer data, so kafka returns no offset for it
+            offsets = {-1: ([500], [90]), -2: ([100], [10])}.get(
+                offset_time, ([300], []))
+            return dict(
+                ("%s_%s" % (topic, partition),
+                 mock.Mock(topic=topic, partition=partition,
+                           offsets=offsets[partition]))
+                for partition in [0, 1])
+
+        offsets_from_kafka.side_effect = get_offsets
+
+        offset_range_list = sorted(
+            PreHourlyProcessor._get_new_offset_range_list(
+                "localhost:9092", "metrics_pre_hourly", lookback_hours=2),
+            key=lambda o: o.partition)
+
+        self.assertEqual([(300, 500), (10, 90)],
+                         [(o.fromOffset, o.untilOffset)
+                          for o in offset_range_list])
+
+        offset_range_list = sorted(
+            PreHourlyProcessor._get_new_offset_range_list(
+                "localhost:9092", "metrics_pre_hourly"),
+            key=lambda o: o.partition)
+
+        self.assertEqual([(100, 500), (10, 90)],
+                         [(o.fromOffset, o.untilOffset)
+                          for o in offset_range_list])
+
 
 if __name__ == "__main__":
     print("PATH *************************************************************")
@@ -11,8 +11,14 @@
 # WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
 # License for the specific language governing permissions and limitations
 # under the License.
+import datetime
+import json
+
 from pyspark.sql import SQLContext
 
+from monasca_transform.data_driven_specs.transform_spec \
+    import TransformSpecCompiler
+from monasca_transform.transform.transform_utils import InstanceUsageUtils
 from monasca_transform.transform.transform_utils import RecordStoreUtils
 from monasca_transform.transform.transform_utils import TransformSpecsUtils
 from monasca_transform.transform import TransformContextUtils
@@ -57,3 +63,111 @@ class UsageComponentTest(SparkContextTest):
             ('2016-02-08', '18', 'all', 'all', 12946.0)]
 
         self.assertItemsEqual(result_list, expected_result)
+
+    def test_rollup_merges_partial_state(self):
+
+        record_store_df = RecordStoreUtils.create_df_from_json(
+            self.sql_context, DataProvider.record_store_path)
+
+        # partial state is kept when the pre hourly operation is the
+        # usage fetch operation
+        with open(DataProvider.transform_spec_path) as transform_spec_file:
+            transform_spec_dict = json.loads(transform_spec_file.read())
+        transform_spec_dict["aggregation_params_map"][
+            "pre_hourly_operation"] = "avg"
+
+        transform_context = TransformContextUtils.get_context(
+            transform_spec_info=TransformSpecCompiler.compile_transform_spec(
+                transform_spec_dict),
+            batch_time_info=self.get_dummy_batch_time())
+
+        # averages of each host, with the sum and count of their records
+        instance_usage_df = FetchQuantity.usage_by_operation(
+            transform_context, record_store_df, "avg")
+        host_list = [(row.quantity,
+                      float(row.processing_meta["quantity_sum"]),
+                      float(row.processing_meta["quantity_count"]))
+                     for row in instance_usage_df.rdd.collect()]
+
+        # an average of all records, not an average of host averages
+        instance_usage_df_all = RollupQuantity.do_rollup(
+            [], "hourly", "avg", instance_usage_df)
+        expected_quantity = sum(quantity_sum for (quantity, quantity_sum,
+                                                  quantity_count)
+                                in host_list) / \
+            sum(quantity_count for (quantity, quantity_sum, quantity_count)
+                in host_list)
+
+        self.assertAlmostEqual(expected_quantity,
+                               instance_usage_df_all.first().quantity)
+
+    def _get_instance_usage_df(self):
+        instance_usage_dict_list = [
+            {"tenant_id": "tenant1", "host": "host1",
+             "usage_date": "2016-01-20", "usage_hour": "16",
+             "usage_minute": "all", "aggregation_period": "hourly",
+             "firstrecord_timestamp_unix": 1453308000.0,
+             "lastrecord_timestamp_unix": 1453308300.0,
+             "quantity": 2.0, "record_count": 2.0},
+            {"tenant_id": "tenant1", "host": "host2",
+             "usage_date": "2016-01-20", "usage_hour": "16",
+             "usage_minute": "all", "aggregation_period": "hourly",
+             "firstrecord_timestamp_unix": 1453308060.0,
+             "lastrecord_timestamp_unix": 1453308600.0,
+             "quantity": 3.0, "record_count": 3.0},
+            {"tenant_id": "tenant2", "host": "host1",
+             "usage_date": "2016-01-20", "usage_hour": "16",
+             "usage_minute": "all", "aggregation_period": "hourly",
+             "firstrecord_timestamp_unix": 1453308120.0,
+             "lastrecord_timestamp_unix": 1453308240.0,
+             "quantity": 5.0, "record_count": 1.0}]
+        return InstanceUsageUtils.create_df_from_dict_rdd(
+            self.sql_context,
+            self.spark_context.parallelize(instance_usage_dict_list))
+
+    @staticmethod
+    def _get_timestamp_string(timestamp_unix):
+        return datetime.datetime.fromtimestamp(
+            timestamp_unix).strftime('%Y-%m-%d %H:%M:%S')
+
+    def test_rollup_timestamps_and_project_id(self):
+        instance_usage_df = self._get_instance_usage_df()
+
+        # project_id is set from tenant_id when grouping by tenant_id
+        rolled_up_df = RollupQuantity._rollup_quantity(
+            instance_usage_df,
+            ["usage_date", "usage_hour", "tenant_id"], "sum")
+        result_dict = dict((row.tenant_id, row)
+                           for row in rolled_up_df.collect())
+
+        self.assertEqual(2, len(result_dict))
+        tenant1_row = result_dict["tenant1"]
+        self.assertEqual("tenant1", tenant1_row.project_id)
+        self.assertEqual("all", tenant1_row.host)
+        self.assertEqual(5.0, tenant1_row.quantity)
+        self.assertEqual(5.0, tenant1_row.record_count)
+        self.assertEqual(1453308000.0, tenant1_row.firstrecord_timestamp_unix)
+        self.assertEqual(self._get_timestamp_string(1453308000.0),
+                         tenant1_row.firstrecord_timestamp_string)
+        self.assertEqual(1453308600.0, tenant1_row.lastrecord_timestamp_unix)
+        self.assertEqual(self._get_timestamp_string(1453308600.0),
+                         tenant1_row.lastrecord_timestamp_string)
+        self.assertEqual("tenant2", result_dict["tenant2"].project_id)
+
+        # project_id is "all" otherwise
+        rolled_up_df = RollupQuantity._rollup_quantity(
+            instance_usage_df, ["usage_date", "usage_hour", "host"], "max")
+        result_dict = dict((row.host, row)
+                           for row in rolled_up_df.collect())
+
+        self.assertEqual(2, len(result_dict))
+        host1_row = result_dict["host1"]
+        self.assertEqual("all", host1_row.project_id)
+        self.assertEqual("all", host1_row.tenant_id)
+        self.assertEqual(5.0, host1_row.quantity)
+        self.assertEqual(self._get_timestamp_string(1453308000.0),
+                         host1_row.firstrecord_timestamp_string)
+        self.assertEqual(self._get_timestamp_string(1453308300.0),
+                         host1_row.lastrecord_timestamp_string)
+        self.assertEqual("2016-01-20", host1_row.usage_date)
+        self.assertEqual("16", host1_row.usage_hour)
@@ -0,0 +1,120 @@
+# Copyright 2016 Hewlett Packard Enterprise Development Company LP
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+import json
+import unittest
+
+from pyspark.sql import SQLContext
+
+from monasca_transform.component.usage.fetch_quantity import FetchQuantity
+from monasca_transform.config.config_initializer import ConfigInitializer
+from monasca_transform.data_driven_specs.transform_spec \
+    import TransformSpecCompiler
+from monasca_transform.transform.dimension_encoding \
+    import DimensionDictionary
+from monasca_transform.transform.dimension_encoding \
+    import DimensionEncodingUtils
+from monasca_transform.transform import TransformContextUtils
+from monasca_transform.transform.transform_utils import RecordStoreUtils
+
+from tests.unit.spark_context_test import SparkContextTest
+from tests.unit.test_resources.mem_total_all.data_provider import DataProvider
+
+
+class DimensionDictionaryTest(unittest.TestCase):
+
+    def test_codes_are_kept_across_batches(self):
+        dimension_dictionary = DimensionDictionary(10)
+        first_codes = dimension_dictionary.update(["host1", "tenant1"])
+        second_codes = dimension_dictionary.update(["tenant1", "host2"])
+
+        self.assertEqual(first_codes["tenant1"], second_codes["tenant1"])
+        self.assertEqual(3, len(set(first_codes.values()) |
+                                set(second_codes.values())))
+
+    def test_least_recently_seen_values_are_evicted(self):
+        dimension_dictionary = DimensionDictionary(3)
+        dimension_dictionary.update(["a", "b"])
+        dimension_dictionary.update(["b", "c"])
+        codes = dimension_dictionary.update(["c", "d"])
+
+        # "a" was seen least recently, values of the batch are kept
+        self.assertEqual(3, len(dimension_dictionary.codes))
+        self.assertNotIn("a", dimension_dictionary.codes)
+        self.assertEqual(codes["d"], dimension_dictionary.codes["d"])
+
+        # a code is not given to another value after eviction
+        codes = dimension_dictionary.update(["a"])
+        self.assertEqual(4, codes["a"])
+
+
+class DimensionEncodingUtilsTest(SparkContextTest):
+
+    def setUp(self):
+        super(DimensionEncodingUtilsTest, self).setUp()
+        ConfigInitializer.basic_config(
+            default_config_files=[
+                'tests/unit/test_resources/config/'
+                'test_config_with_dummy_messaging_adapter.conf'])
+        self.sql_context = SQLContext.getOrCreate(self.spark_context)
+
+    @staticmethod
+    def _get_transform_context(usage_fetch_operation,
+                               aggregation_group_by_list):
+        with open(DataProvider.transform_spec_path) as transform_spec_file:
+            transform_spec_dict = json.loads(transform_spec_file.read())
+        agg_params = transform_spec_dict["aggregation_params_map"]
+        agg_params["usage_fetch_operation"] = usage_fetch_operation
+        agg_params["aggregation_group_by_list"] = aggregation_group_by_list
+        return TransformContextUtils.get_context(
+            transform_spec_info=TransformSpecCompiler.compile_transform_spec(
+                transform_spec_dict))
+
+    def _assert_round_trip(self, usage_fetch_operation,
+                           aggregation_group_by_list):
+        record_store_df = RecordStoreUtils.create_df_from_json(
+            self.sql_context, DataProvider.record_store_path)
+        transform_context = self._get_transform_context(
+            usage_fetch_operation, aggregation_group_by_list)
+
+        expected_rows = FetchQuantity.usage(
+            transform_context, record_store_df).collect()
+
+        (encoded_record_store_df,
+         dimension_encoding) = DimensionEncodingUtils.encode_record_store(
+            self.sql_context, record_store_df, DimensionDictionary(100),
+            ["tenant_id", "host", "metric_id"])
+
+        # metric_id selects the records of a spec and is never encoded
+        self.assertEqual(["tenant_id", "host"],
+                         dimension_encoding.encoded_columns)
+        self.assertEqual(record_store_df.count(),
+                         encoded_record_store_df.count())
+        encoded_hosts = set(
+            row.host for row in encoded_record_store_df.collect())
+        self.assertNotIn("devstack", encoded_hosts)
+
+        decoded_df = DimensionEncodingUtils.decode_instance_usage(
+            dimension_encoding,
+            FetchQuantity.usage(transform_context, encoded_record_store_df))
+
+        self.assertEqual(expected_rows[0].__fields__,
+                         decoded_df.columns)
+        self.assertItemsEqual(expected_rows, decoded_df.collect())
+
+    def test_round_trip_latest_by_host(self):
+        self._assert_round_trip("latest", ["host", "metric_id"])
+
+    def test_round_trip_sum_by_host_and_tenant(self):
+        # project_id is reported from tenant_id and is decoded as well
+        self._assert_round_trip("sum", ["host", "tenant_id", "metric_id"])
@@ -0,0 +1,48 @@
+# Copyright 2016 Hewlett Packard Enterprise Development Company LP
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+import unittest
+
+from monasca_transform.offset_recovery import OffsetRecovery
+
+
+class OffsetRecoveryTest(unittest.TestCase):
+
+    def test_in_range_latest_revision_is_kept(self):
+        (chosen_offsets,
+         changed_partitions) = OffsetRecovery.choose_offsets(
+            {0: (100, 500), 1: (0, 50)},
+            {0: [400, 300], 1: [50]})
+
+        self.assertEqual({0: 400, 1: 50}, chosen_offsets)
+        self.assertEqual({}, changed_partitions)
+
+    def test_out_of_range_partition_falls_back_to_older_revision(self):
+        (chosen_offsets,
+         changed_partitions) = OffsetRecovery.choose_offsets(
+            {0: (100, 500), 1: (0, 50)},
+            {0: [600, 90, 200, 150], 1: [40]})
+
+        # only the out of range partition is changed
+        self.assertEqual({0: 200, 1: 40}, chosen_offsets)
+        self.assertEqual({0: 200}, changed_partitions)
+
+    def test_offsets_without_in_range_revision_are_clamped(self):
+        (chosen_offsets,
+         changed_partitions) = OffsetRecovery.choose_offsets(
+            {0: (100, 500), 1: (0, 50), 2: (10, 20)},
+            {0: [50, 20], 1: [70]})
+
+        # partition 2 has no saved offset and starts at the earliest
+        self.assertEqual({0: 100, 1: 50, 2: 10}, chosen_offsets)
+        self.assertEqual(chosen_offsets, changed_partitions)
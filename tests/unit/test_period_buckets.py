@@ -0,0 +1,137 @@
+# Copyright 2016 Hewlett Packard Enterprise Development Company LP
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+import datetime
+import time
+
+from pyspark.sql import Row
+from pyspark.sql import SQLContext
+
+from monasca_transform.component.component_utils import ComponentUtils
+from monasca_transform.transform.transform_utils import RecordStoreUtils
+
+from tests.unit.spark_context_test import SparkContextTest
+
+
+class PeriodBucketsTest(SparkContextTest):
+
+    @staticmethod
+    def _get_local_timestamp(year, month, day, hour, minute, second):
+        """get epoch seconds of a local time"""
+        return time.mktime((year, month, day, hour, minute, second,
+                            0, 0, -1))
+
+    def _get_usage_period_dicts(self, event_timestamp_unix_list):
+        sql_context = SQLContext.getOrCreate(self.spark_context)
+        record_store_df = sql_context.createDataFrame(
+            self.spark_context.parallelize(
+                [Row(event_timestamp_unix=event_timestamp_unix)
+                 for event_timestamp_unix in event_timestamp_unix_list]))
+        bucket_df = record_store_df.select(
+            record_store_df.event_timestamp_unix,
+            *RecordStoreUtils.get_period_bucket_columns(
+                record_store_df.event_timestamp_unix,
+                RecordStoreUtils.get_utc_offset(
+                    event_timestamp_unix_list[0])))
+
+        usage_period_dicts = {}
+        for row in bucket_df.collect():
+            row_dict = row.asDict()
+            usage_period_dicts[row.event_timestamp_unix] = dict(
+                (aggregation_period, ComponentUtils._get_usage_period_dict(
+                    dict((group_by_column, row_dict[group_by_column])
+                         for group_by_column in
+                         ComponentUtils._get_group_by_period_list(
+                             aggregation_period))))
+                for aggregation_period in ["daily", "hourly", "minutely"])
+        return usage_period_dicts
+
+    def test_usage_period_of_local_time(self):
+        before_midnight = self._get_local_timestamp(2016, 1, 20, 23, 45, 30)
+        after_midnight = self._get_local_timestamp(2016, 1, 21, 0, 15, 10)
+
+        usage_period_dicts = self._get_usage_period_dicts(
+            [before_midnight, after_midnight])
+
+        # periods are labelled with the local date and time of the event
+        self.assertEqual(
+            {"usage_date": "2016-01-20", "usage_hour": "NA",
+             "usage_minute": "NA"},
+            usage_period_dicts[before_midnight]["daily"])
+        self.assertEqual(
+            {"usage_date": "2016-01-20", "usage_hour": "23",
+             "usage_minute": "NA"},
+            usage_period_dicts[before_midnight]["hourly"])
+        self.assertEqual(
+            {"usage_date": "2016-01-20", "usage_hour": "23",
+             "usage_minute": "45"},
+            usage_period_dicts[before_midnight]["minutely"])
+
+        self.assertEqual("2016-01-21",
+                         usage_period_dicts[after_midnight]["daily"][
+                             "usage_date"])
+        self.assertEqual(
+            {"usage_date": "2016-01-21", "usage_hour": "00",
+             "usage_minute": "NA"},
+            usage_period_dicts[after_midnight]["hourly"])
+
+    def test_buckets_are_local_period_starts(self):
+        event_timestamp_unix = self._get_local_timestamp(2016, 1, 20, 23, 45,
+                                                         30)
+        sql_context = SQLContext.getOrCreate(self.spark_context)
+        record_store_df = sql_context.createDataFrame(
+            self.spark_context.parallelize(
+                [Row(event_timestamp_unix=event_timestamp_unix)]))
+        row = record_store_df.select(
+            *RecordStoreUtils.get_period_bucket_columns(
+                record_store_df.event_timestamp_unix,
+                RecordStoreUtils.get_utc_offset(
+                    event_timestamp_unix))).first()
+
+        self.assertEqual(
+            self._get_local_timestamp(2016, 1, 20, 0, 0, 0),
+            row.event_day_bucket)
+        self.assertEqual(
+            self._get_local_timestamp(2016, 1, 20, 23, 0, 0),
+            row.event_hour_bucket)
+        self.assertEqual(
+            self._get_local_timestamp(2016, 1, 20, 23, 45, 0),
+            row.event_minute_bucket)
+        self.assertEqual(event_timestamp_unix, row.event_second_bucket)
+
+    def test_buckets_with_utc_offset(self):
+        # 2016-01-20 23:45:30 UTC is 2016-01-21 05:15:30 at +05:30
+        event_timestamp_unix = 1453333530.0
+        sql_context = SQLContext.getOrCreate(self.spark_context)
+        record_store_df = sql_context.createDataFrame(
+            self.spark_context.parallelize(
+                [Row(event_timestamp_unix=event_timestamp_unix)]))
+        row = record_store_df.select(
+            *RecordStoreUtils.get_period_bucket_columns(
+                record_store_df.event_timestamp_unix, 19800)).first()
+
+        # 2016-01-21 00:00:00 and 05:00:00 at +05:30
+        self.assertEqual(1453314600, row.event_day_bucket)
+        self.assertEqual(1453332600, row.event_hour_bucket)
+        self.assertEqual(1453333500, row.event_minute_bucket)
+        self.assertEqual(1453333530, row.event_second_bucket)
+
+    def test_utc_offset(self):
+        event_timestamp_unix = self._get_local_timestamp(2016, 1, 20, 23, 45,
+                                                         30)
+        utc_offset = (
+            datetime.datetime.fromtimestamp(event_timestamp_unix) -
+            datetime.datetime.utcfromtimestamp(event_timestamp_unix))
+        self.assertEqual(
+            utc_offset.days * 86400 + utc_offset.seconds,
+            RecordStoreUtils.get_utc_offset(event_timestamp_unix))
@@ -0,0 +1,74 @@
+# Copyright 2016 Hewlett Packard Enterprise Development Company LP
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+import unittest
+
+from pyspark.sql import SQLContext
+
+from monasca_transform.transform.shuffle_utils import ShuffleUtils
+
+from tests.unit.spark_context_test import SparkContextTest
+
+
+class ShuffleUtilsTest(unittest.TestCase):
+
+    def test_partitions_for_target_rows(self):
+        self.assertEqual(
+            4, ShuffleUtils.get_shuffle_partitions(200000, 50000, 1, 200))
+        # a partial partition gets a partition of its own
+        self.assertEqual(
+            5, ShuffleUtils.get_shuffle_partitions(200001, 50000, 1, 200))
+
+    def test_partitions_are_at_least_min(self):
+        self.assertEqual(
+            1, ShuffleUtils.get_shuffle_partitions(0, 50000, 1, 200))
+        self.assertEqual(
+            8, ShuffleUtils.get_shuffle_partitions(100, 50000, 8, 200))
+
+    def test_partitions_are_at_most_max(self):
+        self.assertEqual(
+            200, ShuffleUtils.get_shuffle_partitions(10 ** 9, 50000, 1,
+                                                     200))
+        self.assertEqual(
+            16, ShuffleUtils.get_shuffle_partitions(10 ** 6, 1000, 1, 16))
+
+
+class SetShufflePartitionsTest(SparkContextTest):
+
+    def tearDown(self):
+        # restore the partitions of the unit test spark context
+        SQLContext.getOrCreate(self.spark_context).setConf(
+            ShuffleUtils.SHUFFLE_PARTITIONS_PROPERTY, "10")
+        super(SetShufflePartitionsTest, self).tearDown()
+
+    def test_set_shuffle_partitions(self):
+        sql_context = SQLContext(self.spark_context)
+        ShuffleUtils.set_shuffle_partitions(sql_context, 7)
+
+        for context in [sql_context,
+                        SQLContext.getOrCreate(self.spark_context)]:
+            self.assertEqual(
+                "7", context.getConf(
+                    ShuffleUtils.SHUFFLE_PARTITIONS_PROPERTY))
+
+    def test_reset_shuffle_partitions(self):
+        sql_context = SQLContext(self.spark_context)
+        ShuffleUtils.set_shuffle_partitions(sql_context, 7)
+        ShuffleUtils.reset_shuffle_partitions(sql_context)
+
+        # the unit test spark context is configured with 10 partitions
+        for context in [sql_context,
+                        SQLContext.getOrCreate(self.spark_context)]:
+            self.assertEqual(
+                "10", context.getConf(
+                    ShuffleUtils.SHUFFLE_PARTITIONS_PROPERTY))
@@ -21,7 +21,6 @@ from pyspark.streaming.kafka import OffsetRange
 from monasca_transform.config.config_initializer import ConfigInitializer
 from monasca_transform.driver.mon_metrics_kafka \
     import MonMetricsKafkaProcessor
-from monasca_transform.transform import RddTransformContext
 from monasca_transform.transform import TransformContextUtils
 
 from tests.unit.messaging.adapter import DummyAdapter
@@ -141,12 +140,9 @@ class TestFetchQuantityAgg(SparkContextTest):
             offset_info=myOffsetRanges,
             batch_time_info=self.get_dummy_batch_time())
 
-        rdd_monasca_with_offsets = rdd_monasca.map(
-            lambda x: RddTransformContext(x, transform_context))
-
         # Call the primary method in mon_metrics_kafka
         MonMetricsKafkaProcessor.rdd_to_recordstore(
-            rdd_monasca_with_offsets)
+            rdd_monasca, transform_context)
 
         # get the metrics that have been submitted to the dummy message adapter
         metrics = DummyAdapter.adapter_impl.metric_list
@@ -249,12 +245,9 @@ class TestFetchQuantityAgg(SparkContextTest):
             offset_info=myOffsetRanges,
             batch_time_info=self.get_dummy_batch_time())
 
-        rdd_monasca_with_offsets = rdd_monasca.map(
-            lambda x: RddTransformContext(x, transform_context))
-
         # Call the primary method in mon_metrics_kafka
         MonMetricsKafkaProcessor.rdd_to_recordstore(
-            rdd_monasca_with_offsets)
+            rdd_monasca, transform_context)
 
         # get the metrics that have been submitted to the dummy message adapter
         metrics = DummyAdapter.adapter_impl.metric_list
@@ -355,12 +348,9 @@ class TestFetchQuantityAgg(SparkContextTest):
         transform_context = TransformContextUtils.get_context(
             offset_info=myOffsetRanges,
             batch_time_info=self.get_dummy_batch_time())
-        rdd_monasca_with_offsets = rdd_monasca.map(
-            lambda x: RddTransformContext(x, transform_context))
-
         # Call the primary method in mon_metrics_kafka
         MonMetricsKafkaProcessor.rdd_to_recordstore(
-            rdd_monasca_with_offsets)
+            rdd_monasca, transform_context)
 
         # get the metrics that have been submitted to the dummy message adapter
         metrics = DummyAdapter.adapter_impl.metric_list
@@ -462,12 +452,9 @@ class TestFetchQuantityAgg(SparkContextTest):
             offset_info=myOffsetRanges,
             batch_time_info=self.get_dummy_batch_time())
 
-        rdd_monasca_with_offsets = rdd_monasca.map(
-            lambda x: RddTransformContext(x, transform_context))
-
         # Call the primary method in mon_metrics_kafka
         MonMetricsKafkaProcessor.rdd_to_recordstore(
-            rdd_monasca_with_offsets)
+            rdd_monasca, transform_context)
 
         # get the metrics that have been submitted to the dummy message adapter
         metrics = DummyAdapter.adapter_impl.metric_list
@@ -569,12 +556,9 @@ class TestFetchQuantityAgg(SparkContextTest):
             offset_info=myOffsetRanges,
             batch_time_info=self.get_dummy_batch_time())
 
-        rdd_monasca_with_offsets = rdd_monasca.map(
-            lambda x: RddTransformContext(x, transform_context))
-
         # Call the primary method in mon_metrics_kafka
         MonMetricsKafkaProcessor.rdd_to_recordstore(
-            rdd_monasca_with_offsets)
+            rdd_monasca, transform_context)
 
         # get the metrics that have been submitted to the dummy message adapter
         metrics = DummyAdapter.adapter_impl.metric_list
@@ -676,12 +660,9 @@ class TestFetchQuantityAgg(SparkContextTest):
             offset_info=myOffsetRanges,
             batch_time_info=self.get_dummy_batch_time())
 
-        rdd_monasca_with_offsets = rdd_monasca.map(
-            lambda x: RddTransformContext(x, transform_context))
-
         # Call the primary method in mon_metrics_kafka
         MonMetricsKafkaProcessor.rdd_to_recordstore(
-            rdd_monasca_with_offsets)
+            rdd_monasca, transform_context)
 
         # get the metrics that have been submitted to the dummy message adapter
         metrics = DummyAdapter.adapter_impl.metric_list
@@ -25,7 +25,6 @@ from monasca_transform.config.config_initializer import ConfigInitializer
 from monasca_transform.driver.mon_metrics_kafka \
     import MonMetricsKafkaProcessor
 
-from monasca_transform.transform import RddTransformContext
 from monasca_transform.transform import TransformContextUtils
 
 from tests.unit.messaging.adapter import DummyAdapter
@@ -166,12 +165,9 @@ class TestFetchQuantityUtilAgg(SparkContextTest):
             offset_info=myOffsetRanges,
             batch_time_info=self.get_dummy_batch_time())
 
-        rdd_monasca_with_offsets = rdd_monasca.map(
-            lambda x: RddTransformContext(x, transform_context))
-
         # Call the primary method in mon_metrics_kafka
         MonMetricsKafkaProcessor.rdd_to_recordstore(
-            rdd_monasca_with_offsets)
+            rdd_monasca, transform_context)
 
         # get the metrics that have been submitted to the dummy message adapter
         metrics = DummyAdapter.adapter_impl.metric_list
@@ -269,12 +265,9 @@ class TestFetchQuantityUtilAgg(SparkContextTest):
             offset_info=myOffsetRanges,
             batch_time_info=self.get_dummy_batch_time())
 
-        rdd_monasca_with_offsets = rdd_monasca.map(
-            lambda x: RddTransformContext(x, transform_context))
-
         # Call the primary method in mon_metrics_kafka
         MonMetricsKafkaProcessor.rdd_to_recordstore(
-            rdd_monasca_with_offsets)
+            rdd_monasca, transform_context)
 
         # get the metrics that have been submitted to the dummy message adapter
         metrics = DummyAdapter.adapter_impl.metric_list
@@ -372,12 +365,9 @@ class TestFetchQuantityUtilAgg(SparkContextTest):
             offset_info=myOffsetRanges,
             batch_time_info=self.get_dummy_batch_time())
 
-        rdd_monasca_with_offsets = rdd_monasca.map(
-            lambda x: RddTransformContext(x, transform_context))
-
         # Call the primary method in mon_metrics_kafka
         MonMetricsKafkaProcessor.rdd_to_recordstore(
-            rdd_monasca_with_offsets)
+            rdd_monasca, transform_context)
 
         # get the metrics that have been submitted to the dummy message adapter
         metrics = DummyAdapter.adapter_impl.metric_list
@@ -475,13 +465,10 @@ class TestFetchQuantityUtilAgg(SparkContextTest):
             offset_info=myOffsetRanges,
             batch_time_info=self.get_dummy_batch_time())
 
-        rdd_monasca_with_offsets = rdd_monasca.map(
-            lambda x: RddTransformContext(x, transform_context))
-
         try:
             # Call the primary method in mon_metrics_kafka
             MonMetricsKafkaProcessor.rdd_to_recordstore(
-                rdd_monasca_with_offsets)
+                rdd_monasca, transform_context)
             self.assertTrue(False)
         except FetchQuantityUtilException as e:
             self.assertTrue("Operation max is not supported" in
@@ -539,13 +526,10 @@ class TestFetchQuantityUtilAgg(SparkContextTest):
             offset_info=myOffsetRanges,
             batch_time_info=self.get_dummy_batch_time())
 
-        rdd_monasca_with_offsets = rdd_monasca.map(
-            lambda x: RddTransformContext(x, transform_context))
-
         try:
             # Call the primary method in mon_metrics_kafka
             MonMetricsKafkaProcessor.rdd_to_recordstore(
-                rdd_monasca_with_offsets)
+                rdd_monasca, transform_context)
             self.assertTrue(False)
         except FetchQuantityUtilException as e:
             self.assertTrue("Operation min is not supported" in
@@ -603,13 +587,10 @@ class TestFetchQuantityUtilAgg(SparkContextTest):
             offset_info=myOffsetRanges,
             batch_time_info=self.get_dummy_batch_time())
 
-        rdd_monasca_with_offsets = rdd_monasca.map(
-            lambda x: RddTransformContext(x, transform_context))
-
         try:
             # Call the primary method in mon_metrics_kafka
             MonMetricsKafkaProcessor.rdd_to_recordstore(
-                rdd_monasca_with_offsets)
+                rdd_monasca, transform_context)
             self.assertTrue(False)
         except FetchQuantityUtilException as e:
             self.assertTrue("Operation sum is not supported" in
@@ -0,0 +1,93 @@
+# Copyright 2016 Hewlett Packard Enterprise Development Company LP
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+from pyspark.sql import Row
+from pyspark.sql import SQLContext
+
+from monasca_transform.transform.grouping.group_first_last_by_timestamp \
+    import GroupFirstLastByTimestamp
+from monasca_transform.transform.grouping.group_sort_by_timestamp \
+    import GroupSortbyTimestamp
+
+from tests.unit.spark_context_test import SparkContextTest
+
+
+class TestGroupFirstLastByTimestamp(SparkContextTest):
+
+    def get_record_store_df(self):
+        """get record store with a group of several out of order records,
+        a group with records of equal timestamps and a group with a
+        single record. A single partition keeps the order of records with
+        equal timestamps the same for both groupings.
+        """
+        records = [
+            Row(host="host1", event_timestamp_unix=1453308300.0,
+                event_quantity=3.0),
+            Row(host="host1", event_timestamp_unix=1453308000.0,
+                event_quantity=1.0),
+            Row(host="host1", event_timestamp_unix=1453308600.0,
+                event_quantity=5.0),
+            Row(host="host1", event_timestamp_unix=1453308120.0,
+                event_quantity=2.0),
+            Row(host="host2", event_timestamp_unix=1453308000.0,
+                event_quantity=10.0),
+            Row(host="host2", event_timestamp_unix=1453308000.0,
+                event_quantity=20.0),
+            Row(host="host2", event_timestamp_unix=1453308000.0,
+                event_quantity=30.0),
+            Row(host="host3", event_timestamp_unix=1453308240.0,
+                event_quantity=7.0)]
+        sql_context = SQLContext.getOrCreate(self.spark_context)
+        return sql_context.createDataFrame(
+            self.spark_context.parallelize(records, 1))
+
+    @staticmethod
+    def _get_results_by_key(grouped_rdd):
+        return dict((grouping_results.grouping_key, grouping_results.results)
+                    for grouping_results in grouped_rdd.collect())
+
+    def test_first_last_matches_group_sort_by_timestamp(self):
+        record_store_df = self.get_record_store_df()
+
+        combined_results = self._get_results_by_key(
+            GroupFirstLastByTimestamp.fetch_group_latest_oldest_quantity(
+                record_store_df, None, ["host"]))
+        sorted_results = self._get_results_by_key(
+            GroupSortbyTimestamp.fetch_group_latest_oldest_quantity(
+                record_store_df, None, ["host"]))
+
+        self.assertEqual(sorted_results, combined_results)
+        self.assertEqual(3, len(combined_results))
+
+        host1_results = combined_results[("host1",)]
+        self.assertEqual(1453308000.0,
+                         host1_results["firstrecord_timestamp_unix"])
+        self.assertEqual(1.0, host1_results["firstrecord_quantity"])
+        self.assertEqual(1453308600.0,
+                         host1_results["lastrecord_timestamp_unix"])
+        self.assertEqual(5.0, host1_results["lastrecord_quantity"])
+        self.assertEqual(4.0, host1_results["record_count"])
+
+        # with equal timestamps the first record seen is first and the
+        # last record seen is last
+        host2_results = combined_results[("host2",)]
+        self.assertEqual(10.0, host2_results["firstrecord_quantity"])
+        self.assertEqual(30.0, host2_results["lastrecord_quantity"])
+        self.assertEqual(3.0, host2_results["record_count"])
+
+        host3_results = combined_results[("host3",)]
+        self.assertEqual(host3_results["firstrecord_timestamp_string"],
+                         host3_results["lastrecord_timestamp_string"])
+        self.assertEqual(7.0, host3_results["firstrecord_quantity"])
+        self.assertEqual(7.0, host3_results["lastrecord_quantity"])
+        self.assertEqual(1.0, host3_results["record_count"])
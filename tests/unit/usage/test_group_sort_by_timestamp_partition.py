@@ -0,0 +1,90 @@
+# Copyright 2016 Hewlett Packard Enterprise Development Company LP
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+import random
+
+from pyspark.sql import Row
+from pyspark.sql import SQLContext
+
+from monasca_transform.transform.grouping.group_sort_by_timestamp_partition \
+    import GroupSortbyTimestampPartition
+
+from tests.unit.spark_context_test import SparkContextTest
+
+
+class TestGroupSortbyTimestampPartition(SparkContextTest):
+
+    def get_skewed_record_store_df(self):
+        """get record store where host1 holds most of the records, in
+        random timestamp order over several partitions
+        """
+        records = [Row(host="host1", event_timestamp_unix=1453308000.0 + i,
+                       event_quantity=float(i))
+                   for i in range(200)]
+        records.extend(
+            [Row(host="host%s" % host, event_timestamp_unix=1453308000.0 + i,
+                 event_quantity=float(host * 10 + i))
+             for host in range(2, 6) for i in range(2)])
+        random.Random(5).shuffle(records)
+        sql_context = SQLContext.getOrCreate(self.spark_context)
+        return sql_context.createDataFrame(
+            self.spark_context.parallelize(records, 4))
+
+    @staticmethod
+    def _get_results_by_key(grouped_rdd):
+        results_by_key = {}
+        for grouping_results in grouped_rdd.collect():
+            # each group has a single result
+            assert grouping_results.grouping_key not in results_by_key
+            results_by_key[grouping_results.grouping_key] = \
+                grouping_results.results
+        return results_by_key
+
+    def test_get_hot_keys(self):
+        record_store_df = self.get_skewed_record_store_df()
+        hot_keys = GroupSortbyTimestampPartition.get_hot_keys(
+            record_store_df, ["host"], 4, 1.0, 2.0, 10)
+        self.assertEqual(set([("host1",)]), hot_keys)
+
+        # too few sampled records to find hot keys
+        hot_keys = GroupSortbyTimestampPartition.get_hot_keys(
+            record_store_df, ["host"], 4, 1.0, 2.0, 1000)
+        self.assertEqual(set(), hot_keys)
+
+    def test_salted_grouping_matches_unsalted(self):
+        record_store_df = self.get_skewed_record_store_df()
+
+        unsalted_results = self._get_results_by_key(
+            GroupSortbyTimestampPartition.fetch_group_first_last_quantity(
+                record_store_df, None, ["host"], 4))
+        salted_results = self._get_results_by_key(
+            GroupSortbyTimestampPartition.fetch_group_first_last_quantity(
+                record_store_df, None, ["host"], 4,
+                hot_keys=set([("host1",)]), salt_count=4))
+
+        self.assertEqual(unsalted_results, salted_results)
+        self.assertEqual(5, len(salted_results))
+
+        host1_results = salted_results[("host1",)]
+        self.assertEqual(1453308000.0,
+                         host1_results["firstrecord_timestamp_unix"])
+        self.assertEqual(0.0, host1_results["firstrecord_quantity"])
+        self.assertEqual(1453308199.0,
+                         host1_results["lastrecord_timestamp_unix"])
+        self.assertEqual(199.0, host1_results["lastrecord_quantity"])
+        self.assertEqual(200.0, host1_results["record_count"])
+
+        host2_results = salted_results[("host2",)]
+        self.assertEqual(20.0, host2_results["firstrecord_quantity"])
+        self.assertEqual(21.0, host2_results["lastrecord_quantity"])
+        self.assertEqual(2.0, host2_results["record_count"])
@@ -0,0 +1,175 @@
+# Copyright 2016 Hewlett Packard Enterprise Development Company LP
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+import unittest
+
+from oslo_config import cfg
+from pyspark.sql import Row
+from pyspark.sql import SQLContext
+
+from monasca_transform.config.config_initializer import ConfigInitializer
+from monasca_transform.messaging.adapter import KafkaMessageAdapter
+from monasca_transform.transform.grouping.grouping_engine \
+    import GroupingEngine
+
+from tests.unit.spark_context_test import SparkContextTest
+
+
+class GroupingEngineTest(unittest.TestCase):
+
+    def setUp(self):
+        ConfigInitializer.basic_config(
+            default_config_files=[
+                'tests/unit/test_resources/config/'
+                'test_config_with_dummy_messaging_adapter.conf'])
+        cfg.CONF.set_override('grouping_engine', GroupingEngine.ADAPTIVE,
+                              group='service')
+
+    def tearDown(self):
+        cfg.CONF.clear_override('grouping_engine', group='service')
+
+    def test_combiner_is_the_default(self):
+        cfg.CONF.clear_override('grouping_engine', group='service')
+        choice = GroupingEngine.choose(100, 110)
+        self.assertEqual(GroupingEngine.COMBINER, choice.engine)
+
+    def test_combiner_for_groups_with_many_records(self):
+        choice = GroupingEngine.choose(10, 1000)
+        self.assertEqual(GroupingEngine.COMBINER, choice.engine)
+        self.assertIsNone(choice.num_partitions)
+
+    def test_group_by_key_for_few_groups_with_single_records(self):
+        choice = GroupingEngine.choose(100, 110)
+        self.assertEqual(GroupingEngine.GROUP_BY_KEY, choice.engine)
+
+    def test_repartition_sort_partitions_from_estimate(self):
+        choice = GroupingEngine.choose(25000, 26000)
+        self.assertEqual(GroupingEngine.REPARTITION_SORT, choice.engine)
+        self.assertEqual(25, choice.num_partitions)
+
+        choice = GroupingEngine.choose(10000000, 10000000)
+        self.assertEqual(cfg.CONF.service.grouping_max_partitions,
+                         choice.num_partitions)
+
+    def test_configured_engine(self):
+        cfg.CONF.set_override('grouping_engine',
+                              GroupingEngine.GROUP_BY_KEY,
+                              group='service')
+        choice = GroupingEngine.choose(10, 1000)
+        self.assertEqual(GroupingEngine.GROUP_BY_KEY, choice.engine)
+
+
+class GroupingEngineSelectTest(SparkContextTest):
+
+    def setUp(self):
+        super(GroupingEngineSelectTest, self).setUp()
+        ConfigInitializer.basic_config(
+            default_config_files=[
+                'tests/unit/test_resources/config/'
+                'test_config_with_dummy_messaging_adapter.conf'])
+        self.sql_context = SQLContext.getOrCreate(self.spark_context)
+
+    def tearDown(self):
+        super(GroupingEngineSelectTest, self).tearDown()
+        for name in ['grouping_engine', 'grouping_group_by_key_max_groups',
+                     'grouping_groups_per_partition',
+                     'publish_grouping_engine_metrics']:
+            cfg.CONF.clear_override(name, group='service')
+
+    def _get_record_store_df(self, group_count, records_per_group):
+        records = [Row(host="host%s" % group,
+                       event_timestamp_unix=1453308000.0 + 60 * record,
+                       event_quantity=float(group * 100 + record))
+                   for group in range(group_count)
+                   for record in range(records_per_group)]
+        return self.sql_context.createDataFrame(
+            self.spark_context.parallelize(records))
+
+    @staticmethod
+    def _get_results_by_key(grouped_rdd):
+        return dict((grouping_results.grouping_key, grouping_results.results)
+                    for grouping_results in grouped_rdd.collect())
+
+    def test_configured_engine_is_not_estimated(self):
+        record_store_df = self._get_record_store_df(3, 2)
+        choice = GroupingEngine.select(record_store_df, ["host"],
+                                       "mem_total_all")
+        self.assertEqual(GroupingEngine.COMBINER, choice.engine)
+        self.assertIsNone(choice.estimated_groups)
+        self.assertIsNone(choice.record_count)
+
+    def test_adaptive_select(self):
+        cfg.CONF.set_override('grouping_engine', GroupingEngine.ADAPTIVE,
+                              group='service')
+        cfg.CONF.set_override('grouping_group_by_key_max_groups', 5,
+                              group='service')
+        cfg.CONF.set_override('grouping_groups_per_partition', 4,
+                              group='service')
+
+        choice = GroupingEngine.select(self._get_record_store_df(3, 4),
+                                       ["host"], "mem_total_all")
+        self.assertEqual(GroupingEngine.COMBINER, choice.engine)
+        self.assertEqual(3, choice.estimated_groups)
+        self.assertEqual(12, choice.record_count)
+
+        choice = GroupingEngine.select(self._get_record_store_df(3, 1),
+                                       ["host"], "mem_total_all")
+        self.assertEqual(GroupingEngine.GROUP_BY_KEY, choice.engine)
+
+        choice = GroupingEngine.select(self._get_record_store_df(10, 1),
+                                       ["host"], "mem_total_all")
+        self.assertEqual(GroupingEngine.REPARTITION_SORT, choice.engine)
+        self.assertEqual(3, choice.num_partitions)
+
+    def test_adaptive_select_publishes_choice(self):
+        cfg.CONF.set_override('grouping_engine', GroupingEngine.ADAPTIVE,
+                              group='service')
+        cfg.CONF.set_override('publish_grouping_engine_metrics', True,
+                              group='service')
+        KafkaMessageAdapter.init()
+        KafkaMessageAdapter.adapter_impl.metric_list = []
+
+        GroupingEngine.select(self._get_record_store_df(3, 4), ["host"],
+                              "mem_total_all")
+
+        metrics = KafkaMessageAdapter.adapter_impl.metric_list
+        self.assertEqual(1, len(metrics))
+        self.assertEqual(GroupingEngine.METRIC_NAME,
+                         metrics[0]["metric"]["name"])
+        self.assertEqual({"metric_id": "mem_total_all",
+                          "engine": GroupingEngine.COMBINER},
+                         metrics[0]["metric"]["dimensions"])
+        self.assertEqual(3.0, metrics[0]["metric"]["value"])
+
+    def test_engines_give_the_same_results(self):
+        record_store_df = self._get_record_store_df(6, 3)
+
+        results_by_engine = {}
+        for engine in [GroupingEngine.COMBINER,
+                       GroupingEngine.GROUP_BY_KEY,
+                       GroupingEngine.REPARTITION_SORT,
+                       GroupingEngine.ADAPTIVE]:
+            cfg.CONF.set_override('grouping_engine', engine,
+                                  group='service')
+            results_by_engine[engine] = self._get_results_by_key(
+                GroupingEngine.fetch_group_latest_oldest_quantity(
+                    record_store_df, ["host"], "mem_total_all"))
+
+        combiner_results = results_by_engine[GroupingEngine.COMBINER]
+        self.assertEqual(6, len(combiner_results))
+        host1_results = combiner_results[("host1",)]
+        self.assertEqual(100.0, host1_results["firstrecord_quantity"])
+        self.assertEqual(102.0, host1_results["lastrecord_quantity"])
+        self.assertEqual(3.0, host1_results["record_count"])
+        for engine, results in results_by_engine.items():
+            self.assertEqual(combiner_results, results, engine)
@@ -11,10 +11,14 @@
 # WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
 # License for the specific language governing permissions and limitations
 # under the License.
+import json
+
 from pyspark.sql import SQLContext
 
 from monasca_transform.component.usage.fetch_quantity \
     import FetchQuantity
+from monasca_transform.data_driven_specs.transform_spec \
+    import TransformSpecCompiler
 from monasca_transform.transform.transform_utils import RecordStoreUtils
 from monasca_transform.transform.transform_utils import TransformSpecsUtils
 from monasca_transform.transform import TransformContextUtils
@@ -55,3 +59,76 @@ class UsageComponentTest(SparkContextTest):
             ('2016-02-08', '18', 'NA', 'devstack', 6977.0)]
 
         self.assertItemsEqual(result_list, expected_result)
+
+    @staticmethod
+    def _get_transform_context(usage_fetch_operation, pre_hourly_operation):
+        with open(DataProvider.transform_spec_path) as transform_spec_file:
+            transform_spec_dict = json.loads(transform_spec_file.read())
+        agg_params = transform_spec_dict["aggregation_params_map"]
+        agg_params["usage_fetch_operation"] = usage_fetch_operation
+        agg_params["pre_hourly_operation"] = pre_hourly_operation
+        return TransformContextUtils.get_context(
+            transform_spec_info=TransformSpecCompiler.compile_transform_spec(
+                transform_spec_dict))
+
+    @staticmethod
+    def _get_host_quantities():
+        host_quantities = {}
+        with open(DataProvider.record_store_path) as record_store_file:
+            for line in record_store_file:
+                record = json.loads(line)
+                host_quantities.setdefault(record["host"], []).append(
+                    record["event_quantity"])
+        return host_quantities
+
+    def test_partial_state_of_matching_pre_hourly_operation(self):
+
+        record_store_df = RecordStoreUtils.create_df_from_json(
+            self.sql_context,
+            DataProvider.record_store_path)
+
+        for operation in ["sum", "max", "min", "avg"]:
+            instance_usage_df = FetchQuantity.usage(
+                self._get_transform_context(operation, operation),
+                record_store_df)
+
+            # state of the event quantities of each host
+            host_quantities = self._get_host_quantities()
+            for row in instance_usage_df.collect():
+                quantities = host_quantities[row.host]
+                self.assertAlmostEqual(
+                    sum(quantities),
+                    float(row.processing_meta["quantity_sum"]))
+                self.assertEqual(
+                    len(quantities),
+                    float(row.processing_meta["quantity_count"]))
+                self.assertEqual(
+                    min(quantities),
+                    float(row.processing_meta["quantity_min"]))
+                self.assertEqual(
+                    max(quantities),
+                    float(row.processing_meta["quantity_max"]))
+                self.assertEqual("mem_total_all",
+                                 row.processing_meta["metric_id"])
+
+    def test_no_partial_state_of_other_pre_hourly_operation(self):
+
+        record_store_df = RecordStoreUtils.create_df_from_json(
+            self.sql_context,
+            DataProvider.record_store_path)
+
+        # the state of the event quantities does not describe a pre hourly
+        # avg of sums or sum of maximums
+        for (usage_fetch_operation, pre_hourly_operation) in [
+                ("sum", "avg"), ("max", "sum"), ("avg", None)]:
+            instance_usage_df = FetchQuantity.usage(
+                self._get_transform_context(usage_fetch_operation,
+                                            pre_hourly_operation),
+                record_store_df)
+
+            for row in instance_usage_df.collect():
+                self.assertEqual("mem_total_all",
+                                 row.processing_meta["metric_id"])
+                for state_field in ["quantity_sum", "quantity_count",
+                                    "quantity_min", "quantity_max"]:
+                    self.assertNotIn(state_field, row.processing_meta)
@@ -22,7 +22,6 @@ from monasca_transform.config.config_initializer import ConfigInitializer
 from monasca_transform.driver.mon_metrics_kafka \
     import MonMetricsKafkaProcessor
 
-from monasca_transform.transform import RddTransformContext
 from monasca_transform.transform import TransformContextUtils
 
 from tests.unit.messaging.adapter import DummyAdapter
@@ -135,12 +134,9 @@ class TestVmCpuAllocatedAgg(SparkContextTest):
             offset_info=myOffsetRanges,
             batch_time_info=self.get_dummy_batch_time())
 
-        rdd_monasca_with_offsets = rdd_monasca.map(
-            lambda x: RddTransformContext(x, transform_context))
-
         # Call the primary method in mon_metrics_kafka
         MonMetricsKafkaProcessor.rdd_to_recordstore(
-            rdd_monasca_with_offsets)
+            rdd_monasca, transform_context)
 
         # get the metrics that have been submitted to the dummy message adapter
         metrics = DummyAdapter.adapter_impl.metric_list
@@ -310,12 +306,9 @@ class TestVmCpuAllocatedAgg(SparkContextTest):
             offset_info=myOffsetRanges,
             batch_time_info=self.get_dummy_batch_time())
 
-        rdd_monasca_with_offsets = rdd_monasca.map(
-            lambda x: RddTransformContext(x, transform_context))
-
         # Call the primary method in mon_metrics_kafka
         MonMetricsKafkaProcessor.rdd_to_recordstore(
-            rdd_monasca_with_offsets)
+            rdd_monasca, transform_context)
 
         # get the metrics that have been submitted to the dummy message adapter
         metrics = DummyAdapter.adapter_impl.metric_list